@@ -52,6 +52,33 @@ class CentralServerClient:
         
         return self._make_request('/api/check-fully-covered/', payload)
     
+    def decrypt_comparison(self, rid, comparison, comparison_type):
+        """
+        请求中央服务器解密同态比较结果
+        comparison_type: 'morton' 返回 in_range；'grid' 返回 coverage_type（full/partial/none）；
+        'point' 返回 in_range
+        """
+        payload = {
+            'rid': rid,
+            'type': comparison_type,
+            'comparison': comparison
+        }
+        
+        return self._make_request('/api/decrypt-comparison/', payload)
+    
+    def decrypt_comparison_batch(self, rid, comparisons, comparison_type):
+        """
+        请求中央服务器批量解密同态比较结果
+        返回 {'bitmap': 十六进制字符串}，第i位（字节i//8的第i%8位）为1表示第i个比较结果成立
+        """
+        payload = {
+            'rid': rid,
+            'type': comparison_type,
+            'comparisons': comparisons
+        }
+        
+        return self._make_request('/api/decrypt-comparison-batch/', payload)
+    
     def verify_points_in_range(self, rid, points_data, enc_p_min_x, enc_p_min_y, enc_p_max_x, enc_p_max_y):
         """请求中央服务器解密轨迹点并验证是否在加密的P范围内"""
         payload = {
@@ -145,6 +172,10 @@ class CentralServerClient:
         except requests.exceptions.RequestException as e:
             logger.error(f"与中央服务器通信错误: {str(e)}")
             return {'error': str(e)}
+        except TypeError as e:
+            # 请求体无法序列化为JSON（例如未序列化的密文对象）
+            logger.error(f"请求数据无法序列化: {endpoint}: {str(e)}")
+            return {'error': f'请求数据无法序列化: {str(e)}'}
         except json.JSONDecodeError:
             logger.error(f"解析中央服务器响应失败: {response.text}")
             return {'error': '无效的JSON响应'} 
\ No newline at end of file
@@ -3,10 +3,14 @@ import pickle
 import logging
 import numpy as np
 from django.conf import settings
-from .models import OctreeNode, TrajectoryDate, QueryRequest
+from .models import OctreeNode, TrajectoryDate, QueryRequest, KeywordNodePresence, LEAF_ORDER_BUCKET_SIZE
+from .presence import NodePresenceBitmap
+from .packing import SlotPacker, POINT_FIELDS
 from .homomorphic_crypto import HomomorphicProcessor
 from .central_client import CentralServerClient
+from .octree_version import get_octree_tables, octree_table_names
 from cassandra.cqlengine.connection import get_session
+from cassandra.concurrent import execute_concurrent_with_args
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,8 @@ class MemoryNode:
         self.is_leaf = node.is_leaf
         self.MC = node.MC
         self.GC = node.GC
+        self.first_leaf = getattr(node, 'first_leaf', None)  # 先序叶子区间起点
+        self.last_leaf = getattr(node, 'last_leaf', None)  # 先序叶子区间终点
         self.children = []  # 子节点列表
 
 class SSTPProcessor:
@@ -41,13 +47,16 @@ class SSTPProcessor:
             self.scp = SecureComputationProtocols()
             print("[DEBUG] 安全计算协议初始化成功")
             print(f"[DEBUG] 安全计算协议状态: {self.scp is not None}")
+            # 当前查询读取的八叉树表，每次查询开始时按ActiveOctree指针确定
+            self.octree_table, self.leaf_order_table = octree_table_names(None)
             
             # 验证数据库连接
             print("\n=== 验证数据库连接 ===")
             try:
                 print("[DEBUG] 开始连接Cassandra数据库...")
                 print(f"[DEBUG] 当前数据库配置: {settings.DATABASES['cassandra']}")
-                node_count = OctreeNode.objects.using('cassandra').count()
+                self._resolve_octree_tables()
+                node_count = self._count_octree_nodes()
                 print(f"[DEBUG] 数据库连接成功，当前节点数: {node_count}")
             except Exception as e:
                 print(f"[DEBUG] 数据库连接失败: {str(e)}")
@@ -140,13 +149,18 @@ class SSTPProcessor:
             SNodes = []  # 存活叶节点集合
             CTK = {}  # 候选轨迹结果集
             processed_nodes = set()  # 记录已处理的节点ID
+            presence = self._load_keyword_presence(keyword)  # 关键词节点存在位图，None表示不剪枝
+            self.date_dictionary = None  # 加密日期字典，首次遇到字典编码的行时加载
             print("容器初始化完成")
             
             # 4. 获取根节点开始处理
             print("\n=== 获取八叉树根节点 ===")
             try:
                 print("正在查询数据库获取根节点...")
-                root_node = OctreeNode.objects.filter(parent_id=None).first()
+                # 数据迁移以带版本号的表切换八叉树，整个查询读取同一版本
+                self._resolve_octree_tables()
+                root_nodes = self._query_octree_nodes("node_id = %s", (0,))
+                root_node = root_nodes[0] if root_nodes else None
                 if not root_node:
                     print("错误：未找到八叉树根节点")
                     return {"error": "Octree root node not found"}
@@ -158,8 +172,7 @@ class SSTPProcessor:
             # 获取根节点的8个子节点作为初始L队列
             print("正在获取根节点的子节点...")
             try:
-                # 使用Django ORM查询子节点
-                child_nodes = OctreeNode.objects.filter(parent_id=root_node.node_id)
+                child_nodes = self._query_octree_nodes("parent_id = %s", (root_node.node_id,))
                 if len(child_nodes) != 8:
                     print(f"警告：根节点只有 {len(child_nodes)} 个子节点，而不是预期的8个")
                 L = [MemoryNode(child) for child in child_nodes]
@@ -172,7 +185,7 @@ class SSTPProcessor:
             print("\n=== 开始八叉树遍历 ===")
             try:
                 print("正在统计总节点数...")
-                total_nodes = OctreeNode.objects.count()
+                total_nodes = self._count_octree_nodes()
                 print(f"总节点数: {total_nodes}")
             except Exception as e:
                 print(f"获取总节点数失败: {str(e)}")
@@ -198,6 +211,10 @@ class SSTPProcessor:
                         progress = (processed_count / total_nodes) * 100
                         print(f"已处理: {processed_count}/{total_nodes} 节点 ({progress:.2f}%)")
                     
+                    # 子树中没有该关键词的数据，直接剪枝，省去同态比较和中心服务器往返
+                    if presence is not None and not presence.contains(node.node_id):
+                        continue
+                    
                     # 转换 Morton 码分辨率
                     print(f"转换 Morton 码分辨率...")
                     node_mc = self._convert_morton_resolution(node.MC)
@@ -239,9 +256,12 @@ class SSTPProcessor:
                             'coverage_type': 'unknown'  # 将在后续时空网格比较中确定
                         })
                     else:
+                        # 先判断整棵子树是否被查询范围完全覆盖，是则按叶子区间整段读取
+                        if self._resolve_covered_subtree(node, keyword, CTK, encrypted_query['Grange'], rid, presence):
+                            continue
+                        
                         #print(f"节点 {node.node_id} 是非叶子节点，添加子节点到队列")
-                        # 使用Django ORM获取子节点
-                        child_nodes = OctreeNode.objects.filter(parent_id=node.node_id)
+                        child_nodes = self._query_octree_nodes("parent_id = %s", (node.node_id,))
                         memory_children = [MemoryNode(child) for child in child_nodes]
                         node.children.extend(memory_children)  # 保存子节点引用
                         L.extend(memory_children)
@@ -405,13 +425,13 @@ class SSTPProcessor:
             # 直接使用Cassandra驱动查询，不使用Django ORM
             print("\n=== 使用Cassandra驱动直接查询 ===")
             session = get_session()
-            query = f"SELECT keyword, node_id, traj_id, t_date, latitude, longitude, time FROM TrajectoryDate WHERE keyword = {keyword} AND node_id = {node_id}"
+            query = f"SELECT keyword, node_id, traj_id, t_date, date_code, latitude, longitude, time FROM TrajectoryDate WHERE keyword = {keyword} AND node_id = {node_id}"
             print(f"执行查询: {query}")
             
             trajectories = session.execute(query)
             
-            # 转换为列表以便获取长度
-            trajectories_list = list(trajectories)
+            # 转换为列表以便获取长度，字典编码的日期还原为密文
+            trajectories_list = [self._with_dictionary_date(traj) for traj in trajectories]
             print(f"查询结果数量: {len(trajectories_list)}")
             
             for traj in trajectories_list:
@@ -511,8 +531,180 @@ class SSTPProcessor:
             import traceback
             print(traceback.format_exc())
         
+    def _resolve_covered_subtree(self, node, keyword, CTK, grange, rid, presence=None):
+        """
+        对内部节点做网格覆盖判断，完全覆盖时按先序叶子区间整段处理子树
+        
+        返回True表示该子树已处理完毕（完全覆盖或不相交），无需继续下探；
+        返回False表示部分覆盖或节点没有叶子区间，需按原流程展开子节点。
+        """
+        if node.first_leaf is None or node.last_leaf is None or not node.GC:
+            return False
+        
+        try:
+            grid_comparison = self.scp.compare_grid_range(
+                node.GC,
+                grange['grid_min_x'], grange['grid_min_y'], grange['grid_min_z'],
+                grange['grid_max_x'], grange['grid_max_y'], grange['grid_max_z']
+            )
+            grid_check_result = self.central_client.decrypt_comparison(rid, grid_comparison, 'grid')
+            coverage_type = grid_check_result.get('coverage_type')
+        except Exception as e:
+            logger.error(f"查询 {rid}: 内部节点 {node.node_id} 网格覆盖判断失败: {str(e)}")
+            return False
+        
+        if coverage_type == 'none':
+            print(f"内部节点 {node.node_id} 与网格范围不相交，剪枝整棵子树")
+            return True
+        if coverage_type != 'full':
+            return False
+        
+        print(f"内部节点 {node.node_id} 被完全覆盖，整段读取叶子区间 [{node.first_leaf}, {node.last_leaf}]")
+        leaf_ids = self._fetch_leaf_ids_in_interval(node.first_leaf, node.last_leaf)
+        if presence is not None:
+            leaf_ids = presence.filter(leaf_ids)
+        self._process_fully_covered_leaves(leaf_ids, keyword, CTK)
+        return True
+    
+    def _load_keyword_presence(self, keyword):
+        """读取关键词节点存在位图，没有位图记录时返回None（不做剪枝）"""
+        try:
+            row = KeywordNodePresence.objects.filter(keyword=keyword).first()
+        except Exception as e:
+            logger.warning(f"读取关键词 {keyword} 的存在位图失败，不做剪枝: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return NodePresenceBitmap(row.node_bitmap)
+    
+    def _prepare(self, session, cql):
+        """按会话缓存预编译语句，避免每批叶子都向Cassandra发起一次prepare往返"""
+        if not hasattr(self, '_prepared'):
+            self._prepared = {}
+        key = (id(session), cql)
+        statement = self._prepared.get(key)
+        if statement is None:
+            statement = session.prepare(cql)
+            self._prepared[key] = statement
+        return statement
+    
+    def _resolve_octree_tables(self):
+        """确定当前生效版本的八叉树节点表和叶子序号表"""
+        self.octree_table, self.leaf_order_table = get_octree_tables(get_session())
+    
+    def _query_octree_nodes(self, condition, params):
+        """从当前版本的八叉树节点表读取满足条件的节点"""
+        session = get_session()
+        rows = session.execute(
+            f"SELECT * FROM gko_space.{self.octree_table} WHERE {condition} ALLOW FILTERING", params
+        )
+        return [OctreeNode(**(row if isinstance(row, dict) else row._asdict())) for row in rows]
+    
+    def _count_octree_nodes(self):
+        """当前版本八叉树的节点数"""
+        row = get_session().execute(f"SELECT COUNT(*) AS total FROM gko_space.{self.octree_table}").one()
+        return row['total'] if isinstance(row, dict) else row.total
+    
+    def _fetch_leaf_ids_in_interval(self, first_leaf, last_leaf):
+        """按先序序号区间从当前版本的叶子序号表读取叶子节点ID"""
+        session = get_session()
+        statement = self._prepare(
+            session,
+            f"SELECT leaf_rank, node_id FROM gko_space.{self.leaf_order_table} "
+            "WHERE bucket = ? AND leaf_rank >= ? AND leaf_rank <= ?"
+        )
+        params = [
+            (bucket, first_leaf, last_leaf)
+            for bucket in range(first_leaf // LEAF_ORDER_BUCKET_SIZE, last_leaf // LEAF_ORDER_BUCKET_SIZE + 1)
+        ]
+        concurrency = getattr(settings, 'SSTP_BULK_FETCH_CONCURRENCY', 16)
+        
+        leaf_ids = []
+        for success, rows in execute_concurrent_with_args(session, statement, params, concurrency=concurrency):
+            if not success:
+                logger.error(f"读取叶子区间 [{first_leaf}, {last_leaf}] 失败: {rows}")
+                continue
+            leaf_ids.extend(row.node_id for row in rows)
+        return leaf_ids
+    
+    def _process_fully_covered_leaves(self, leaf_ids, keyword, CTK):
+        """并发读取一批完全覆盖叶子的TrajectoryDate分区并写入CTK"""
+        if not leaf_ids:
+            return
+        
+        session = get_session()
+        statement = self._prepare(
+            session,
+            "SELECT keyword, node_id, traj_id, t_date, date_code FROM TrajectoryDate "
+            "WHERE keyword = ? AND node_id = ?"
+        )
+        concurrency = getattr(settings, 'SSTP_BULK_FETCH_CONCURRENCY', 16)
+        results = execute_concurrent_with_args(
+            session, statement,
+            [(keyword, node_id) for node_id in leaf_ids],
+            concurrency=concurrency
+        )
+        
+        row_count = 0
+        for node_id, (success, rows) in zip(leaf_ids, results):
+            if not success:
+                logger.error(f"读取叶子节点 {node_id} 的轨迹数据失败: {rows}")
+                continue
+            for traj in rows:
+                row_count += 1
+                self._add_trajectory_to_ctk(self._with_dictionary_date(traj), node_id, CTK)
+        print(f"批量读取 {len(leaf_ids)} 个叶子节点，共 {row_count} 条轨迹数据")
+    
+    def _load_date_dictionary(self):
+        """读取加密日期字典 {date_code: t_date密文BLOB}"""
+        try:
+            session = get_session()
+            return {row.date_code: row.t_date for row in session.execute("SELECT date_code, t_date FROM DateDictionary")}
+        except Exception as e:
+            logger.warning(f"读取日期字典失败: {str(e)}")
+            return {}
+    
+    def _with_dictionary_date(self, traj):
+        """按日期字典存储的行t_date为空，用字典中的密文补全，使后续处理与旧数据一致"""
+        if traj.t_date is not None or getattr(traj, 'date_code', None) is None:
+            return traj
+        if getattr(self, 'date_dictionary', None) is None:
+            self.date_dictionary = self._load_date_dictionary()
+        return traj._replace(t_date=self.date_dictionary.get(traj.date_code))
+    
+    def _add_trajectory_to_ctk(self, traj, node_id, CTK):
+        """反序列化一行TrajectoryDate数据并以十六进制形式加入CTK"""
+        if traj.traj_id is None or traj.t_date is None:
+            logger.warning(f"节点 {node_id} 存在traj_id或t_date为空的记录，已跳过")
+            return
+        
+        try:
+            traj_id = pickle.loads(traj.traj_id) if isinstance(traj.traj_id, bytes) else traj.traj_id
+        except Exception as e:
+            # 与逐个叶子处理时一致，反序列化失败时直接使用原始bytes，不丢弃结果
+            logger.warning(f"节点 {node_id} 的traj_id反序列化失败，使用原始bytes: {str(e)}")
+            traj_id = traj.traj_id
+        
+        try:
+            t_date = pickle.loads(traj.t_date) if isinstance(traj.t_date, bytes) else traj.t_date
+        except Exception:
+            # 与逐个叶子处理时一致，反序列化失败时直接使用原始bytes
+            t_date = traj.t_date
+        
+        traj_id_hex = traj_id.hex() if isinstance(traj_id, bytes) else str(traj_id)
+        date_hex = t_date.hex() if isinstance(t_date, bytes) else str(t_date)
+        
+        if traj_id_hex not in CTK:
+            CTK[traj_id_hex] = {}
+        CTK[traj_id_hex][date_hex] = node_id
+        
     def _process_partially_covered_node(self, node, keyword, CTK, prange, rid):
-        """处理部分覆盖的叶子节点"""
+        """
+        处理部分覆盖的叶子节点
+        
+        整个叶子的轨迹点一次性完成同态比较，并按批发送给中央服务器解密，
+        中央服务器返回位图（第i位为1表示第i个点在范围内），避免逐点往返。
+        """
         try:
             # 如果是内存节点，获取原始node_id
             node_id = node.node_id if isinstance(node, MemoryNode) else node.node_id
@@ -520,97 +712,53 @@ class SSTPProcessor:
             logger.debug(f"获取节点 {node.node_id} 的轨迹数据")
             
             # 直接使用Cassandra驱动查询，不使用Django ORM
-            print("\n=== 使用Cassandra驱动直接查询 ===")
             session = get_session()
-            query = f"SELECT keyword, node_id, traj_id, t_date, latitude, longitude, time FROM TrajectoryDate WHERE keyword = {keyword} AND node_id = {node_id}"
-            print(f"执行查询: {query}")
+            statement = self._prepare(
+                session,
+                "SELECT keyword, node_id, traj_id, t_date, date_code, latitude, longitude, time, packed_point "
+                "FROM TrajectoryDate WHERE keyword = ? AND node_id = ?"
+            )
+            trajectories_list = [self._with_dictionary_date(traj) for traj in session.execute(statement, (keyword, node_id))]
+            logger.debug(f"节点 {node.node_id} 的轨迹数量: {len(trajectories_list)}")
             
-            trajectories = session.execute(query)
+            if not trajectories_list:
+                return
             
-            # 转换为列表以便获取长度
-            trajectories_list = list(trajectories)
-            logger.debug(f"节点 {node.node_id} 的轨迹数量: {len(trajectories_list)}")
+            # 向量化计算整个叶子的同态比较结果；数据和查询都是打包编码时每个点只需一次比较
+            if 'packed_min' in prange and all(traj.packed_point for traj in trajectories_list):
+                comparison_type = 'packed_point'
+                points = [pickle.loads(traj.packed_point) for traj in trajectories_list]
+                point_comparisons = self.scp.compare_packed_points_range_batch(points, prange)
+            else:
+                comparison_type = 'point'
+                points = [(traj.latitude, traj.longitude, traj.t_date) for traj in trajectories_list]
+                point_comparisons = self.scp.compare_points_range_batch(points, prange)
             
-            for traj in trajectories_list:
-                logger.debug(f"原始轨迹数据: traj_id={traj.traj_id}, traj_id类型={type(traj.traj_id)}")
-                logger.debug(f"原始轨迹数据: t_date={traj.t_date}, t_date类型={type(traj.t_date)}")
-                
-                # 使用安全计算协议检查点是否在范围内
-                point_comparison = self.scp.compare_point_range(
-                    traj.latitude, traj.longitude, traj.t_date,
-                    prange['latitude_min'], prange['longitude_min'], prange['time_min'],
-                    prange['latitude_max'], prange['longitude_max'], prange['time_max']
-                )
+            batch_size = getattr(settings, 'SSTP_POINT_BATCH_SIZE', 512)
+            for start in range(0, len(trajectories_list), batch_size):
+                batch = trajectories_list[start:start + batch_size]
+                comparisons = point_comparisons[start:start + batch_size]
                 
-                if point_comparison is None:
-                    logger.error(f"查询 {rid}: 点位比较失败，跳过轨迹点 {traj.traj_id}")
+                # 比较失败的点不发送给中央服务器
+                valid_indexes = [i for i, comparison in enumerate(comparisons) if comparison is not None]
+                if len(valid_indexes) < len(batch):
+                    logger.error(f"查询 {rid}: 节点 {node_id} 有 {len(batch) - len(valid_indexes)} 个点位比较失败，已跳过")
+                if not valid_indexes:
                     continue
                 
-                # 发送比较结果给中央服务器进行解密
-                in_range = self.central_client.decrypt_comparison(
+                result = self.central_client.decrypt_comparison_batch(
                     rid,
-                    point_comparison,
-                    'point'
-                ).get('in_range', False)
+                    [comparisons[i] for i in valid_indexes],
+                    comparison_type
+                )
+                if 'error' in result:
+                    logger.error(f"查询 {rid}: 节点 {node_id} 批量点位验证失败: {result['error']}")
+                    continue
                 
-                if in_range:
-                    try:
-                        # 反序列化数据
-                        if traj.traj_id is None:
-                            logger.error(f"轨迹ID为空，节点ID: {node.node_id}")
-                            continue
-                            
-                        if traj.t_date is None:
-                            logger.error(f"t_date为空，轨迹ID: {traj.traj_id}, 节点ID: {node.node_id}")
-                            continue
-                            
-                        # 尝试反序列化traj_id
-                        try:
-                            traj_id = pickle.loads(traj.traj_id) if isinstance(traj.traj_id, bytes) else traj.traj_id
-                        except Exception as e:
-                            logger.error(f"traj_id反序列化失败: {str(e)}")
-                            # 如果反序列化失败，直接使用原始bytes
-                            traj_id = traj.traj_id
-                            
-                        # 尝试反序列化t_date
-                        try:
-                            if isinstance(traj.t_date, bytes):
-                                logger.debug("正在反序列化t_date (bytes)...")
-                                try:
-                                    t_date = pickle.loads(traj.t_date)
-                                    logger.debug(f"t_date反序列化成功: {t_date}")
-                                except Exception as e:
-                                    logger.error(f"t_date反序列化失败，尝试直接使用原始值: {str(e)}")
-                                    # 如果反序列化失败，直接使用原始bytes
-                                    t_date = traj.t_date
-                                    logger.debug(f"使用原始bytes值: {t_date}")
-                            else:
-                                logger.debug(f"t_date不是bytes类型，保持原值: {traj.t_date}")
-                                t_date = traj.t_date
-                                
-                            # 检查t_date是否为None
-                            if t_date is None:
-                                logger.warning("处理后的t_date为None")
-                                # 尝试使用当前时间作为替代
-                                import datetime
-                                t_date = datetime.datetime.now().isoformat().encode('utf-8')
-                                logger.debug(f"使用当前时间作为替代: {t_date}")
-                        except Exception as e:
-                            logger.error(f"t_date处理过程中出错: {str(e)}")
-                            continue
-                        
-                        # 将数据转换为十六进制字符串
-                        traj_id_hex = traj_id.hex() if isinstance(traj_id, bytes) else str(traj_id)
-                        date_hex = t_date.hex() if isinstance(t_date, bytes) else str(t_date)
-                        
-                        if traj_id_hex not in CTK:
-                            CTK[traj_id_hex] = {}
-                        CTK[traj_id_hex][date_hex] = pickle.loads(node.node_id) if isinstance(node.node_id, bytes) else node.node_id
-                    except Exception as e:
-                        logger.error(f"数据转换错误: {str(e)}")
-                        logger.error(f"错误详情 - 轨迹ID: {traj.traj_id}, t_date: {traj.t_date}, 节点ID: {node.node_id}")
-                        logger.error("错误详情:", exc_info=True)
-                        continue
+                in_range = NodePresenceBitmap(bytes.fromhex(result.get('bitmap', '')))
+                for position, index in enumerate(valid_indexes):
+                    if in_range.contains(position):
+                        self._add_trajectory_to_ctk(batch[index], node_id, CTK)
                         
         except Exception as e:
             logger.error(f"查询 {rid}: 处理部分覆盖节点失败: {str(e)}")
@@ -823,6 +971,66 @@ class SecureComputationProtocols:
         
         return comparisons
     
+    def compare_points_range_batch(self, points, prange):
+        """
+        批量比较轨迹点是否在范围内
+        
+        points: [(lat, lon, time), ...] 加密的轨迹点
+        prange: 加密的点范围，字段同compare_point_range
+        返回与points等长的列表，每项为compare_point_range格式的加密比较结果，计算失败的点为None
+        """
+        try:
+            # 查询下界的取负只依赖查询本身，整批只计算一次
+            neg_min_lat = self.public_key.raw_multiply(prange['latitude_min'], -1)
+            neg_min_lon = self.public_key.raw_multiply(prange['longitude_min'], -1)
+            neg_min_time = self.public_key.raw_multiply(prange['time_min'], -1)
+        except Exception as e:
+            logger.error(f"同态计算失败: {str(e)}")
+            return [None] * len(points)
+        
+        # 一次生成整批的随机混淆数
+        factors = np.random.randint(1, 1000, size=(len(points), 6)).tolist()
+        
+        results = []
+        for (lat, lon, time), r in zip(points, factors):
+            try:
+                results.append({
+                    'lat_min': self.public_key.raw_multiply(self.public_key.raw_add(lat, neg_min_lat), r[0]),
+                    'lon_min': self.public_key.raw_multiply(self.public_key.raw_add(lon, neg_min_lon), r[1]),
+                    'time_min': self.public_key.raw_multiply(self.public_key.raw_add(time, neg_min_time), r[2]),
+                    'lat_max': self._homomorphic_sub_mult(prange['latitude_max'], lat, r[3]),
+                    'lon_max': self._homomorphic_sub_mult(prange['longitude_max'], lon, r[4]),
+                    'time_max': self._homomorphic_sub_mult(prange['time_max'], time, r[5])
+                })
+            except Exception as e:
+                logger.error(f"同态计算失败: {str(e)}")
+                results.append(None)
+        
+        return results
+    
+    def compare_packed_points_range_batch(self, packed_points, prange):
+        """
+        批量比较打包编码的轨迹点是否在范围内
+        
+        packed_points: 加密的打包点（纬度、经度、时间各占一个槽）
+        prange: 含packed_min/packed_max的加密点范围
+        返回与packed_points等长的列表，每项为 {'packed_min', 'packed_max'}，
+        值为pickle序列化后的十六进制密文（可直接放入JSON请求），计算失败的点为None
+        """
+        packer = SlotPacker()
+        results = []
+        for point in packed_points:
+            try:
+                comparison = packer.compare_points_in_range(
+                    [point], prange['packed_min'], prange['packed_max'], len(POINT_FIELDS)
+                )[0]
+                results.append({key: pickle.dumps(value).hex() for key, value in comparison.items()})
+            except Exception as e:
+                logger.error(f"同态计算失败: {str(e)}")
+                results.append(None)
+        
+        return results
+    
     def _secure_compare(self, a, b, operator):
         """
         基础的安全比较操作
@@ -0,0 +1,58 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MigrationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='任务ID')),
+                ('kind', models.CharField(choices=[('octree', '八叉树数据迁移'), ('trajectory', '轨迹数据迁移')], max_length=20, verbose_name='迁移类型')),
+                ('status', models.CharField(choices=[('pending', '待处理'), ('running', '执行中'), ('finalizing', '收尾中'), ('completed', '已完成'), ('failed', '失败'), ('cancelled', '已取消')], default='pending', max_length=20, verbose_name='状态')),
+                ('version', models.BigIntegerField(blank=True, help_text='八叉树迁移写入的版本表编号，恢复执行时沿用', null=True, verbose_name='数据版本号')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('celery_task_id', models.CharField(blank=True, max_length=64, null=True, verbose_name='Celery任务ID')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='已请求取消')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'verbose_name': '数据迁移任务',
+                'verbose_name_plural': '数据迁移任务',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MigrationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fog_id', models.IntegerField(verbose_name='雾服务器ID')),
+                ('phase', models.CharField(choices=[('prepare', '准备'), ('chunk', '数据分块'), ('finalize', '收尾')], max_length=20, verbose_name='阶段')),
+                ('chunk_key', models.CharField(help_text='分块覆盖的键范围，如 nodes:0-4999', max_length=100, verbose_name='分块键')),
+                ('status', models.CharField(choices=[('pending', '待处理'), ('running', '执行中'), ('done', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('params', models.TextField(default='{}', help_text='规划时确定的分块范围，JSON格式', verbose_name='分块参数')),
+                ('state', models.TextField(default='{}', help_text='准备阶段产生、供分块使用的数据，JSON格式', verbose_name='阶段产物')),
+                ('rows_written', models.IntegerField(default=0, verbose_name='写入行数')),
+                ('attempts', models.IntegerField(default=0, verbose_name='执行次数')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='data_management.migrationjob', verbose_name='迁移任务')),
+            ],
+            options={
+                'verbose_name': '数据迁移检查点',
+                'verbose_name_plural': '数据迁移检查点',
+                'ordering': ['fog_id', 'id'],
+                'unique_together': {('job', 'fog_id', 'chunk_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0002_migrationjob_migrationcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='任务ID')),
+                ('file_name', models.CharField(max_length=255, verbose_name='文件名')),
+                ('file_path', models.CharField(blank=True, max_length=500, verbose_name='文件路径')),
+                ('file_size', models.BigIntegerField(default=0, verbose_name='文件大小')),
+                ('status', models.CharField(choices=[('pending', '待处理'), ('running', '执行中'), ('completed', '已完成'), ('failed', '失败'), ('cancelled', '已取消')], default='pending', max_length=20, verbose_name='状态')),
+                ('bytes_read', models.BigIntegerField(default=0, verbose_name='已读取字节数')),
+                ('rows_imported', models.BigIntegerField(default=0, help_text='已提交到数据库的行数', verbose_name='已导入行数')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('celery_task_id', models.CharField(blank=True, max_length=64, null=True, verbose_name='Celery任务ID')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='已请求取消')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'verbose_name': '轨迹导入任务',
+                'verbose_name_plural': '轨迹导入任务',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0003_trackimportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_points', models.BigIntegerField(default=0, verbose_name='轨迹点总数')),
+                ('rebuilt_at', models.DateTimeField(blank=True, null=True, verbose_name='最近全量重建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '轨迹统计',
+                'verbose_name_plural': '轨迹统计',
+                'db_table': 'track_statistics',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackKeywordStat',
+            fields=[
+                ('keyword', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='关键词')),
+                ('point_count', models.BigIntegerField(default=0, verbose_name='轨迹点数')),
+            ],
+            options={
+                'verbose_name': '关键词统计',
+                'verbose_name_plural': '关键词统计',
+                'db_table': 'track_keyword_stats',
+                'ordering': ['keyword'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackDateStat',
+            fields=[
+                ('date', models.IntegerField(primary_key=True, serialize=False, verbose_name='日期')),
+                ('point_count', models.BigIntegerField(default=0, verbose_name='轨迹点数')),
+            ],
+            options={
+                'verbose_name': '日期统计',
+                'verbose_name_plural': '日期统计',
+                'db_table': 'track_date_stats',
+                'ordering': ['date'],
+            },
+        ),
+    ]
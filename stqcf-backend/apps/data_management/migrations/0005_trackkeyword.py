@@ -0,0 +1,52 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_track_keyword_index(apps, schema_editor):
+    """按已有轨迹点的keyword字段填充倒排索引，按主键分批读取"""
+    Track = apps.get_model('data_management', 'Track')
+    TrackKeyword = apps.get_model('data_management', 'TrackKeyword')
+    last_id = 0
+    while True:
+        rows = list(
+            Track.objects.filter(id__gt=last_id).exclude(keyword='')
+            .order_by('id').values_list('id', 'keyword')[:10000]
+        )
+        if not rows:
+            break
+        TrackKeyword.objects.bulk_create(
+            [
+                TrackKeyword(track_id=track_pk, keyword=k)
+                for track_pk, keyword in rows
+                for k in {k for k in keyword.split(',') if k}
+            ],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0004_track_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackKeyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keyword', models.CharField(max_length=255, verbose_name='关键词')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_entries', to='data_management.track', verbose_name='轨迹点')),
+            ],
+            options={
+                'verbose_name': '轨迹点关键词',
+                'verbose_name_plural': '轨迹点关键词',
+                'db_table': 'track_keyword',
+                'unique_together': {('track', 'keyword')},
+                'indexes': [models.Index(fields=['keyword', 'track'], name='track_keyword_kw_idx')],
+            },
+        ),
+        migrations.RunPython(build_track_keyword_index, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,13 @@
+import json
+import uuid
 from django.db import models
 
+
+def split_keywords(keyword):
+    """拆分逗号分隔的关键词字段，与Track.get_keywords一致并去重"""
+    return {k for k in keyword.split(',') if k} if keyword else set()
+
+
 class Track(models.Model):
     track_id = models.CharField(max_length=100, db_index=True)
     point_id = models.CharField(max_length=100)
@@ -16,11 +24,232 @@ class Track(models.Model):
         
     def __str__(self):
         return f"{self.track_id}-{self.point_id}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.sync_keyword_index()
     
     def get_keywords(self):
         """获取关键词列表"""
         return self.keyword.split(',') if self.keyword else []
     
     def set_keywords(self, keywords):
-        """设置关键词列表"""
-        self.keyword = ','.join(str(k) for k in keywords) if keywords else '' 
\ No newline at end of file
+        """设置关键词列表，保存时同步关键词索引"""
+        self.keyword = ','.join(str(k) for k in keywords) if keywords else ''
+
+    def sync_keyword_index(self):
+        """按keyword字段更新本轨迹点在TrackKeyword中的索引项"""
+        keywords = split_keywords(self.keyword)
+        existing = set(self.keyword_entries.values_list('keyword', flat=True))
+        if existing - keywords:
+            self.keyword_entries.filter(keyword__in=existing - keywords).delete()
+        if keywords - existing:
+            TrackKeyword.objects.bulk_create(
+                [TrackKeyword(track=self, keyword=k) for k in keywords - existing], ignore_conflicts=True
+            )
+
+
+class TrackKeyword(models.Model):
+    """
+    轨迹点关键词倒排索引：每个轨迹点的每个关键词一行
+
+    Track.keyword仍保存逗号分隔的原始值；按关键词过滤时通过(keyword, track)索引连接，
+    不再对tracks_table做LIKE扫描。Track.save()和批量导入负责同步。
+    """
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='keyword_entries', verbose_name='轨迹点')
+    keyword = models.CharField(max_length=255, verbose_name='关键词')
+
+    class Meta:
+        db_table = 'track_keyword'
+        verbose_name = '轨迹点关键词'
+        verbose_name_plural = verbose_name
+        unique_together = ('track', 'keyword')
+        indexes = [models.Index(fields=['keyword', 'track'], name='track_keyword_kw_idx')]
+
+
+class MigrationJob(models.Model):
+    """数据迁移任务：把MySQL中的八叉树或轨迹数据分块写入各雾服务器"""
+    KIND_CHOICES = (
+        ('octree', '八叉树数据迁移'),
+        ('trajectory', '轨迹数据迁移')
+    )
+    STATUS_CHOICES = (
+        ('pending', '待处理'),
+        ('running', '执行中'),
+        ('finalizing', '收尾中'),
+        ('completed', '已完成'),
+        ('failed', '失败'),
+        ('cancelled', '已取消')
+    )
+    FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, verbose_name='任务ID')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='迁移类型')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    version = models.BigIntegerField(null=True, blank=True, verbose_name='数据版本号',
+                                     help_text='八叉树迁移写入的版本表编号，恢复执行时沿用')
+    error = models.TextField(null=True, blank=True, verbose_name='错误信息')
+    celery_task_id = models.CharField(max_length=64, null=True, blank=True, verbose_name='Celery任务ID')
+    cancel_requested = models.BooleanField(default=False, verbose_name='已请求取消')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='结束时间')
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    def get_progress(self):
+        """按检查点统计进度：各状态的分块数、已写入行数，以及每个雾服务器的完成情况"""
+        progress = {'total_chunks': 0, 'done_chunks': 0, 'failed_chunks': 0, 'rows_written': 0, 'fogs': {}}
+        for checkpoint in self.checkpoints.all():
+            fog = progress['fogs'].setdefault(str(checkpoint.fog_id), {
+                'total_chunks': 0, 'done_chunks': 0, 'rows_written': 0, 'prepared': False, 'finalized': False
+            })
+            if checkpoint.phase == 'chunk':
+                progress['total_chunks'] += 1
+                fog['total_chunks'] += 1
+                if checkpoint.status == 'done':
+                    progress['done_chunks'] += 1
+                    fog['done_chunks'] += 1
+                elif checkpoint.status == 'failed':
+                    progress['failed_chunks'] += 1
+                progress['rows_written'] += checkpoint.rows_written
+                fog['rows_written'] += checkpoint.rows_written
+            elif checkpoint.status == 'done':
+                fog['prepared' if checkpoint.phase == 'prepare' else 'finalized'] = True
+        total = progress['total_chunks']
+        progress['percent'] = round(progress['done_chunks'] * 100.0 / total, 1) if total else 0.0
+        return progress
+
+    class Meta:
+        verbose_name = '数据迁移任务'
+        verbose_name_plural = verbose_name
+        ordering = ['-created_at']
+
+
+class MigrationCheckpoint(models.Model):
+    """
+    数据迁移检查点
+
+    每个雾服务器的迁移分为准备（prepare）、若干数据分块（chunk）和收尾（finalize）三个阶段，
+    每个阶段一条记录。已完成的检查点在恢复执行时跳过，分块重复执行是幂等的。
+    """
+    PHASE_CHOICES = (
+        ('prepare', '准备'),
+        ('chunk', '数据分块'),
+        ('finalize', '收尾')
+    )
+    STATUS_CHOICES = (
+        ('pending', '待处理'),
+        ('running', '执行中'),
+        ('done', '已完成'),
+        ('failed', '失败')
+    )
+
+    job = models.ForeignKey(MigrationJob, on_delete=models.CASCADE, related_name='checkpoints', verbose_name='迁移任务')
+    fog_id = models.IntegerField(verbose_name='雾服务器ID')
+    phase = models.CharField(max_length=20, choices=PHASE_CHOICES, verbose_name='阶段')
+    chunk_key = models.CharField(max_length=100, verbose_name='分块键', help_text='分块覆盖的键范围，如 nodes:0-4999')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    params = models.TextField(default='{}', verbose_name='分块参数', help_text='规划时确定的分块范围，JSON格式')
+    state = models.TextField(default='{}', verbose_name='阶段产物', help_text='准备阶段产生、供分块使用的数据，JSON格式')
+    rows_written = models.IntegerField(default=0, verbose_name='写入行数')
+    attempts = models.IntegerField(default=0, verbose_name='执行次数')
+    error = models.TextField(null=True, blank=True, verbose_name='错误信息')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='完成时间')
+
+    def get_params(self):
+        return json.loads(self.params or '{}')
+
+    def get_state(self):
+        return json.loads(self.state or '{}')
+
+    class Meta:
+        verbose_name = '数据迁移检查点'
+        verbose_name_plural = verbose_name
+        unique_together = ('job', 'fog_id', 'chunk_key')
+        ordering = ['fog_id', 'id']
+
+
+class TrackImportJob(models.Model):
+    """轨迹CSV导入任务：上传文件保存到磁盘后在Celery worker中流式分块导入"""
+    STATUS_CHOICES = (
+        ('pending', '待处理'),
+        ('running', '执行中'),
+        ('completed', '已完成'),
+        ('failed', '失败'),
+        ('cancelled', '已取消')
+    )
+    FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, verbose_name='任务ID')
+    file_name = models.CharField(max_length=255, verbose_name='文件名')
+    file_path = models.CharField(max_length=500, blank=True, verbose_name='文件路径')
+    file_size = models.BigIntegerField(default=0, verbose_name='文件大小')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    bytes_read = models.BigIntegerField(default=0, verbose_name='已读取字节数')
+    rows_imported = models.BigIntegerField(default=0, verbose_name='已导入行数', help_text='已提交到数据库的行数')
+    error = models.TextField(null=True, blank=True, verbose_name='错误信息')
+    celery_task_id = models.CharField(max_length=64, null=True, blank=True, verbose_name='Celery任务ID')
+    cancel_requested = models.BooleanField(default=False, verbose_name='已请求取消')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='结束时间')
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    @property
+    def percent(self):
+        return round(min(self.bytes_read, self.file_size) * 100.0 / self.file_size, 1) if self.file_size else 0.0
+
+    class Meta:
+        verbose_name = '轨迹导入任务'
+        verbose_name_plural = verbose_name
+        ordering = ['-created_at']
+
+
+class TrackStatistics(models.Model):
+    """
+    轨迹点统计汇总（单行，id=1）
+
+    与TrackKeywordStat、TrackDateStat一起在导入、增删轨迹点时与数据写入在同一事务中增量更新，
+    统计接口直接读取，不再扫描tracks_table。
+    """
+    total_points = models.BigIntegerField(default=0, verbose_name='轨迹点总数')
+    rebuilt_at = models.DateTimeField(null=True, blank=True, verbose_name='最近全量重建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'track_statistics'
+        verbose_name = '轨迹统计'
+        verbose_name_plural = verbose_name
+
+
+class TrackKeywordStat(models.Model):
+    """每个关键词的轨迹点数，关键词字段中逗号分隔的每个关键词分别计数"""
+    keyword = models.CharField(max_length=255, primary_key=True, verbose_name='关键词')
+    point_count = models.BigIntegerField(default=0, verbose_name='轨迹点数')
+
+    class Meta:
+        db_table = 'track_keyword_stats'
+        verbose_name = '关键词统计'
+        verbose_name_plural = verbose_name
+        ordering = ['keyword']
+
+
+class TrackDateStat(models.Model):
+    """每个日期的轨迹点数，用于维护日期范围"""
+    date = models.IntegerField(primary_key=True, verbose_name='日期')
+    point_count = models.BigIntegerField(default=0, verbose_name='轨迹点数')
+
+    class Meta:
+        db_table = 'track_date_stats'
+        verbose_name = '日期统计'
+        verbose_name_plural = verbose_name
+        ordering = ['date']
@@ -1,27 +1,265 @@
+import os
+import json
+import time
 from celery import shared_task
-from django.core.cache import cache
-from .models import Track
-from .views import STATS_CACHE_KEY, STATS_CACHE_TIMEOUT
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import MigrationJob, MigrationCheckpoint, TrackImportJob
+from .track_stats import rebuild_track_statistics, get_track_statistics
+
+logger = get_task_logger(__name__)
 
 @shared_task
 def update_track_statistics():
-    """定期更新轨迹统计数据的缓存"""
-    total_points = Track.objects.count()
-    
-    # 使用数据库聚合来优化关键词统计
-    keywords = Track.objects.exclude(keyword='').values_list('keyword', flat=True)
-    unique_keywords = set()
-    for kw in keywords:
-        if kw:
-            unique_keywords.update(kw.split(','))
-    unique_keywords.discard('')
+    """
+    定期全量重建轨迹统计表，校正增量维护可能产生的偏差
     
-    stats = {
-        'total_points': total_points,
-        'total_keywords': len(unique_keywords),
-        'keywords_list': sorted(list(unique_keywords))
-    }
+    统计在导入和增删轨迹点时已增量更新，此任务只用于校正
+    """
+    rebuild_track_statistics()
+    return get_track_statistics()
+
+
+_distributor_cache = None  # (任务ID, 分发器)
+
+
+def _get_distributor(job):
+    """
+    获取迁移任务的分发器
+
+    worker进程按任务缓存分发器，连续执行同一任务的分块时复用雾服务器连接和已准备的写入参数。
+    """
+    global _distributor_cache
+    if _distributor_cache is not None and _distributor_cache[0] == str(job.id):
+        return _distributor_cache[1]
+    if _distributor_cache is not None:
+        _distributor_cache[1].close()
+    # 分发脚本导入时会初始化Cassandra驱动和加密组件，只在worker执行任务时导入
+    if job.kind == 'octree':
+        from process_octree_data import OctreeDataDistributor
+        distributor = OctreeDataDistributor()
+    else:
+        from process_trajectory_data import TrajectoryDataDistributor
+        distributor = TrajectoryDataDistributor()
+    _distributor_cache = (str(job.id), distributor)
+    return distributor
+
+
+def _fog_state(job, fog_id):
+    """雾服务器准备阶段的产物"""
+    checkpoint = MigrationCheckpoint.objects.filter(job=job, fog_id=fog_id, phase='prepare').first()
+    return checkpoint.get_state() if checkpoint else {}
+
+
+def _run_checkpoint(job, checkpoint, distributor):
+    """执行一个检查点并持久化结果，失败时记录错误后抛出"""
+    MigrationCheckpoint.objects.filter(pk=checkpoint.pk).update(
+        status='running', attempts=F('attempts') + 1, error=None, updated_at=timezone.now()
+    )
+    fields = {}
+    try:
+        if checkpoint.phase == 'prepare':
+            fields['state'] = json.dumps(distributor.prepare_fog(checkpoint.fog_id, job.version), default=str)
+        elif checkpoint.phase == 'chunk':
+            fields['rows_written'] = distributor.process_chunk(
+                checkpoint.fog_id, checkpoint.get_params(), _fog_state(job, checkpoint.fog_id), job.version
+            )
+        else:
+            distributor.finalize_fog(checkpoint.fog_id, _fog_state(job, checkpoint.fog_id), job.version)
+    except Exception as e:
+        MigrationCheckpoint.objects.filter(pk=checkpoint.pk).update(
+            status='failed', error=str(e), updated_at=timezone.now()
+        )
+        raise
+    MigrationCheckpoint.objects.filter(pk=checkpoint.pk).update(
+        status='done', finished_at=timezone.now(), updated_at=timezone.now(), **fields
+    )
+
+
+def _finish_migration_job(job_id, status, error=None):
+    MigrationJob.objects.filter(pk=job_id).exclude(status__in=MigrationJob.FINISHED_STATUSES).update(
+        status=status, error=error, finished_at=timezone.now(), updated_at=timezone.now()
+    )
+
+
+@shared_task(bind=True)
+def run_migration_job(self, job_id):
+    """
+    启动或恢复数据迁移任务
+
+    首次执行时规划检查点；之后执行未完成的准备阶段，再为每个未完成的分块派发一个任务。
+    已完成的检查点直接跳过，恢复执行从中断处继续。
+    """
+    try:
+        job = MigrationJob.objects.get(pk=job_id)
+    except MigrationJob.DoesNotExist:
+        logger.error(f"迁移任务 {job_id} 不存在")
+        return
+
+    if job.cancel_requested or job.is_finished:
+        logger.info(f"迁移任务 {job_id} 已取消或已结束，跳过执行")
+        return
+
+    if job.kind == 'octree' and job.version is None:
+        # 版本号随任务持久化，恢复执行时继续写入同一组版本表
+        job.version = int(time.time() * 1000)
+        MigrationJob.objects.filter(pk=job_id).update(version=job.version)
+    MigrationJob.objects.filter(pk=job_id).update(status='running', updated_at=timezone.now())
+    MigrationJob.objects.filter(pk=job_id, started_at__isnull=True).update(started_at=timezone.now())
+
+    try:
+        distributor = _get_distributor(job)
+        if not job.checkpoints.exists():
+            plan = distributor.plan_migration()
+            MigrationCheckpoint.objects.bulk_create([
+                MigrationCheckpoint(
+                    job=job,
+                    fog_id=item['fog_id'],
+                    phase=item['phase'],
+                    chunk_key=item['chunk_key'],
+                    params=json.dumps(item['params'], default=str)
+                )
+                for item in plan
+            ], ignore_conflicts=True)
+            logger.info(f"迁移任务 {job_id} 规划完成，共 {len(plan)} 个检查点")
+
+        for checkpoint in job.checkpoints.filter(phase='prepare').exclude(status='done'):
+            _run_checkpoint(job, checkpoint, distributor)
+    except Exception as e:
+        logger.error(f"迁移任务 {job_id} 准备失败: {str(e)}")
+        _finish_migration_job(job_id, 'failed', str(e))
+        return
+
+    pending = list(job.checkpoints.filter(phase='chunk').exclude(status='done').values_list('id', flat=True))
+    for checkpoint_id in pending:
+        run_migration_chunk.delay(str(job_id), checkpoint_id)
+    logger.info(f"迁移任务 {job_id} 派发 {len(pending)} 个分块")
+    if not pending:
+        _maybe_finalize_migration_job(job_id)
+
+
+@shared_task(
+    bind=True,
+    time_limit=getattr(settings, 'MIGRATION_CHUNK_TIME_LIMIT', 1800),
+    soft_time_limit=getattr(settings, 'MIGRATION_CHUNK_TIME_LIMIT', 1800) - 60
+)
+def run_migration_chunk(self, job_id, checkpoint_id):
+    """执行一个迁移分块，失败时按MIGRATION_CHUNK_MAX_RETRIES重试；最后一个分块完成后执行收尾"""
+    try:
+        job = MigrationJob.objects.get(pk=job_id)
+        checkpoint = MigrationCheckpoint.objects.get(pk=checkpoint_id, job=job)
+    except (MigrationJob.DoesNotExist, MigrationCheckpoint.DoesNotExist):
+        logger.error(f"迁移任务 {job_id} 的分块 {checkpoint_id} 不存在")
+        return
+
+    # 已完成的分块（重复投递的任务）和已取消的任务直接跳过，未执行的分块保持待处理，恢复时继续
+    if job.is_finished or job.cancel_requested or checkpoint.status == 'done':
+        return
+
+    try:
+        _run_checkpoint(job, checkpoint, _get_distributor(job))
+    except Exception as e:
+        if self.request.retries < getattr(settings, 'MIGRATION_CHUNK_MAX_RETRIES', 3):
+            logger.warning(f"迁移任务 {job_id} 分块 {checkpoint.chunk_key} 失败，稍后重试: {str(e)}")
+            MigrationCheckpoint.objects.filter(pk=checkpoint_id).update(status='pending', updated_at=timezone.now())
+            raise self.retry(countdown=2 ** self.request.retries * 5)
+        logger.error(f"迁移任务 {job_id} 分块 {checkpoint.chunk_key} 重试后仍失败: {str(e)}")
+
+    _maybe_finalize_migration_job(job_id)
+
+
+def _maybe_finalize_migration_job(job_id):
+    """
+    所有分块结束后收尾
+
+    有失败的分块时任务失败，已完成的分块保留，恢复执行只重做失败部分；
+    否则执行各雾服务器的收尾阶段。只有把状态从running切换为finalizing的任务执行收尾。
+    """
+    job = MigrationJob.objects.get(pk=job_id)
+    chunks = job.checkpoints.filter(phase='chunk')
+    if job.is_finished or chunks.filter(status__in=('pending', 'running')).exists():
+        return
+
+    failed = chunks.filter(status='failed').count()
+    if failed:
+        _finish_migration_job(job_id, 'failed', f"{failed} 个分块写入失败，可恢复执行重试")
+        return
+
+    if not MigrationJob.objects.filter(pk=job_id, status='running', cancel_requested=False).update(
+        status='finalizing', updated_at=timezone.now()
+    ):
+        return
+
+    distributor = _get_distributor(job)
+    errors = []
+    for checkpoint in job.checkpoints.filter(phase='finalize').exclude(status='done'):
+        try:
+            _run_checkpoint(job, checkpoint, distributor)
+        except Exception as e:
+            # 各雾服务器的收尾相互独立，一个失败不影响其他雾服务器切换
+            errors.append(f"Fog{checkpoint.fog_id}: {str(e)}")
+    if errors:
+        logger.error(f"迁移任务 {job_id} 收尾失败: {'; '.join(errors)}")
+        _finish_migration_job(job_id, 'failed', f"收尾失败: {'; '.join(errors)}")
+    else:
+        _finish_migration_job(job_id, 'completed')
+        logger.info(f"迁移任务 {job_id} 完成")
+
+
+@shared_task(bind=True, time_limit=getattr(settings, 'TRACK_IMPORT_TIME_LIMIT', 6 * 3600),
+             soft_time_limit=getattr(settings, 'TRACK_IMPORT_TIME_LIMIT', 6 * 3600) - 60)
+def import_tracks(self, job_id, filters=None):
+    """
+    流式导入上传的轨迹文件（CSV或Parquet），每个分块提交后更新进度；结束后删除上传文件
     
-    # 更新缓存
-    cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
-    return stats 
\ No newline at end of file
+    filters为Parquet文件的读取条件 {'date_start', 'date_end', 'keyword'}
+    """
+    from .track_import import get_importer, ImportCancelled
+    from .track_parquet import parquet_filter
+
+    try:
+        job = TrackImportJob.objects.get(pk=job_id)
+    except TrackImportJob.DoesNotExist:
+        logger.error(f"导入任务 {job_id} 不存在")
+        return
+
+    if job.cancel_requested or job.is_finished:
+        logger.info(f"导入任务 {job_id} 已取消或已结束，跳过执行")
+        return
+
+    TrackImportJob.objects.filter(pk=job_id).update(status='running', started_at=timezone.now())
+
+    def progress(rows, bytes_read):
+        TrackImportJob.objects.filter(pk=job_id).update(rows_imported=rows, bytes_read=bytes_read)
+
+    def is_cancelled():
+        return TrackImportJob.objects.filter(pk=job_id, cancel_requested=True).exists()
+
+    importer = None
+    status, error = 'completed', None
+    try:
+        importer = get_importer(
+            job.file_path,
+            filter=parquet_filter(**filters) if filters else None,
+            progress=progress,
+            cancel_check=is_cancelled
+        )
+        importer.run()
+        logger.info(f"导入任务 {job_id} 完成，共导入 {importer.rows_imported} 行，跳过重复 {importer.rows_skipped} 行")
+    except ImportCancelled:
+        status = 'cancelled'
+        logger.info(f"导入任务 {job_id} 已取消，已导入 {importer.rows_imported} 行")
+    except Exception as e:
+        rows_imported = importer.rows_imported if importer is not None else 0
+        status, error = 'failed', f"{str(e)}（已提交 {rows_imported} 行）"
+        logger.error(f"导入任务 {job_id} 失败: {error}")
+    finally:
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+    rows_imported = importer.rows_imported if importer is not None else 0
+    TrackImportJob.objects.filter(pk=job_id).update(
+        status=status, error=error, rows_imported=rows_imported, finished_at=timezone.now()
+    )
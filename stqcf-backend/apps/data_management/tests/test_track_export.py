@@ -0,0 +1,37 @@
+import csv
+import gzip
+import json
+from io import StringIO
+
+from django.test import SimpleTestCase
+
+from apps.data_management.track_export import csv_chunks, json_array_chunks, ndjson_chunks, encode_chunks
+
+ROWS = [
+    [('t1', 't1_p000001', 30.5, 120.25, 20240101, 3600, 'a,b')],
+    [('t1', 't1_p000002', 30.6, 120.3, 20240101, 3660, ''), ('t2', 't2_p000001', 31.0, 121.0, 20240102, 0, '景点')],
+]
+
+
+class TrackExportTest(SimpleTestCase):
+    """轨迹流式导出编码测试"""
+
+    def test_csv_has_header_and_all_rows(self):
+        text = ''.join(csv_chunks(ROWS))
+        rows = list(csv.reader(StringIO(text)))
+        self.assertEqual(rows[0][0], 'tID')
+        self.assertEqual([row[1] for row in rows[1:]], ['t1_p000001', 't1_p000002', 't2_p000001'])
+
+    def test_json_array_and_ndjson_match(self):
+        records = json.loads(''.join(json_array_chunks(ROWS)))
+        lines = [json.loads(line) for line in ''.join(ndjson_chunks(ROWS)).splitlines()]
+        self.assertEqual(records, lines)
+        self.assertEqual(records[0]['keywords'], ['a', 'b'])
+        self.assertEqual(records[1]['keywords'], [])
+        self.assertEqual(records[2]['keyword'], '景点')
+        self.assertEqual(json.loads(''.join(json_array_chunks([]))), [])
+
+    def test_gzip_stream_decompresses_to_plain_output(self):
+        plain = b''.join(encode_chunks(csv_chunks(ROWS)))
+        compressed = b''.join(encode_chunks(csv_chunks(ROWS), compress=True, level=6))
+        self.assertEqual(gzip.decompress(compressed), plain)
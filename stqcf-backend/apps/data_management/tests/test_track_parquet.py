@@ -0,0 +1,38 @@
+import importlib.util
+import io
+import unittest
+
+from django.test import SimpleTestCase
+
+from apps.data_management.track_parquet import TRACK_ARROW_TYPES, parquet_chunks, parquet_filter, iter_parquet_chunks
+
+COLUMNS = ('track_id', 'point_id', 'latitude', 'longitude', 'date', 'time', 'keyword')
+ROWS = [
+    [('t1', 't1_p000001', 30.5, 120.25, 20240101, 3600, 'a,b'), ('t1', 't1_p000002', 30.6, 120.3, 20240102, 3660, '')],
+    [('t2', 't2_p000001', 31.0, 121.0, 20240103, 0, '景点')],
+]
+
+
+@unittest.skipUnless(importlib.util.find_spec('pyarrow'), '未安装pyarrow')
+class TrackParquetTest(SimpleTestCase):
+    """轨迹Parquet导出和读取测试"""
+
+    def test_each_chunk_is_a_row_group(self):
+        import pyarrow.parquet as pq
+        data = b''.join(parquet_chunks(ROWS, COLUMNS, TRACK_ARROW_TYPES))
+        parquet_file = pq.ParquetFile(io.BytesIO(data))
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+        self.assertEqual(parquet_file.read().to_pylist()[2]['keyword'], '景点')
+
+    def test_read_with_projection_and_filter(self):
+        import tempfile
+        with tempfile.NamedTemporaryFile(suffix='.parquet') as f:
+            f.write(b''.join(parquet_chunks(ROWS, COLUMNS, TRACK_ARROW_TYPES)))
+            f.flush()
+            rows = [row for chunk, names in iter_parquet_chunks(f.name, ('track_id', 'date'),
+                                                                 parquet_filter(20240102, None, None))
+                    for row in chunk]
+            self.assertEqual(rows, [('t1', 20240102), ('t2', 20240103)])
+            rows = [row for chunk, _ in iter_parquet_chunks(f.name, ('point_id',), parquet_filter(keyword='a'))
+                    for row in chunk]
+            self.assertEqual(rows, [('t1_p000001',)])
@@ -0,0 +1,30 @@
+from django.test import SimpleTestCase
+
+from apps.data_management.track_stats import TrackStatsDelta, split_keywords
+
+
+class TrackStatsDeltaTest(SimpleTestCase):
+    """轨迹统计增量测试"""
+
+    def test_split_keywords_dedupes_and_drops_empty(self):
+        self.assertEqual(split_keywords('a,b,,a'), {'a', 'b'})
+        self.assertEqual(split_keywords(''), set())
+
+    def test_update_moves_counts(self):
+        delta = TrackStatsDelta()
+        delta.add('a,b', 20240101)
+        delta.add('a,b', 20240101, sign=-1)
+        delta.add('b,c', 20240102)
+        self.assertEqual(delta.points, 1)
+        self.assertEqual(+delta.keywords, {'b': 1, 'c': 1})
+        self.assertEqual(delta.keywords['a'], 0)
+        self.assertEqual(+delta.dates, {20240102: 1})
+
+    def test_empty_delta_is_false(self):
+        delta = TrackStatsDelta()
+        self.assertFalse(delta)
+        delta.add('a', 1)
+        delta.add('a', 1, sign=-1)
+        self.assertFalse(delta)
+        delta.add_rows([('t', 'p', 0.0, 0.0, 2, 0, 'k')], keyword_index=6, date_index=4)
+        self.assertTrue(delta)
@@ -0,0 +1,93 @@
+import csv
+import json
+import zlib
+from io import StringIO
+from django.conf import settings
+from django.db.models import Q
+from .models import Track
+
+# 导出列，与Track模型的默认排序字段(track_id, point_id)开头
+EXPORT_COLUMNS = ('track_id', 'point_id', 'latitude', 'longitude', 'date', 'time', 'keyword')
+
+# CSV表头，与导入格式一致
+CSV_HEADER = ('tID', 'point_id', 'latitude', 'longitude', 'date', 'time', 'keyword')
+
+
+def iter_track_chunks(chunk_rows=None, queryset=None, columns=None):
+    """
+    按 (track_id, point_id) 键集分页读取轨迹点，每次产出最多chunk_rows行的元组列表
+
+    MySQL驱动会把整个结果集读入客户端内存，QuerySet.iterator()无法限制内存，
+    因此每个分块单独查询，从上一分块最后一行之后继续，借助唯一索引(track_id, point_id)定位。
+    queryset为已过滤的查询集（条件在MySQL中执行），columns为输出列，默认EXPORT_COLUMNS。
+    """
+    chunk_rows = chunk_rows or getattr(settings, 'TRACK_EXPORT_CHUNK_ROWS', 5000)
+    columns = tuple(columns or EXPORT_COLUMNS)
+    # 分页键总是读取，输出时再按columns投影
+    selected = ('track_id', 'point_id') + tuple(c for c in columns if c not in ('track_id', 'point_id'))
+    positions = [selected.index(c) for c in columns]
+    base = queryset if queryset is not None else Track.objects.all()
+    last = None
+    while True:
+        queryset = base.order_by('track_id', 'point_id')
+        if last is not None:
+            queryset = queryset.filter(Q(track_id__gt=last[0]) | Q(track_id=last[0], point_id__gt=last[1]))
+        rows = list(queryset.values_list(*selected)[:chunk_rows])
+        if not rows:
+            return
+        yield rows if selected == columns else [tuple(row[i] for i in positions) for row in rows]
+        if len(rows) < chunk_rows:
+            return
+        last = rows[-1][:2]
+
+
+def track_record(row):
+    """导出行对应的JSON对象，字段与TrackSerializer的输出一致"""
+    record = dict(zip(EXPORT_COLUMNS, row))
+    record['keywords'] = record['keyword'].split(',') if record['keyword'] else []
+    return record
+
+
+def csv_chunks(row_chunks):
+    """把行分块编码为CSV文本，首块为表头"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue()
+    for rows in row_chunks:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def json_array_chunks(row_chunks):
+    """把行分块编码为一个JSON数组，逐块输出"""
+    yield '['
+    separator = ''
+    for rows in row_chunks:
+        yield separator + ','.join(json.dumps(track_record(row), ensure_ascii=False) for row in rows)
+        separator = ','
+    yield ']'
+
+
+def ndjson_chunks(row_chunks):
+    """把行分块编码为NDJSON，每行一个JSON对象"""
+    for rows in row_chunks:
+        yield ''.join(json.dumps(track_record(row), ensure_ascii=False) + '\n' for row in rows)
+
+
+def encode_chunks(chunks, compress=False, level=None):
+    """把文本分块编码为UTF-8字节，compress为True时输出gzip流"""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+    level = level if level is not None else getattr(settings, 'TRACK_EXPORT_GZIP_LEVEL', 6)
+    # wbits=31 输出带gzip头和校验的流
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
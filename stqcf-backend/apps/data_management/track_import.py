@@ -0,0 +1,278 @@
+import io
+import os
+import csv
+import tempfile
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from .models import Track, TrackKeyword, split_keywords
+from .track_stats import TrackStatsDelta, apply_stats_delta
+
+# 导入文件必须包含的列
+REQUIRED_COLUMNS = ('tID', 'latitude', 'longitude', 'date', 'time', 'keyword')
+
+# 与Track模型字段顺序一致的导入列
+TRACK_COLUMNS = ('track_id', 'point_id', 'latitude', 'longitude', 'date', 'time', 'keyword')
+
+
+class ImportCancelled(Exception):
+    """导入在分块边界被取消"""
+    pass
+
+
+def get_point_id(track_id, index):
+    """生成点ID，与TrackViewSet.get_point_id一致"""
+    return f"{track_id}_p{index:06d}"
+
+
+class TrackChunkImporter:
+    """
+    轨迹分块导入器基类
+
+    子类的_iter_chunks()产出 (行元组列表, 已读取字节数)，行与TRACK_COLUMNS对应；
+    每个分块写入并单独提交事务，内存占用与文件大小无关。
+    MySQL开启local_infile且use_load_data为True时分块通过LOAD DATA LOCAL INFILE写入，
+    不可用时自动改用bulk_create。两种方式对重复的 (track_id, point_id) 都按IGNORE处理：
+    已存在的点保留原值，分块内重复的点只写入第一次出现的行。
+    失败时已提交的分块保留，rows_imported为实际写入的行数，rows_skipped为跳过的重复行数。
+    """
+
+    def __init__(self, path, chunk_rows=None, use_load_data=None, progress=None, cancel_check=None):
+        self.path = path
+        self.chunk_rows = chunk_rows or getattr(settings, 'TRACK_IMPORT_CHUNK_ROWS', 5000)
+        if use_load_data is None:
+            use_load_data = getattr(settings, 'TRACK_IMPORT_USE_LOAD_DATA', False)
+        self.use_load_data = use_load_data and connection.vendor == 'mysql'
+        self.progress = progress
+        self.cancel_check = cancel_check
+        self.rows_imported = 0
+        self.rows_skipped = 0
+
+    def run(self):
+        """执行导入，返回导入行数"""
+        for chunk, bytes_read in self._iter_chunks():
+            self._commit_chunk(chunk, bytes_read)
+        return self.rows_imported
+
+    def _iter_chunks(self):
+        raise NotImplementedError
+
+    def _commit_chunk(self, chunk, bytes_read):
+        if self.cancel_check is not None and self.cancel_check():
+            raise ImportCancelled()
+        inserted = self._insert_chunk(chunk)
+        self.rows_imported += inserted
+        self.rows_skipped += len(chunk) - inserted
+        if self.progress is not None:
+            self.progress(self.rows_imported, bytes_read)
+
+    def _insert_chunk(self, chunk):
+        """写入一个分块，每个分块一个事务，统计增量在同一事务中更新；返回实际写入的行数"""
+        if self.use_load_data:
+            try:
+                with transaction.atomic():
+                    return self._write_new_rows(chunk, self._load_data)
+            except DatabaseError as e:
+                print(f"LOAD DATA LOCAL INFILE不可用，改用bulk_create: {str(e)}")
+                self.use_load_data = False
+
+        with transaction.atomic():
+            return self._write_new_rows(chunk, self._bulk_create)
+
+    def _write_new_rows(self, chunk, write):
+        """只写入分块中的新点，关键词索引和统计增量只计入这些行"""
+        rows = self._new_rows(chunk)
+        if not rows:
+            return 0
+        write(rows)
+        self._index_keywords(rows)
+        delta = TrackStatsDelta()
+        delta.add_rows(rows, TRACK_COLUMNS.index('keyword'), TRACK_COLUMNS.index('date'))
+        apply_stats_delta(delta)
+        return len(rows)
+
+    def _new_rows(self, chunk):
+        """
+        去掉已存在和分块内重复的 (track_id, point_id)
+
+        查询已存在的点时加锁（InnoDB对唯一索引上的这些track_id范围加next-key锁），
+        事务提交前并发的导入不能写入同样的点，写入行数与返回的行一致。
+        """
+        existing = set(
+            Track.objects.select_for_update()
+            .filter(track_id__in={row[0] for row in chunk})
+            .order_by()
+            .values_list('track_id', 'point_id')
+        )
+        rows = []
+        for row in chunk:
+            key = (row[0], row[1])
+            if key in existing:
+                continue
+            existing.add(key)
+            rows.append(row)
+        return rows
+
+    def _bulk_create(self, rows):
+        Track.objects.bulk_create(
+            [Track(**dict(zip(TRACK_COLUMNS, row))) for row in rows],
+            batch_size=getattr(settings, 'TRACK_IMPORT_BATCH_SIZE', 1000),
+            ignore_conflicts=True
+        )
+
+    def _index_keywords(self, chunk):
+        """写入分块的关键词倒排索引（bulk_create和LOAD DATA不经过Track.save）"""
+        keyword_index = TRACK_COLUMNS.index('keyword')
+        keywords = {(row[0], row[1]): row[keyword_index] for row in chunk if row[keyword_index]}
+        if not keywords:
+            return
+        entries = []
+        points = Track.objects.filter(track_id__in={track_id for track_id, _ in keywords}).order_by()
+        for pk, track_id, point_id in points.values_list('id', 'track_id', 'point_id'):
+            for keyword in split_keywords(keywords.get((track_id, point_id))):
+                entries.append(TrackKeyword(track_id=pk, keyword=keyword))
+        TrackKeyword.objects.bulk_create(
+            entries, batch_size=getattr(settings, 'TRACK_IMPORT_BATCH_SIZE', 1000), ignore_conflicts=True
+        )
+
+    def _load_data(self, chunk):
+        """把分块写入临时文件后用LOAD DATA LOCAL INFILE IGNORE导入"""
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False, encoding='utf-8', newline='') as tmp:
+            writer = csv.writer(tmp, delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_NONE, escapechar='\\')
+            writer.writerows(chunk)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {Track._meta.db_table}
+                    CHARACTER SET utf8mb4
+                    FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                    LINES TERMINATED BY '\\n'
+                    ({', '.join(TRACK_COLUMNS)})
+                    """,
+                    [tmp.name]
+                )
+                inserted = cursor.rowcount
+        finally:
+            os.remove(tmp.name)
+        if inserted != len(chunk):
+            # 已存在的点在_new_rows中已去掉并加锁，行数不一致说明有行被丢弃，回滚该分块
+            raise RuntimeError(f"LOAD DATA写入 {inserted} 行，期望 {len(chunk)} 行")
+
+
+class TrackCsvImporter(TrackChunkImporter):
+    """
+    轨迹CSV流式导入器
+
+    逐行解析文件，每chunk_rows行作为一个分块写入。
+
+    用法:
+        importer = TrackCsvImporter(path, progress=lambda rows, bytes_read: ...)
+        rows = importer.run()
+    """
+
+    def _iter_chunks(self):
+        with open(self.path, 'rb') as raw:
+            text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+            reader = csv.DictReader(text)
+            missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"CSV缺少列: {', '.join(missing)}")
+
+            chunk = []
+            for row in self._parse_rows(reader):
+                chunk.append(row)
+                if len(chunk) >= self.chunk_rows:
+                    yield chunk, raw.tell()
+                    chunk = []
+            if chunk:
+                yield chunk, raw.tell()
+
+    def _parse_rows(self, reader):
+        """逐行解析并清洗数据，同一轨迹的连续行按出现顺序编号"""
+        current_track_id = None
+        point_counter = 0
+        for line_number, row in enumerate(reader, start=2):
+            track_id = row['tID']
+
+            # 如果是新的轨迹，重置计数器
+            if track_id != current_track_id:
+                current_track_id = track_id
+                point_counter = 0
+            point_counter += 1
+
+            try:
+                yield (
+                    track_id,
+                    get_point_id(track_id, point_counter),
+                    float(row['latitude']),
+                    float(row['longitude']),
+                    int(row['date']),
+                    int(row['time']),
+                    row['keyword'].strip() if row['keyword'] else ''
+                )
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"第 {line_number} 行数据格式错误: {str(e)}")
+
+
+class TrackParquetImporter(TrackChunkImporter):
+    """
+    轨迹Parquet导入器
+
+    按批读取列式文件，只读取导入需要的列；filter为pyarrow过滤表达式（见track_parquet.parquet_filter），
+    下推到行组过滤。列名与导出格式一致（track_id可写为tID），没有point_id列时按轨迹内顺序生成。
+    """
+
+    def __init__(self, path, filter=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.filter = filter
+
+    def _iter_chunks(self):
+        from .track_parquet import iter_parquet_chunks, parquet_columns, require_pyarrow
+
+        _, pq = require_pyarrow()
+        available = parquet_columns(self.path)
+        track_column = 'track_id' if 'track_id' in available else 'tID'
+        required = (track_column,) + tuple(c for c in TRACK_COLUMNS if c not in ('track_id', 'point_id'))
+        missing = [column for column in required if column not in available]
+        if missing:
+            raise ValueError(f"Parquet文件缺少列: {', '.join(missing)}")
+        has_point_id = 'point_id' in available
+        columns = required + (('point_id',) if has_point_id else ())
+
+        total_rows = max(pq.ParquetFile(self.path).metadata.num_rows, 1)
+        file_size = os.path.getsize(self.path)
+        rows_read = 0
+        current_track_id = None
+        point_counter = 0
+        for rows, names in iter_parquet_chunks(self.path, columns, self.filter, self.chunk_rows):
+            index = {name: i for i, name in enumerate(names)}
+            chunk = []
+            for row in rows:
+                track_id = str(row[index[track_column]])
+                if has_point_id:
+                    point_id = row[index['point_id']]
+                else:
+                    if track_id != current_track_id:
+                        current_track_id = track_id
+                        point_counter = 0
+                    point_counter += 1
+                    point_id = get_point_id(track_id, point_counter)
+                chunk.append((
+                    track_id,
+                    point_id,
+                    float(row[index['latitude']]),
+                    float(row[index['longitude']]),
+                    int(row[index['date']]),
+                    int(row[index['time']]),
+                    (row[index['keyword']] or '').strip()
+                ))
+            rows_read += len(rows)
+            # 过滤后读取的行数不代表文件位置，进度按行数估算字节数
+            yield chunk, min(file_size * rows_read // total_rows, file_size)
+
+
+def get_importer(path, filter=None, **kwargs):
+    """按文件扩展名选择导入器，filter只对Parquet文件有效"""
+    if path.endswith('.parquet'):
+        return TrackParquetImporter(path, filter=filter, **kwargs)
+    return TrackCsvImporter(path, **kwargs)
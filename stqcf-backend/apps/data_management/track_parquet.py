@@ -0,0 +1,175 @@
+import os
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Track导出列对应的Arrow类型
+TRACK_ARROW_TYPES = {
+    'track_id': 'string',
+    'point_id': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'date': 'int32',
+    'time': 'int32',
+    'keyword': 'string'
+}
+
+
+def require_pyarrow():
+    """导入pyarrow，未安装时抛出ImproperlyConfigured"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImproperlyConfigured("Parquet导入导出需要安装pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema(columns, types=None):
+    """按列名和类型表构造Arrow schema，types为None时返回None（由第一个分块推断）"""
+    if types is None:
+        return None
+    pa, _ = require_pyarrow()
+    return pa.schema([(column, getattr(pa, types[column])()) for column in columns])
+
+
+def rows_to_table(rows, columns, schema=None):
+    """把行元组列表转为列式的Arrow表"""
+    pa, _ = require_pyarrow()
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    arrays = [
+        pa.array(list(column_values), type=schema.field(i).type if schema is not None else None)
+        for i, column_values in enumerate(values)
+    ]
+    if schema is not None:
+        return pa.Table.from_arrays(arrays, schema=schema)
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+class _StreamSink:
+    """ParquetWriter的输出缓冲，take()取走已写入的字节"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def parquet_chunks(row_chunks, columns, types=None, compression=None):
+    """
+    把行分块编码为Parquet字节流，每个分块写为一个行组
+
+    Parquet的元数据在文件末尾，行组写完即可输出，内存占用为一个行组。
+    """
+    pa, pq = require_pyarrow()
+    compression = compression or getattr(settings, 'TRACK_PARQUET_COMPRESSION', 'zstd')
+    schema = arrow_schema(columns, types)
+    sink = _StreamSink()
+    writer = None
+    try:
+        for rows in row_chunks:
+            table = rows_to_table(rows, columns, schema)
+            if writer is None:
+                # 未指定类型时以第一个分块推断的schema约束后续分块
+                schema = table.schema
+                writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression=compression)
+            writer.write_table(table, row_group_size=len(rows))
+            yield sink.take()
+        if writer is None:
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema or rows_to_table([], columns).schema,
+                                      compression=compression)
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.take()
+
+
+def write_parquet(path, row_chunks, columns, types=None, compression=None):
+    """把行分块写入Parquet文件，写完后替换目标文件，返回写入行数"""
+    counter = [0]
+
+    def counted():
+        for rows in row_chunks:
+            counter[0] += len(rows)
+            yield rows
+
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            for data in parquet_chunks(counted(), columns, types, compression):
+                f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return counter[0]
+
+
+def parquet_filter(date_start=None, date_end=None, keyword=None):
+    """
+    按日期范围和关键词构造Parquet读取过滤条件，语义与轨迹列表接口一致
+
+    日期条件利用行组统计信息跳过不相关的行组；关键词匹配逗号分隔列表中的完整关键词。
+    """
+    if date_start is None and date_end is None and not keyword:
+        return None
+    require_pyarrow()
+    import pyarrow.compute as pc
+    conditions = []
+    if date_start is not None:
+        conditions.append(pc.field('date') >= int(date_start))
+    if date_end is not None:
+        conditions.append(pc.field('date') <= int(date_end))
+    if keyword:
+        field = pc.field('keyword')
+        conditions.append(
+            (field == keyword) | pc.starts_with(field, f'{keyword},') |
+            pc.ends_with(field, f',{keyword}') | pc.match_substring(field, f',{keyword},')
+        )
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def iter_parquet_chunks(path, columns=None, filter=None, batch_rows=None):
+    """
+    按批读取Parquet文件，只读取columns中的列，filter下推到行组过滤
+
+    Yields:
+        (行元组列表, 列名元组)
+    """
+    require_pyarrow()
+    import pyarrow.dataset as ds
+    batch_rows = batch_rows or getattr(settings, 'TRACK_PARQUET_BATCH_ROWS', 65536)
+    dataset = ds.dataset(path, format='parquet')
+    for batch in dataset.to_batches(columns=list(columns) if columns else None, filter=filter, batch_size=batch_rows):
+        if batch.num_rows == 0:
+            continue
+        data = batch.to_pydict()
+        names = tuple(batch.schema.names)
+        yield list(zip(*(data[name] for name in names))), names
+
+
+def parquet_columns(path):
+    """Parquet文件的列名"""
+    _, pq = require_pyarrow()
+    return tuple(pq.ParquetFile(path).schema_arrow.names)
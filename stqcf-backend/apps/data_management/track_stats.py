@@ -0,0 +1,118 @@
+from collections import Counter
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .models import Track, TrackStatistics, TrackKeywordStat, TrackDateStat, split_keywords
+
+# 统计汇总行的主键
+SUMMARY_ID = 1
+
+
+class TrackStatsDelta:
+    """
+    一次写入对统计的增量：总点数、每个关键词和每个日期的点数变化
+
+    用法:
+        delta = TrackStatsDelta()
+        delta.add(track.keyword, track.date)          # 新增
+        delta.add(old_keyword, old_date, sign=-1)     # 删除
+        apply_stats_delta(delta)
+    """
+
+    def __init__(self):
+        self.points = 0
+        self.keywords = Counter()
+        self.dates = Counter()
+
+    def add(self, keyword, date, sign=1):
+        self.points += sign
+        for k in split_keywords(keyword):
+            self.keywords[k] += sign
+        self.dates[date] += sign
+
+    def add_rows(self, rows, keyword_index, date_index, sign=1):
+        for row in rows:
+            self.add(row[keyword_index], row[date_index], sign)
+
+    def __bool__(self):
+        return bool(self.points or any(self.keywords.values()) or any(self.dates.values()))
+
+
+def apply_stats_delta(delta):
+    """
+    应用统计增量，应在写入轨迹点的同一事务中调用
+
+    先更新汇总行，汇总行的行锁使并发的增量和全量重建串行执行；
+    汇总行不存在（从未统计过）时改为全量重建，同一事务可以看到本次写入的轨迹点。
+    """
+    if not delta:
+        return
+    with transaction.atomic():
+        updated = TrackStatistics.objects.filter(pk=SUMMARY_ID).update(
+            total_points=F('total_points') + delta.points, updated_at=timezone.now()
+        )
+        if not updated:
+            rebuild_track_statistics()
+            return
+        _apply_counts(TrackKeywordStat, 'keyword', delta.keywords)
+        _apply_counts(TrackDateStat, 'date', delta.dates)
+
+
+def _apply_counts(model, field, counts):
+    changed = [key for key, count in counts.items() if count]
+    for key in changed:
+        if not model.objects.filter(**{field: key}).update(point_count=F('point_count') + counts[key]):
+            model.objects.create(**{field: key, 'point_count': counts[key]})
+    # 计数减到0的关键词和日期不再出现在统计中
+    model.objects.filter(**{f'{field}__in': changed, 'point_count__lte': 0}).delete()
+
+
+def rebuild_track_statistics():
+    """按tracks_table全量重建统计（GROUP BY在数据库中执行），用于首次统计和定期校正"""
+    with transaction.atomic():
+        summary, _ = TrackStatistics.objects.select_for_update().get_or_create(pk=SUMMARY_ID)
+
+        keyword_counts = Counter()
+        for keyword, count in Track.objects.exclude(keyword='').values_list('keyword').annotate(n=Count('id')).order_by():
+            for k in split_keywords(keyword):
+                keyword_counts[k] += count
+        date_counts = dict(Track.objects.values_list('date').annotate(n=Count('id')).order_by())
+
+        TrackKeywordStat.objects.all().delete()
+        TrackKeywordStat.objects.bulk_create(
+            [TrackKeywordStat(keyword=k, point_count=c) for k, c in keyword_counts.items()], batch_size=1000
+        )
+        TrackDateStat.objects.all().delete()
+        TrackDateStat.objects.bulk_create(
+            [TrackDateStat(date=d, point_count=c) for d, c in date_counts.items()], batch_size=1000
+        )
+
+        summary.total_points = sum(date_counts.values())
+        summary.rebuilt_at = timezone.now()
+        summary.save()
+    return summary
+
+
+def get_track_statistics():
+    """
+    读取轨迹统计，只访问统计表
+
+    Returns:
+        {'total_points', 'total_keywords', 'keywords_list', 'keyword_counts',
+         'date_start', 'date_end', 'updated_at'}
+    """
+    summary = TrackStatistics.objects.filter(pk=SUMMARY_ID).first()
+    if summary is None:
+        summary = rebuild_track_statistics()
+
+    keyword_counts = dict(TrackKeywordStat.objects.filter(point_count__gt=0).values_list('keyword', 'point_count'))
+    dates = TrackDateStat.objects.filter(point_count__gt=0).values_list('date', flat=True)
+    return {
+        'total_points': summary.total_points,
+        'total_keywords': len(keyword_counts),
+        'keywords_list': sorted(keyword_counts),
+        'keyword_counts': keyword_counts,
+        'date_start': dates.order_by('date').first(),
+        'date_end': dates.order_by('-date').first(),
+        'updated_at': summary.updated_at.isoformat() if summary.updated_at else None
+    }
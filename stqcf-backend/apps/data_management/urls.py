@@ -1,6 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TrackViewSet, execute_octree_migration, execute_trajectory_migration
+from .views import (
+    TrackViewSet,
+    execute_octree_migration,
+    execute_trajectory_migration,
+    migration_job_status,
+    cancel_migration_job,
+    resume_migration_job,
+)
 
 router = DefaultRouter()
 router.register(r'tracks', TrackViewSet)
@@ -9,4 +16,7 @@ urlpatterns = [
     path('', include(router.urls)),
     path('octree/migration/', execute_octree_migration, name='execute_octree_migration'),
     path('trajectory/migration/', execute_trajectory_migration, name='execute_trajectory_migration'),
+    path('migration/jobs/<uuid:job_id>/', migration_job_status, name='migration_job_status'),
+    path('migration/jobs/<uuid:job_id>/cancel/', cancel_migration_job, name='cancel_migration_job'),
+    path('migration/jobs/<uuid:job_id>/resume/', resume_migration_job, name='resume_migration_job'),
 ] 
\ No newline at end of file
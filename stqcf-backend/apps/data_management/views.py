@@ -1,29 +1,25 @@
-import csv
 import json
-from io import StringIO
 from django.db import transaction
-from django.db.models import Count
+from django.db.models import Count, Max
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser
 from rest_framework.pagination import PageNumberPagination
-from django.core.cache import cache
-from .models import Track
+from django.utils import timezone
+from django.conf import settings
+from django.core.exceptions import ValidationError, ImproperlyConfigured
+from .models import Track, MigrationJob, MigrationCheckpoint, TrackImportJob
 from .serializers import TrackSerializer
-from django.http import HttpResponse
-from django.http import JsonResponse
+from .track_stats import TrackStatsDelta, apply_stats_delta, get_track_statistics
+from .track_export import EXPORT_COLUMNS, iter_track_chunks, csv_chunks, json_array_chunks, ndjson_chunks, encode_chunks
+from django.http import StreamingHttpResponse
 import sys
 import os
 import traceback
 
-STATS_CACHE_KEY = 'track_statistics'
-STATS_CACHE_TIMEOUT = 3600  # 1小时
-
-# 导入OctreeDataDistributor类
+# 数据迁移脚本位于项目根目录，由迁移任务在worker中导入
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from process_octree_data import OctreeDataDistributor
-from process_trajectory_data import TrajectoryDataDistributor
 
 class TrackPagination(PageNumberPagination):
     """轨迹数据分页器"""
@@ -42,27 +38,30 @@ class TrackViewSet(viewsets.ModelViewSet):
         """生成点ID"""
         return f"{track_id}_p{index:06d}"
 
-    def list(self, request, *args, **kwargs):
-        """获取轨迹列表，支持过滤"""
-        queryset = self.get_queryset()
-        
+    def filter_tracks(self, queryset, params):
+        """按track_id、关键词和日期范围过滤轨迹"""
         # 支持按track_id过滤
-        track_id = request.query_params.get('track_id', None)
+        track_id = params.get('track_id', None)
         if track_id:
             queryset = queryset.filter(track_id=track_id)
             
-        # 支持按关键词过滤
-        keyword = request.query_params.get('keyword', None)
+        # 支持按关键词过滤（通过关键词倒排索引连接）
+        keyword = params.get('keyword', None)
         if keyword:
-            queryset = queryset.filter(keyword__contains=keyword)
+            queryset = queryset.filter(keyword_entries__keyword=keyword)
             
         # 支持按日期范围过滤
-        date_start = request.query_params.get('date_start', None)
-        date_end = request.query_params.get('date_end', None)
+        date_start = params.get('date_start', None)
+        date_end = params.get('date_end', None)
         if date_start:
             queryset = queryset.filter(date__gte=date_start)
         if date_end:
             queryset = queryset.filter(date__lte=date_end)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """获取轨迹列表，支持过滤"""
+        queryset = self.filter_tracks(self.get_queryset(), request.query_params)
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -72,146 +71,213 @@ class TrackViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            track = serializer.save()
+            delta = TrackStatsDelta()
+            delta.add(track.keyword, track.date)
+            apply_stats_delta(delta)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            old_keyword, old_date = Track.objects.select_for_update().values_list('keyword', 'date').get(
+                pk=serializer.instance.pk
+            )
+            track = serializer.save()
+            delta = TrackStatsDelta()
+            delta.add(old_keyword, old_date, sign=-1)
+            delta.add(track.keyword, track.date)
+            apply_stats_delta(delta)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            delta = TrackStatsDelta()
+            delta.add(instance.keyword, instance.date, sign=-1)
+            instance.delete()
+            apply_stats_delta(delta)
+
     @action(detail=False, methods=['GET'])
     def statistics(self, request):
-        """获取轨迹点统计信息"""
-        # 尝试从缓存获取统计数据
-        cached_stats = cache.get(STATS_CACHE_KEY)
-        if cached_stats:
-            return Response(cached_stats)
-
-        # 如果缓存未命中，则计算统计数据
-        total_points = Track.objects.count()
-        
-        # 使用数据库聚合来优化关键词统计
-        keywords = Track.objects.exclude(keyword='').values_list('keyword', flat=True)
-        unique_keywords = set()
-        for kw in keywords:
-            if kw:
-                unique_keywords.update(kw.split(','))
-        unique_keywords.discard('')
-        
-        stats = {
-            'total_points': total_points,
-            'total_keywords': len(unique_keywords),
-            'keywords_list': sorted(list(unique_keywords))
-        }
-        
-        # 将结果存入缓存
-        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
-        
-        return Response(stats)
+        """获取轨迹点统计信息，读取增量维护的统计表"""
+        return Response(get_track_statistics())
 
     @action(detail=False, methods=['POST'])
     def import_csv(self, request):
-        """导入CSV文件"""
-        if 'file' not in request.FILES:
-            return Response({'error': '未提供文件'}, status=status.HTTP_400_BAD_REQUEST)
-
-        file = request.FILES['file']
-        if not file.name.endswith('.csv'):
-            return Response({'error': '仅支持CSV文件'}, status=status.HTTP_400_BAD_REQUEST)
+        """
+        导入CSV文件
+        
+        上传文件分块保存到TRACK_IMPORT_DIR后提交导入任务，立即返回202和任务ID；
+        导入在Celery worker中流式解析、分块提交，进度通过 import_jobs/<job_id>/ 查询。
+        """
+        return _submit_track_import(request, '.csv', '仅支持CSV文件')
 
-        # 读取CSV文件
-        content = file.read().decode('utf-8')
-        csv_file = StringIO(content)
-        reader = csv.DictReader(csv_file)
+    @action(detail=False, methods=['POST'])
+    def import_parquet(self, request):
+        """
+        导入Parquet文件
+        
+        与import_csv相同以后台任务执行；可选的 date_start、date_end、keyword 条件下推到行组过滤，
+        只导入满足条件的轨迹点。
+        """
+        filters = {
+            name: request.data.get(name)
+            for name in ('date_start', 'date_end', 'keyword')
+            if request.data.get(name) not in (None, '')
+        }
+        return _submit_track_import(request, '.parquet', '仅支持Parquet文件', filters)
 
+    @action(detail=False, methods=['GET'], url_path=r'import_jobs/(?P<job_id>[0-9a-f-]+)')
+    def import_job_status(self, request, job_id=None):
+        """查询CSV导入任务的状态和进度"""
         try:
-            with transaction.atomic():
-                tracks = []
-                current_track_id = None
-                point_counter = 0
-
-                for row in reader:
-                    track_id = row['tID']
-                    
-                    # 如果是新的轨迹，重置计数器
-                    if track_id != current_track_id:
-                        current_track_id = track_id
-                        point_counter = 0
-
-                    point_counter += 1
-                    point_id = self.get_point_id(track_id, point_counter)
-
-                    # 数据清洗和预处理
-                    keyword = row['keyword'].strip() if row['keyword'] else ''
-                    
-                    track = Track(
-                        track_id=track_id,
-                        point_id=point_id,
-                        latitude=float(row['latitude']),
-                        longitude=float(row['longitude']),
-                        date=int(row['date']),
-                        time=int(row['time']),
-                        keyword=keyword
-                    )
-                    tracks.append(track)
+            job = TrackImportJob.objects.get(pk=job_id)
+        except (TrackImportJob.DoesNotExist, ValueError, ValidationError):
+            return Response({'error': '导入任务不存在'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_import_job_summary(job))
 
-                Track.objects.bulk_create(tracks)
-                return Response({'message': f'成功导入 {len(tracks)} 条记录'})
-
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    @action(detail=False, methods=['POST'], url_path=r'import_jobs/(?P<job_id>[0-9a-f-]+)/cancel')
+    def cancel_import_job(self, request, job_id=None):
+        """取消CSV导入任务，已提交的分块保留"""
+        try:
+            job = TrackImportJob.objects.get(pk=job_id)
+        except (TrackImportJob.DoesNotExist, ValueError, ValidationError):
+            return Response({'error': '导入任务不存在'}, status=status.HTTP_404_NOT_FOUND)
+        if job.is_finished:
+            return Response({'error': f'导入任务已结束，当前状态: {job.status}'}, status=status.HTTP_409_CONFLICT)
+        
+        TrackImportJob.objects.filter(pk=job_id).update(cancel_requested=True)
+        # 仍在排队的任务直接取消，执行中的任务在下一个分块边界结束
+        TrackImportJob.objects.filter(pk=job_id, status='pending').update(status='cancelled', finished_at=timezone.now())
+        job.refresh_from_db()
+        return Response(_import_job_summary(job))
 
     @action(detail=False, methods=['GET'])
     def export_csv(self, request):
-        """导出CSV文件"""
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['tID', 'point_id', 'latitude', 'longitude', 'date', 'time', 'keyword'])
+        """
+        导出CSV文件
+        
+        分块读取并流式输出，内存占用与数据量无关；?gzip=1 时输出gzip压缩文件
+        """
+        return _streaming_export(request, csv_chunks(iter_track_chunks()), 'tracks.csv', 'text/csv')
 
-        tracks = Track.objects.all()
-        for track in tracks:
-            writer.writerow([
-                track.track_id,
-                track.point_id,
-                track.latitude,
-                track.longitude,
-                track.date,
-                track.time,
-                track.keyword
-            ])
+    @action(detail=False, methods=['GET'])
+    def export_json(self, request):
+        """
+        导出JSON文件
+        
+        默认流式输出JSON数组；?ndjson=1 时输出NDJSON（每行一个轨迹点），?gzip=1 时输出gzip压缩文件
+        """
+        if request.query_params.get('ndjson') == '1':
+            return _streaming_export(request, ndjson_chunks(iter_track_chunks()), 'tracks.ndjson', 'application/x-ndjson')
+        return _streaming_export(request, json_array_chunks(iter_track_chunks()), 'tracks.json', 'application/json')
 
-        response = HttpResponse(
-            output.getvalue(),
-            content_type='text/csv',
-            headers={'Content-Disposition': 'attachment; filename="tracks.csv"'},
-        )
+    @action(detail=False, methods=['GET'])
+    def export_parquet(self, request):
+        """
+        导出Parquet文件
+        
+        支持与列表相同的 track_id、keyword、date_start、date_end 过滤（在MySQL中执行），
+        ?columns=track_id,date,... 只导出指定列；每个读取分块写为一个行组，流式输出。
+        """
+        from .track_parquet import parquet_chunks, require_pyarrow, TRACK_ARROW_TYPES
+        
+        try:
+            require_pyarrow()
+        except ImproperlyConfigured as e:
+            return Response({'error': str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        
+        columns = EXPORT_COLUMNS
+        if request.query_params.get('columns'):
+            columns = tuple(c.strip() for c in request.query_params['columns'].split(',') if c.strip())
+            unknown = [c for c in columns if c not in EXPORT_COLUMNS]
+            if unknown or not columns:
+                return Response({'error': f"未知的列: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = self.filter_tracks(Track.objects.all(), request.query_params)
+        chunk_rows = getattr(settings, 'TRACK_PARQUET_ROW_GROUP_ROWS', 100000)
+        chunks = parquet_chunks(iter_track_chunks(chunk_rows, queryset, columns), columns, TRACK_ARROW_TYPES)
+        response = StreamingHttpResponse(chunks, content_type='application/vnd.apache.parquet')
+        response['Content-Disposition'] = 'attachment; filename="tracks.parquet"'
         return response
 
-    @action(detail=False, methods=['GET'])
-    def export_json(self, request):
-        """导出JSON文件"""
-        tracks = Track.objects.all()
-        serializer = TrackSerializer(tracks, many=True)
+def _submit_track_import(request, extension, extension_error, filters=None):
+    """保存上传文件并提交导入任务，返回202和任务摘要"""
+    from .tasks import import_tracks
+    
+    if 'file' not in request.FILES:
+        return Response({'error': '未提供文件'}, status=status.HTTP_400_BAD_REQUEST)
+
+    file = request.FILES['file']
+    if not file.name.endswith(extension):
+        return Response({'error': extension_error}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        import_dir = getattr(settings, 'TRACK_IMPORT_DIR', os.path.join(settings.BASE_DIR, 'uploads', 'track_imports'))
+        os.makedirs(import_dir, exist_ok=True)
+        job = TrackImportJob.objects.create(file_name=file.name, file_size=file.size)
+        file_path = os.path.join(import_dir, f'{job.id}{extension}')
+        with open(file_path, 'wb') as f:
+            for chunk in file.chunks():
+                f.write(chunk)
+        TrackImportJob.objects.filter(pk=job.id).update(file_path=file_path)
         
-        response = JsonResponse(
-            serializer.data, 
-            safe=False,
-            json_dumps_params={'ensure_ascii': False}
+        async_result = import_tracks.delay(str(job.id), filters or None)
+        TrackImportJob.objects.filter(pk=job.id).update(celery_task_id=async_result.id)
+        job.refresh_from_db()
+        return Response(
+            {'message': f'已提交导入任务，文件大小 {file.size} 字节', 'data': _import_job_summary(job)},
+            status=status.HTTP_202_ACCEPTED
         )
-        response['Content-Disposition'] = 'attachment; filename="tracks.json"'
-        return response 
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['POST'])
-@permission_classes([])  # 允许所有用户访问
-def execute_octree_migration(request):
-    """
-    执行八叉树数据迁移脚本
-    
-    请求体:
-        {
-            "confirm": true  # 确认执行迁移操作
-        }
+def _streaming_export(request, chunks, filename, content_type):
+    """以附件形式流式返回导出内容，?gzip=1 时压缩为 filename.gz"""
+    compress = request.query_params.get('gzip') == '1'
+    if compress:
+        filename, content_type = f'{filename}.gz', 'application/gzip'
+    response = StreamingHttpResponse(encode_chunks(chunks, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def _import_job_summary(job):
+    """CSV导入任务的状态摘要"""
+    return {
+        'job_id': str(job.id),
+        'file_name': job.file_name,
+        'status': job.status,
+        'file_size': job.file_size,
+        'bytes_read': job.bytes_read,
+        'percent': job.percent,
+        'rows_imported': job.rows_imported,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def _migration_job_summary(job):
+    """数据迁移任务的状态摘要和按检查点统计的进度"""
+    return {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'version': job.version,
+        'error': job.error,
+        'cancel_requested': job.cancel_requested,
+        'progress': job.get_progress(),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def _submit_migration_job(request, kind, label):
+    """创建数据迁移任务并提交到Celery，立即返回任务ID"""
+    from .tasks import run_migration_job
     
-    返回:
-        迁移任务的状态和结果信息
-    """
     try:
-        print(f"收到八叉树数据迁移请求: {request.method}")
+        print(f"收到{label}请求: {request.method}")
         print(f"请求路径: {request.path}")
-        print(f"请求头: {request.headers}")
         print(f"请求体: {request.data}")
         
         # 检查confirm参数
@@ -222,22 +288,23 @@ def execute_octree_migration(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 执行脚本
-        distributor = OctreeDataDistributor()
-        success, message = distributor.run()
-        
-        response_data = {"status": "success", "message": message} if success else {"status": "error", "message": message}
-        print(f"响应数据: {response_data}")
-        
-        if success:
-            return Response(response_data)
-        else:
+        # 同一类型的迁移同时只能有一个在执行，未结束的任务应恢复或取消
+        active = MigrationJob.objects.filter(kind=kind).exclude(status__in=MigrationJob.FINISHED_STATUSES).first()
+        if active is not None:
             return Response(
-                response_data,
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"status": "error", "message": f"已有未结束的{label}任务", "data": _migration_job_summary(active)},
+                status=status.HTTP_409_CONFLICT
             )
+        
+        job = MigrationJob.objects.create(kind=kind)
+        async_result = run_migration_job.delay(str(job.id))
+        MigrationJob.objects.filter(pk=job.id).update(celery_task_id=async_result.id)
+        
+        response_data = {"status": "success", "message": f"{label}任务已提交", "data": _migration_job_summary(job)}
+        print(f"响应数据: {response_data}")
+        return Response(response_data, status=status.HTTP_202_ACCEPTED)
     except Exception as e:
-        error_message = f"处理八叉树数据迁移请求时出错: {str(e)}"
+        error_message = f"处理{label}请求时出错: {str(e)}"
         print(error_message)
         traceback.print_exc()
         return Response(
@@ -245,11 +312,33 @@ def execute_octree_migration(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['POST'])
+@permission_classes([])  # 允许所有用户访问
+def execute_octree_migration(request):
+    """
+    提交八叉树数据迁移任务
+    
+    迁移在Celery worker中按雾服务器和节点范围分块执行，进度保存在检查点中，
+    通过 migration/jobs/<job_id>/ 查询。
+    
+    请求体:
+        {
+            "confirm": true  # 确认执行迁移操作
+        }
+    
+    返回:
+        202，迁移任务的ID和状态
+    """
+    return _submit_migration_job(request, 'octree', '八叉树数据迁移')
+
 @api_view(['POST'])
 @permission_classes([])  # 允许所有用户访问
 def execute_trajectory_migration(request):
     """
-    执行轨迹数据迁移脚本
+    提交轨迹数据迁移任务
+    
+    迁移在Celery worker中按雾服务器和关键词分块执行，进度保存在检查点中，
+    通过 migration/jobs/<job_id>/ 查询。
     
     请求体:
         {
@@ -257,41 +346,123 @@ def execute_trajectory_migration(request):
         }
     
     返回:
-        迁移任务的状态和结果信息
+        202，迁移任务的ID和状态
+    """
+    return _submit_migration_job(request, 'trajectory', '轨迹数据迁移')
+
+@api_view(['GET'])
+@permission_classes([])
+def migration_job_status(request, job_id):
+    """
+    查询数据迁移任务的状态和进度
+    
+    参数:
+        checkpoints: 为1时返回未完成和失败的检查点明细
     """
     try:
-        print(f"收到轨迹数据迁移请求: {request.method}")
-        print(f"请求路径: {request.path}")
-        print(f"请求头: {request.headers}")
-        print(f"请求体: {request.data}")
-        
-        # 检查confirm参数
-        confirm = request.data.get('confirm', False)
-        if not confirm:
-            return Response(
-                {"error": "请确认执行迁移操作", "hint": "设置 confirm=true 以确认"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # 执行脚本
-        distributor = TrajectoryDataDistributor()
-        success, message = distributor.run()
-        
-        response_data = {"status": "success", "message": message} if success else {"status": "error", "message": message}
-        print(f"响应数据: {response_data}")
-        
-        if success:
-            return Response(response_data)
-        else:
+        job = MigrationJob.objects.get(pk=job_id)
+    except MigrationJob.DoesNotExist:
+        return Response({"status": "error", "message": "迁移任务不存在"}, status=status.HTTP_404_NOT_FOUND)
+    
+    data = _migration_job_summary(job)
+    if request.query_params.get('checkpoints') == '1':
+        data['checkpoints'] = [
+            {
+                'fog_id': checkpoint.fog_id,
+                'phase': checkpoint.phase,
+                'chunk_key': checkpoint.chunk_key,
+                'status': checkpoint.status,
+                'attempts': checkpoint.attempts,
+                'error': checkpoint.error
+            }
+            for checkpoint in job.checkpoints.exclude(status='done')
+        ]
+    return Response({"status": "success", "data": data})
+
+@api_view(['POST'])
+@permission_classes([])
+def cancel_migration_job(request, job_id):
+    """
+    取消数据迁移任务
+    
+    尚未开始的分块不再执行，正在执行的分块写完后结束；已完成的检查点保留，可以恢复执行。
+    八叉树迁移在收尾前取消时，查询继续使用原版本。
+    """
+    from .tasks import run_migration_job
+    
+    try:
+        job = MigrationJob.objects.get(pk=job_id)
+    except MigrationJob.DoesNotExist:
+        return Response({"status": "error", "message": "迁移任务不存在"}, status=status.HTTP_404_NOT_FOUND)
+    
+    if job.is_finished:
+        return Response(
+            {"status": "error", "message": f"迁移任务已结束，当前状态: {job.status}"},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    MigrationJob.objects.filter(pk=job_id).exclude(status__in=MigrationJob.FINISHED_STATUSES).update(
+        cancel_requested=True, status='cancelled', finished_at=timezone.now(), updated_at=timezone.now()
+    )
+    if job.celery_task_id:
+        run_migration_job.app.control.revoke(job.celery_task_id)
+    
+    job.refresh_from_db()
+    print(f"取消迁移任务 {job_id}，当前状态: {job.status}")
+    return Response({"status": "success", "data": _migration_job_summary(job)})
+
+@api_view(['POST'])
+@permission_classes([])
+def resume_migration_job(request, job_id):
+    """
+    恢复执行失败、已取消或中断的数据迁移任务
+    
+    已完成的检查点跳过，其余检查点重置为待处理后重新派发；分块写入是幂等的。
+    未结束的任务（待处理、执行中、收尾中）和仍有分块在执行的任务（如刚取消的任务）
+    只有在超过MIGRATION_CHUNK_TIME_LIMIT没有任何进展（worker已崩溃）时才能恢复，
+    否则重新派发会再次执行准备阶段清空雾服务器上的表，并与仍在执行的分块并发写入。
+    """
+    from .tasks import run_migration_job
+    
+    try:
+        job = MigrationJob.objects.get(pk=job_id)
+    except MigrationJob.DoesNotExist:
+        return Response({"status": "error", "message": "迁移任务不存在"}, status=status.HTTP_404_NOT_FOUND)
+    
+    if job.status == 'completed':
+        return Response(
+            {"status": "error", "message": "迁移任务已完成"},
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    checkpoints = MigrationCheckpoint.objects.filter(job=job)
+    if not job.is_finished or checkpoints.filter(status='running').exists():
+        # 任务和检查点的最近更新时间都早于分块时间上限，说明执行它的worker已不存在
+        last_progress = max(filter(None, [
+            job.updated_at,
+            checkpoints.aggregate(latest=Max('updated_at'))['latest']
+        ]))
+        stale_after = getattr(settings, 'MIGRATION_CHUNK_TIME_LIMIT', 1800)
+        if (timezone.now() - last_progress).total_seconds() < stale_after:
             return Response(
-                response_data,
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"status": "error", "message": f"迁移任务仍在执行中，当前状态: {job.status}"},
+                status=status.HTTP_409_CONFLICT
             )
-    except Exception as e:
-        error_message = f"处理轨迹数据迁移请求时出错: {str(e)}"
-        print(error_message)
-        traceback.print_exc()
+    
+    # 条件更新：检查之后状态已被其他请求或worker改变时不再恢复
+    if not MigrationJob.objects.filter(pk=job_id, status=job.status, updated_at=job.updated_at).update(
+        status='pending', cancel_requested=False, error=None, finished_at=None, updated_at=timezone.now()
+    ):
         return Response(
-            {"status": "error", "message": error_message},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        ) 
\ No newline at end of file
+            {"status": "error", "message": "迁移任务状态已变化，请刷新后重试"},
+            status=status.HTTP_409_CONFLICT
+        )
+    MigrationCheckpoint.objects.filter(job=job).exclude(status='done').update(
+        status='pending', error=None, updated_at=timezone.now()
+    )
+    async_result = run_migration_job.delay(str(job.id))
+    MigrationJob.objects.filter(pk=job_id).update(celery_task_id=async_result.id)
+    
+    job.refresh_from_db()
+    print(f"恢复迁移任务 {job_id}")
+    return Response({"status": "success", "data": _migration_job_summary(job)}, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,208 @@
+import time
+import random
+import threading
+from cassandra.query import BatchStatement, BatchType
+from django.conf import settings
+
+
+class BulkWriteError(Exception):
+    """批次在重试后仍然写入失败"""
+    pass
+
+
+class CassandraBulkWriter:
+    """
+    Cassandra批量写入器
+
+    按分区键缓存行，同一分区的行合并为UNLOGGED批次（单分区批次在协调节点上是一次写入）；
+    批次的路由键取自第一条绑定语句，由驱动的TokenAwarePolicy直接发往分区副本。
+    并发按写入延迟自适应（AIMD）：批次延迟低于目标时并发加一，超过目标或出现超时时减半；
+    每个调整窗口最多减半一次——在上次减半之前发出的批次反映的是旧的并发，它们的慢响应不再触发减半。
+    失败的批次按带随机抖动的指数退避延迟重试。达到并发上限时add()阻塞，形成对上游加密/读取的背压。
+
+    用法:
+        writer = CassandraBulkWriter(session, insert_stmt, partition_key_indexes=(0, 1))
+        for params in rows:
+            writer.add(params)
+        report = writer.close()
+    """
+
+    def __init__(self, session, statement, partition_key_indexes=(0,), name='bulk',
+                 max_batch_rows=None, max_batch_bytes=None, max_buffered_rows=None,
+                 initial_concurrency=None, max_concurrency=None, target_latency=None, max_retries=3,
+                 retry_backoff=None, retry_backoff_max=None):
+        self.session = session
+        self.statement = statement
+        self.partition_key_indexes = tuple(partition_key_indexes)
+        self.name = name
+        self.max_batch_rows = max_batch_rows or getattr(settings, 'INGEST_BATCH_MAX_ROWS', 100)
+        # Cassandra默认batch_size_fail_threshold为50KB，批次大小留出余量
+        self.max_batch_bytes = max_batch_bytes or getattr(settings, 'INGEST_BATCH_MAX_BYTES', 32 * 1024)
+        self.max_buffered_rows = max_buffered_rows or getattr(settings, 'INGEST_MAX_BUFFERED_ROWS', 20000)
+        self.min_concurrency = 1
+        self.max_concurrency = max_concurrency or getattr(settings, 'INGEST_MAX_CONCURRENCY', 64)
+        self.concurrency = min(initial_concurrency or getattr(settings, 'INGEST_INITIAL_CONCURRENCY', 8),
+                               self.max_concurrency)
+        self.target_latency = target_latency or getattr(settings, 'INGEST_TARGET_BATCH_LATENCY', 0.2)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff if retry_backoff is not None else getattr(settings, 'INGEST_RETRY_BACKOFF', 0.1)
+        self.retry_backoff_max = (retry_backoff_max if retry_backoff_max is not None
+                                  else getattr(settings, 'INGEST_RETRY_BACKOFF_MAX', 5))
+
+        self._buffers = {}  # 分区键 -> [(参数, 估算字节数)]
+        self._buffered_rows = 0
+        self._in_flight = 0
+        self._retry_queue = []  # 失败待重试的批次 [(可重试时间, 行列表, 已重试次数)]
+        self._last_decrease = float('-inf')  # 上次减半并发的时间，之前发出的批次不再触发减半
+        self._errors = []
+        self._cond = threading.Condition()
+        self._started = time.monotonic()
+        self._latencies = []
+        self._stats = {
+            'rows': 0, 'batches': 0, 'bytes': 0, 'retries': 0,
+            'failed_rows': 0, 'throttled': 0, 'max_concurrency_reached': self.concurrency
+        }
+
+    def add(self, params):
+        """添加一行参数，所在分区的缓存达到批次上限时立即发送"""
+        key = tuple(params[i] for i in self.partition_key_indexes)
+        size = self._estimate_size(params)
+        buffer = self._buffers.setdefault(key, [])
+        if buffer and (len(buffer) >= self.max_batch_rows or
+                       sum(s for _, s in buffer) + size > self.max_batch_bytes):
+            self._dispatch(self._buffers.pop(key))
+            buffer = self._buffers.setdefault(key, [])
+        buffer.append((params, size))
+        self._buffered_rows += 1
+        if self._buffered_rows >= self.max_buffered_rows:
+            self.flush_buffers()
+
+    def add_all(self, params_iter):
+        for params in params_iter:
+            self.add(params)
+
+    def flush_buffers(self):
+        """发送所有缓存中的分区，不等待写入完成"""
+        buffers, self._buffers = self._buffers, {}
+        for rows in buffers.values():
+            self._dispatch(rows)
+
+    def close(self):
+        """
+        发送剩余数据并等待全部批次完成
+
+        Returns:
+            吞吐报告；有批次重试后仍失败时抛出BulkWriteError
+        """
+        self.flush_buffers()
+        with self._cond:
+            while self._in_flight or self._retry_queue:
+                self._drain_retries_locked()
+                if self._in_flight or self._retry_queue:
+                    # 等待在途批次完成或下一个重试批次的退避到期
+                    self._cond.wait(min([0.1] + [max(ready_at - time.monotonic(), 0)
+                                                 for ready_at, _, _ in self._retry_queue]))
+        report = self.report()
+        print(f"✓ {self.name} 写入完成: {report['rows']} 行 / {report['batches']} 个批次, "
+              f"{report['rows_per_second']:.0f} 行/秒, 批次延迟p95 {report['p95_latency'] * 1000:.0f}ms, "
+              f"并发 {report['final_concurrency']}")
+        if self._errors:
+            raise BulkWriteError(f"{self.name}: {self._stats['failed_rows']} 行写入失败: {self._errors[0]}")
+        return report
+
+    def report(self):
+        """吞吐报告：行数、批次数、字节数、每秒行数/字节数、批次延迟、最终并发、重试和失败行数"""
+        with self._cond:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            latencies = sorted(self._latencies)
+            return dict(
+                self._stats,
+                elapsed=elapsed,
+                rows_per_second=self._stats['rows'] / elapsed,
+                bytes_per_second=self._stats['bytes'] / elapsed,
+                avg_latency=sum(latencies) / len(latencies) if latencies else 0.0,
+                p95_latency=latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                final_concurrency=self.concurrency
+            )
+
+    def _dispatch(self, rows):
+        self._buffered_rows -= len(rows)
+        with self._cond:
+            self._drain_retries_locked()
+            self._submit_locked(rows, 0)
+
+    def _drain_retries_locked(self):
+        """发送退避已到期的重试批次"""
+        now = time.monotonic()
+        ready = [item for item in self._retry_queue if item[0] <= now]
+        if not ready:
+            return
+        self._retry_queue = [item for item in self._retry_queue if item[0] > now]
+        for _, rows, attempt in ready:
+            self._submit_locked(rows, attempt)
+
+    def _submit_locked(self, rows, attempt):
+        """在持有锁的情况下等待并发名额并异步执行批次"""
+        if self._in_flight >= self.concurrency:
+            self._stats['throttled'] += 1
+        while self._in_flight >= self.concurrency:
+            self._cond.wait()
+        batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+        for params, _ in rows:
+            batch.add(self.statement, params)
+        self._in_flight += 1
+        started = time.monotonic()
+        future = self.session.execute_async(batch)
+        future.add_callbacks(
+            callback=self._on_success, callback_args=(rows, started),
+            errback=self._on_error, errback_args=(rows, attempt, started)
+        )
+
+    def _decrease_locked(self, started):
+        """并发减半，每个调整窗口最多一次：上次减半之前发出的批次不再触发"""
+        if started <= self._last_decrease:
+            return
+        self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        self._last_decrease = time.monotonic()
+
+    def _on_success(self, _, rows, started):
+        latency = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            self._latencies.append(latency)
+            self._stats['rows'] += len(rows)
+            self._stats['batches'] += 1
+            self._stats['bytes'] += sum(size for _, size in rows)
+            if latency > self.target_latency:
+                self._decrease_locked(started)
+            elif self._in_flight + 1 >= self.concurrency:
+                # 只在并发名额用满时增加，避免空闲时并发无限增长
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self._stats['max_concurrency_reached'] = max(self._stats['max_concurrency_reached'], self.concurrency)
+            self._cond.notify_all()
+
+    def _on_error(self, exc, rows, attempt, started):
+        with self._cond:
+            self._in_flight -= 1
+            # 写超时或过载说明集群已饱和，降低并发
+            self._decrease_locked(started)
+            if attempt < self.max_retries:
+                self._stats['retries'] += 1
+                # 全抖动指数退避，避免失败的批次同时重试再次压垮集群
+                delay = random.uniform(0, min(self.retry_backoff_max, self.retry_backoff * 2 ** attempt))
+                self._retry_queue.append((time.monotonic() + delay, rows, attempt + 1))
+            else:
+                self._stats['failed_rows'] += len(rows)
+                self._errors.append(str(exc))
+                print(f"{self.name} 批次写入失败（已重试{attempt}次）: {str(exc)}")
+            self._cond.notify_all()
+
+    @staticmethod
+    def _estimate_size(params):
+        size = 0
+        for value in params:
+            if isinstance(value, (bytes, bytearray, str)):
+                size += len(value)
+            else:
+                size += 8
+        return size
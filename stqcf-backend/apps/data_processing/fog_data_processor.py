@@ -1,10 +1,11 @@
 from django.db import connections
 from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
 from cassandra.policies import WhiteListRoundRobinPolicy, DowngradingConsistencyRetryPolicy
-from cassandra.query import SimpleStatement, ConsistencyLevel
+from cassandra.query import ConsistencyLevel
 import os
 import json
 from .encryption import EncryptionManager
+from .bulk_writer import CassandraBulkWriter
 
 class FogDataProcessor:
     def __init__(self):
@@ -64,69 +65,20 @@ class FogDataProcessor:
         return cluster, session
     
     def process_octree_data(self):
-        """处理八叉树节点数据"""
+        """
+        处理八叉树节点数据
+        
+        写入新版本的八叉树表，全部写完后切换ActiveOctree指针，不在查询正在读取的表上原地写入。
+        """
+        # 分发脚本导入时会初始化Cassandra驱动，只在执行时导入
+        from process_octree_data import OctreeDataDistributor
+        distributor = OctreeDataDistributor()
         try:
-            # 从本地MySQL读取数据
-            with connections['default'].cursor() as cursor:
-                cursor.execute("""
-                    SELECT node_id, parent_id, is_leaf, MC, GC
-                    FROM octreenode
-                """)
-                rows = cursor.fetchall()
-                
-                print(f"读取到 {len(rows)} 条八叉树节点数据")
-                
-                # 获取所有不同的雾服务器
-                unique_fog_servers = {}
-                for fog_info in self.fog_servers.values():
-                    server_key = (fog_info['host'], fog_info['port'])
-                    if server_key not in unique_fog_servers:
-                        unique_fog_servers[server_key] = fog_info
-                
-                # 对每个唯一的雾服务器进行处理
-                for (host, port), fog_info in unique_fog_servers.items():
-                    try:
-                        cluster, session = self._connect_to_fog(host, port)
-                        
-                        # 准备批量插入语句
-                        insert_statement = SimpleStatement("""
-                            INSERT INTO OctreeNode (node_id, parent_id, is_leaf, MC, GC)
-                            VALUES (%s, %s, %s, %s, %s)
-                        """)
-                        
-                        # 处理每条数据
-                        for row in rows:
-                            node_id, parent_id, is_leaf, mc, gc = row
-                            
-                            # 加密数据并转换为bytes
-                            encrypted_data = {
-                                'node_id': bytes(self.encryption_manager.encrypt_value(str(node_id)), 'utf-8'),
-                                'parent_id': bytes(self.encryption_manager.encrypt_value(str(parent_id)), 'utf-8') if parent_id else None,
-                                'is_leaf': bytes([1]) if is_leaf else bytes([0]),  # 直接使用bytes表示布尔值
-                                'MC': bytes(self.encryption_manager.encrypt_value(str(mc)), 'utf-8'),
-                                'GC': bytes(self.encryption_manager.encrypt_value(str(gc)), 'utf-8')
-                            }
-                            
-                            # 插入加密数据
-                            session.execute(insert_statement, [
-                                encrypted_data['node_id'],
-                                encrypted_data['parent_id'],
-                                encrypted_data['is_leaf'],
-                                encrypted_data['MC'],
-                                encrypted_data['GC']
-                            ])
-                            
-                        print(f"成功将八叉树节点数据加密并发送到雾服务器 {fog_info['fog_id']}")
-                        cluster.shutdown()
-                        
-                    except Exception as e:
-                        print(f"处理雾服务器 {fog_info['fog_id']} 时出错: {str(e)}")
-                        if 'cluster' in locals():
-                            cluster.shutdown()
-                        continue
-                        
+            distributor.process_octree_nodes()
         except Exception as e:
             print(f"处理八叉树节点数据时出错: {str(e)}")
+        finally:
+            distributor.close()
     
     def process_trajectory_data(self):
         """处理轨迹数据"""
@@ -164,11 +116,13 @@ class FogDataProcessor:
                     try:
                         cluster, session = self._connect_to_fog(host, port)
                         
-                        # 准备批量插入语句
-                        insert_statement = SimpleStatement("""
+                        # 预编译插入语句，按 (V_k, node_id) 分区合并为UNLOGGED批次异步写入
+                        insert_statement = session.prepare("""
                             INSERT INTO TrajectoryDate (V_k, node_id, traj_id, T_date)
-                            VALUES (%s, %s, %s, %s)
+                            VALUES (?, ?, ?, ?)
                         """)
+                        writer = CassandraBulkWriter(session, insert_statement, partition_key_indexes=(0, 1),
+                                                     name=f"雾服务器 {fog_id} TrajectoryDate")
                         
                         # 批量处理数据
                         batch_size = 100
@@ -188,17 +142,19 @@ class FogDataProcessor:
                                     'T_date': bytes(self.encryption_manager.encrypt_value(str(t_date)), 'utf-8')
                                 }
                                 
-                                # 插入加密数据
-                                session.execute(insert_statement, [
+                                # 加入批量写入器，写入与后续加密并行进行
+                                writer.add((
                                     encrypted_data['V_k'],
                                     encrypted_data['node_id'],
                                     encrypted_data['traj_id'],
                                     encrypted_data['T_date']
-                                ])
+                                ))
                             
                             processed += len(batch)
                             print(f"雾服务器 {fog_id}: 已处理 {processed}/{total_rows} 条数据")
                         
+                        writer.close()
+                        
                         print(f"成功将轨迹数据加密并发送到雾服务器 {fog_id}")
                         cluster.shutdown()
                         
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.data_management.track_export import EXPORT_COLUMNS, iter_track_chunks
+from apps.data_management.track_import import TrackParquetImporter
+from apps.data_management.track_parquet import TRACK_ARROW_TYPES, write_parquet, parquet_filter
+from apps.data_processing.trajectory_source import TRAJECTORY_COLUMNS
+
+
+def iter_trajectory_chunks(chunk_rows):
+    """
+    按 (keyword, node_id) 顺序流式读取trajectorydate表
+
+    离线快照使用MySQL的服务端游标（SSCursor）逐批读取，不在客户端缓存整个结果集；
+    按分区排序写出的快照在读取单个分区时可以跳过大部分行组。
+    """
+    connection.ensure_connection()
+    if connection.vendor == 'mysql':
+        import MySQLdb.cursors
+        cursor = connection.connection.cursor(MySQLdb.cursors.SSCursor)
+    else:
+        cursor = connection.connection.cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(TRAJECTORY_COLUMNS)} FROM trajectorydate ORDER BY keyword, node_id")
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+    finally:
+        cursor.close()
+
+
+class Command(BaseCommand):
+    help = '把tracks_table或trajectorydate表导出为Parquet快照，或从Parquet快照导入tracks_table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=['tracks', 'trajectorydate'], help='快照对应的表')
+        parser.add_argument('path', help='Parquet文件路径')
+        parser.add_argument('--load', action='store_true', help='从快照导入tracks_table（默认导出）')
+        parser.add_argument('--columns', help='导出tracks时只导出的列，逗号分隔')
+        parser.add_argument('--date-start', type=int, help='只处理该日期及之后的轨迹点')
+        parser.add_argument('--date-end', type=int, help='只处理该日期及之前的轨迹点')
+        parser.add_argument('--keyword', help='只处理包含该关键词的轨迹点')
+
+    def handle(self, *args, **options):
+        chunk_rows = getattr(settings, 'TRACK_PARQUET_ROW_GROUP_ROWS', 100000)
+        if options['load']:
+            if options['table'] != 'tracks':
+                raise CommandError('只支持从快照导入tracks_table')
+            filter = parquet_filter(options['date_start'], options['date_end'], options['keyword'])
+            importer = TrackParquetImporter(
+                options['path'], filter=filter,
+                progress=lambda rows, _: self.stdout.write(f'已导入 {rows} 行')
+            )
+            rows = importer.run()
+            self.stdout.write(self.style.SUCCESS(f'导入完成，共 {rows} 行'))
+            return
+
+        if options['table'] == 'tracks':
+            from apps.data_management.models import Track
+
+            columns = EXPORT_COLUMNS
+            if options['columns']:
+                columns = tuple(c.strip() for c in options['columns'].split(',') if c.strip())
+                unknown = [c for c in columns if c not in EXPORT_COLUMNS]
+                if unknown or not columns:
+                    raise CommandError(f"未知的列: {', '.join(unknown)}")
+            queryset = Track.objects.all()
+            if options['date_start'] is not None:
+                queryset = queryset.filter(date__gte=options['date_start'])
+            if options['date_end'] is not None:
+                queryset = queryset.filter(date__lte=options['date_end'])
+            if options['keyword']:
+                queryset = queryset.filter(keyword_entries__keyword=options['keyword'])
+            rows = write_parquet(
+                options['path'], iter_track_chunks(chunk_rows, queryset, columns), columns, TRACK_ARROW_TYPES
+            )
+        else:
+            rows = write_parquet(options['path'], iter_trajectory_chunks(chunk_rows), TRAJECTORY_COLUMNS)
+        self.stdout.write(self.style.SUCCESS(f"已导出 {rows} 行到 {options['path']}"))
@@ -0,0 +1,3 @@
+"""
+Data processing application tests
+"""
@@ -0,0 +1,94 @@
+import time
+
+from django.test import SimpleTestCase
+
+from apps.data_processing.bulk_writer import BulkWriteError, CassandraBulkWriter
+
+INSERT = "INSERT INTO TrajectoryDate (keyword, node_id, traj_id) VALUES (%s, %s, %s)"
+
+
+class _Future:
+    def __init__(self, error=None):
+        self.error = error
+
+    def add_callbacks(self, callback, callback_args=(), errback=None, errback_args=()):
+        if self.error is None:
+            callback(None, *callback_args)
+        else:
+            errback(self.error, *errback_args)
+
+
+class _Session:
+    """立即完成的假会话，记录每个批次的行数；fail_first为前几次请求返回的错误"""
+
+    def __init__(self, fail_first=0):
+        self.batches = []
+        self.fail_first = fail_first
+
+    def execute_async(self, batch):
+        if self.fail_first:
+            self.fail_first -= 1
+            return _Future(Exception('write timeout'))
+        self.batches.append(len(batch._statements_and_parameters))
+        return _Future()
+
+
+class CassandraBulkWriterTest(SimpleTestCase):
+    """分区分组批量写入器测试"""
+
+    def test_groups_rows_by_partition(self):
+        session = _Session()
+        writer = CassandraBulkWriter(session, INSERT, partition_key_indexes=(0, 1), max_batch_rows=3)
+        for i in range(7):
+            writer.add((1, 10, b'a%d' % i))
+            writer.add((1, 11, b'b%d' % i))
+        report = writer.close()
+
+        self.assertEqual(sorted(session.batches), [1, 1, 3, 3, 3, 3])
+        self.assertEqual(report['rows'], 14)
+        self.assertEqual(report['batches'], 6)
+
+    def test_batch_byte_limit(self):
+        session = _Session()
+        writer = CassandraBulkWriter(session, INSERT, partition_key_indexes=(0, 1), max_batch_bytes=120)
+        for i in range(4):
+            writer.add((1, 10, b'x' * 40))
+        writer.close()
+        self.assertEqual(session.batches, [2, 2])
+
+    def test_failed_batch_retried_and_backs_off(self):
+        session = _Session(fail_first=1)
+        writer = CassandraBulkWriter(session, INSERT, initial_concurrency=8)
+        writer.add((1, 10, b'a'))
+        report = writer.close()
+        self.assertEqual((report['rows'], report['retries']), (1, 1))
+        self.assertLess(report['final_concurrency'], 8)
+
+    def test_exhausted_retries_raise(self):
+        writer = CassandraBulkWriter(_Session(fail_first=5), INSERT, max_retries=2)
+        writer.add((1, 10, b'a'))
+        with self.assertRaises(BulkWriteError):
+            writer.close()
+
+    def test_slow_batches_halve_concurrency_once_per_window(self):
+        writer = CassandraBulkWriter(_Session(), INSERT, initial_concurrency=16, target_latency=0.01)
+        writer._in_flight = 3
+        # 同一窗口内发出的多个慢批次只减半一次
+        started = time.monotonic() - 1
+        writer._on_success(None, [], started)
+        writer._on_success(None, [], started)
+        self.assertEqual(writer.concurrency, 8)
+        # 减半之后发出的批次仍然慢，再减半一次
+        started = time.monotonic()
+        time.sleep(0.02)
+        writer._on_success(None, [], started)
+        self.assertEqual(writer.concurrency, 4)
+
+    def test_failed_batch_not_resubmitted_before_backoff(self):
+        session = _Session(fail_first=1)
+        writer = CassandraBulkWriter(session, INSERT, retry_backoff=0.05, retry_backoff_max=0.05)
+        writer.add((1, 10, b'a'))
+        writer.flush_buffers()
+        self.assertEqual((session.batches, len(writer._retry_queue)), ([], 1))
+        writer.close()
+        self.assertEqual(session.batches, [1])
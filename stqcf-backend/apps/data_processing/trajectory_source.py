@@ -0,0 +1,85 @@
+from collections import Counter
+from django.conf import settings
+from django.db import connection
+
+# 轨迹迁移读取的trajectorydate列，也是Parquet快照的列
+TRAJECTORY_COLUMNS = ('keyword', 'node_id', 'traj_id', 't_date', 'latitude', 'longitude', 'time')
+
+
+class MySQLTrajectorySource:
+    """从MySQL的trajectorydate表读取待迁移的轨迹数据"""
+
+    def partition_counts(self):
+        """每个 (keyword, node_id) 分区的行数 [(keyword, node_id, 行数)]"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT keyword, node_id, COUNT(*) FROM trajectorydate GROUP BY keyword, node_id")
+            return cursor.fetchall()
+
+    def keyword_dates(self):
+        """不同的 (keyword, t_date)"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT keyword, t_date FROM trajectorydate")
+            return cursor.fetchall()
+
+    def keyword_nodes(self):
+        """不同的 (keyword, node_id)"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT keyword, node_id FROM trajectorydate")
+            return cursor.fetchall()
+
+    def partition_rows(self, raw_keywords, raw_node_ids):
+        """读取若干分区的全部行，返回字典列表"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT {', '.join(TRAJECTORY_COLUMNS)}
+                FROM trajectorydate
+                WHERE keyword IN ({','.join(['%s'] * len(raw_keywords))})
+                  AND node_id IN ({','.join(['%s'] * len(raw_node_ids))})
+                """,
+                list(raw_keywords) + list(raw_node_ids)
+            )
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class ParquetTrajectorySource:
+    """
+    从trajectorydate的Parquet快照读取待迁移的轨迹数据（见 manage.py parquet_snapshot trajectorydate）
+
+    统计只读取keyword、node_id等需要的列；读取分区时keyword/node_id条件下推到行组过滤，
+    快照按 (keyword, node_id) 排序写入时，每个分块只读取覆盖自己分区的行组。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _iter_rows(self, columns, filter=None):
+        from apps.data_management.track_parquet import iter_parquet_chunks
+        for rows, names in iter_parquet_chunks(self.path, columns, filter):
+            positions = [names.index(column) for column in columns]
+            for row in rows:
+                yield tuple(row[i] for i in positions)
+
+    def partition_counts(self):
+        counts = Counter(self._iter_rows(('keyword', 'node_id')))
+        return [(keyword, node_id, count) for (keyword, node_id), count in counts.items()]
+
+    def keyword_dates(self):
+        return list(set(self._iter_rows(('keyword', 't_date'))))
+
+    def keyword_nodes(self):
+        return list(set(self._iter_rows(('keyword', 'node_id'))))
+
+    def partition_rows(self, raw_keywords, raw_node_ids):
+        import pyarrow.compute as pc
+        filter = pc.field('keyword').isin(list(raw_keywords)) & pc.field('node_id').isin(list(raw_node_ids))
+        return [dict(zip(TRAJECTORY_COLUMNS, row)) for row in self._iter_rows(TRAJECTORY_COLUMNS, filter)]
+
+
+def get_trajectory_source():
+    """配置了TRAJECTORY_PARQUET_SNAPSHOT时从Parquet快照读取，否则读取MySQL"""
+    path = getattr(settings, 'TRAJECTORY_PARQUET_SNAPSHOT', '')
+    if path:
+        return ParquetTrajectorySource(path)
+    return MySQLTrajectorySource()
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_fog_keyword_index(apps, schema_editor):
+    """按已有服务器的keywords字段填充倒排索引"""
+    FogServer = apps.get_model('fog_management', 'FogServer')
+    FogKeyword = apps.get_model('fog_management', 'FogKeyword')
+    entries = []
+    for server_id, keywords in FogServer.objects.values_list('id', 'keywords'):
+        for keyword in {k.strip() for k in (keywords or '').split(',') if k.strip()}:
+            entries.append(FogKeyword(fog_server_id=server_id, keyword=keyword))
+    FogKeyword.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fog_management', '0002_alter_fogserver_created_at_alter_fogserver_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FogKeyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keyword', models.CharField(help_text='关键词', max_length=255)),
+                ('fog_server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_entries', to='fog_management.fogserver')),
+            ],
+            options={
+                'verbose_name': '雾服务器关键词',
+                'verbose_name_plural': '雾服务器关键词',
+                'db_table': 'fog_keyword',
+                'unique_together': {('fog_server', 'keyword')},
+                'indexes': [models.Index(fields=['keyword', 'fog_server'], name='fog_keyword_kw_idx')],
+            },
+        ),
+        migrations.RunPython(build_fog_keyword_index, migrations.RunPython.noop),
+    ]
@@ -42,6 +42,10 @@ class FogServer(models.Model):
     def __str__(self):
         return f"{self.service_endpoint} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.sync_keyword_index()
+
     def clean(self):
         if self.keyword_load < 0 or self.keyword_load > 100:
             raise ValidationError('关键词负载必须在0-100之间')
@@ -53,5 +57,35 @@ class FogServer(models.Model):
         return [k.strip() for k in self.keywords.split(',') if k.strip()]
 
     def set_keywords_list(self, keywords_list):
-        """设置关键词列表"""
+        """设置关键词列表，保存时同步关键词索引"""
         self.keywords = ','.join(keywords_list)
+
+    def sync_keyword_index(self):
+        """按keywords字段更新本服务器在FogKeyword中的索引项"""
+        keywords = set(self.get_keywords_list())
+        existing = set(self.keyword_entries.values_list('keyword', flat=True))
+        if existing - keywords:
+            self.keyword_entries.filter(keyword__in=existing - keywords).delete()
+        if keywords - existing:
+            FogKeyword.objects.bulk_create(
+                [FogKeyword(fog_server=self, keyword=k) for k in keywords - existing], ignore_conflicts=True
+            )
+
+
+class FogKeyword(models.Model):
+    """
+    雾服务器关键词倒排索引：分配给服务器的每个关键词一行
+
+    FogServer.keywords仍保存逗号分隔的原始值；按关键词路由时通过(keyword, fog_server)索引连接，
+    不再使用FIND_IN_SET/LIKE扫描fog_servers。FogServer.save()负责同步，
+    绕过save()写入、没有索引行的服务器由查询路由回退解析keywords字段。
+    """
+    fog_server = models.ForeignKey(FogServer, on_delete=models.CASCADE, related_name='keyword_entries')
+    keyword = models.CharField(max_length=255, help_text='关键词')
+
+    class Meta:
+        db_table = 'fog_keyword'
+        unique_together = ('fog_server', 'keyword')
+        indexes = [models.Index(fields=['keyword', 'fog_server'], name='fog_keyword_kw_idx')]
+        verbose_name = '雾服务器关键词'
+        verbose_name_plural = '雾服务器关键词'
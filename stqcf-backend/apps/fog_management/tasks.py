@@ -3,31 +3,30 @@ from django.core.cache import cache
 from django.db import transaction
 from django.db.models import Count, Avg
 from .models import FogServer
-from apps.data_management.models import Track
+from apps.data_management.track_stats import get_track_statistics
 import logging
 from celery.exceptions import MaxRetriesExceededError
 from celery.utils.log import get_task_logger
-from django.db import connection
 
 logger = get_task_logger(__name__)
 
+def get_keyword_frequency():
+    """
+    按频率降序返回每个关键词的轨迹点数 [{'keyword', 'frequency'}]
+    
+    读取与关键词倒排索引同步维护的统计表，逗号分隔的多个关键词分别计数
+    """
+    keyword_counts = get_track_statistics()['keyword_counts']
+    return [
+        {'keyword': keyword, 'frequency': frequency}
+        for keyword, frequency in sorted(keyword_counts.items(), key=lambda item: (-item[1], item[0]))
+    ]
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=5)
 def update_keyword_frequency(self):
     """更新关键词频率统计"""
     try:
-        # 使用原生SQL查询统计关键词频率
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT keyword AS keywords, COUNT(*) AS frequency
-                FROM tracks_table
-                GROUP BY keyword
-                ORDER BY frequency DESC
-            """)
-            keyword_freq = [
-                {'keyword': row[0].strip(), 'frequency': row[1]}
-                for row in cursor.fetchall()
-                if row[0] and row[0].strip()  # 排除空字符串
-            ]
+        keyword_freq = get_keyword_frequency()
 
         # 缓存结果
         cache.set('keyword_freq', keyword_freq, timeout=300)  # 5分钟过期
@@ -72,19 +71,8 @@ def perform_keyword_grouping(self, server_ids, strategy='frequency_greedy'):
                 server.keyword_load = 0
                 server.save()
             
-            # 直接从数据库获取关键词频率
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT keyword, COUNT(*) as frequency
-                    FROM tracks_table
-                    WHERE keyword IS NOT NULL AND keyword != ''
-                    GROUP BY keyword
-                    ORDER BY frequency DESC
-                """)
-                keyword_freq = [
-                    {'keyword': row[0], 'frequency': row[1]}
-                    for row in cursor.fetchall()
-                ]
+            # 从增量维护的关键词统计表获取关键词频率
+            keyword_freq = get_keyword_frequency()
 
             if not keyword_freq:
                 logger.error("No keyword frequency data available")
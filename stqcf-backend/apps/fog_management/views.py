@@ -4,11 +4,12 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Count, Avg
-from django.db import transaction, connection
+from django.db import transaction
 from django.utils import timezone
 from .models import FogServer
 from .serializers import FogServerSerializer, FogServerCreateUpdateSerializer
 from .tasks import update_keyword_frequency, perform_keyword_grouping
+from apps.data_management.track_stats import get_track_statistics
 from django.core.exceptions import ValidationError
 from celery.result import AsyncResult
 import logging
@@ -36,10 +37,8 @@ class FogServerViewSet(viewsets.ModelViewSet):
         online_servers = FogServer.objects.filter(status='online').count()
         avg_load = FogServer.objects.aggregate(Avg('keyword_load'))['keyword_load__avg'] or 0
 
-        # 获取关键词总数（从tracks_table表中统计）
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT COUNT(DISTINCT keyword) FROM tracks_table")
-            total_keywords = cursor.fetchone()[0] or 0
+        # 获取关键词总数（读取增量维护的轨迹统计表）
+        total_keywords = get_track_statistics()['total_keywords']
 
         return Response({
             'total_servers': total_servers,
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class QueryConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.query'
+    verbose_name = '轨迹查询'
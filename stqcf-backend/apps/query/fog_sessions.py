@@ -0,0 +1,24 @@
+import threading
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_fog_session(fog_server):
+    """
+    获取雾服务器的Cassandra会话
+
+    按fog_server['cassandra']（host:port）复用会话，使不同雾服务器上的查询可以在
+    同一进程中并发执行，而不依赖cqlengine的全局默认连接。
+    """
+    from cassandra.cluster import Cluster
+
+    address = fog_server['cassandra']
+    with _sessions_lock:
+        session = _sessions.get(address)
+        if session is None:
+            host, _, port = address.partition(':')
+            cluster = Cluster([host], port=int(port or 9042), connect_timeout=5)
+            session = cluster.connect()
+            _sessions[address] = session
+        return session
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='任务ID')),
+                ('algorithm', models.CharField(default='sstp', max_length=20, verbose_name='算法')),
+                ('time_span', models.IntegerField(verbose_name='时间跨度')),
+                ('queries', models.TextField(help_text='明文子查询列表，JSON格式', verbose_name='查询参数')),
+                ('status', models.CharField(choices=[('pending', '待处理'), ('running', '执行中'), ('completed', '已完成'), ('failed', '失败'), ('cancelled', '已取消')], default='pending', max_length=20, verbose_name='状态')),
+                ('steps', models.TextField(default='[]', help_text='query_api执行过程中记录的步骤，JSON格式', verbose_name='步骤记录')),
+                ('results', models.TextField(blank=True, help_text='STV验证后的轨迹列表，JSON格式', null=True, verbose_name='结果轨迹')),
+                ('total_count', models.IntegerField(default=0, verbose_name='结果数量')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('celery_task_id', models.CharField(blank=True, max_length=64, null=True, verbose_name='Celery任务ID')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='已请求取消')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'verbose_name': '异步查询任务',
+                'verbose_name_plural': '异步查询任务',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
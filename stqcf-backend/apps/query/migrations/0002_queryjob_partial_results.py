@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('query', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queryjob',
+            name='partial_results',
+            field=models.TextField(default='[]', help_text='各子查询完成后解密的轨迹（STV验证前），JSON格式', verbose_name='部分结果'),
+        ),
+    ]
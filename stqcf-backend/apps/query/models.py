@@ -0,0 +1,57 @@
+from django.db import models
+import uuid
+import json
+
+
+class QueryJob(models.Model):
+    """异步轨迹查询任务模型"""
+    STATUS_CHOICES = (
+        ('pending', '待处理'),
+        ('running', '执行中'),
+        ('completed', '已完成'),
+        ('failed', '失败'),
+        ('cancelled', '已取消')
+    )
+    FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, verbose_name='任务ID')
+    algorithm = models.CharField(max_length=20, default='sstp', verbose_name='算法')
+    time_span = models.IntegerField(verbose_name='时间跨度')
+    queries = models.TextField(verbose_name='查询参数', help_text='明文子查询列表，JSON格式')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    steps = models.TextField(default='[]', verbose_name='步骤记录', help_text='query_api执行过程中记录的步骤，JSON格式')
+    partial_results = models.TextField(default='[]', verbose_name='部分结果', help_text='各子查询完成后解密的轨迹（STV验证前），JSON格式')
+    results = models.TextField(null=True, blank=True, verbose_name='结果轨迹', help_text='STV验证后的轨迹列表，JSON格式')
+    total_count = models.IntegerField(default=0, verbose_name='结果数量')
+    error = models.TextField(null=True, blank=True, verbose_name='错误信息')
+    celery_task_id = models.CharField(max_length=64, null=True, blank=True, verbose_name='Celery任务ID')
+    cancel_requested = models.BooleanField(default=False, verbose_name='已请求取消')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='结束时间')
+    
+    def get_queries(self):
+        """获取查询参数列表"""
+        return json.loads(self.queries)
+    
+    def get_steps(self):
+        """获取步骤记录"""
+        return json.loads(self.steps or '[]')
+    
+    def get_partial_results(self):
+        """获取各子查询的部分结果"""
+        return json.loads(self.partial_results or '[]')
+    
+    def get_results(self):
+        """获取结果轨迹列表"""
+        return json.loads(self.results) if self.results else []
+    
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+    
+    class Meta:
+        verbose_name = '异步查询任务'
+        verbose_name_plural = verbose_name
+        ordering = ['-created_at']
@@ -0,0 +1,137 @@
+import json
+import queue
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Redis频道名前缀
+CHANNEL_PREFIX = 'query_progress:'
+
+
+class _QueueSubscription:
+    """进程内频道的订阅"""
+
+    def __init__(self, channel, owner):
+        self.channel = channel
+        self._owner = owner
+        self._queue = queue.Queue()
+
+    def put(self, event):
+        self._queue.put(event)
+
+    def get(self, timeout):
+        """等待下一条事件，超时返回None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._owner._unsubscribe(self)
+
+
+class InProcessProgressChannel:
+    """
+    进程内的查询进度发布/订阅频道
+
+    只在查询与事件流在同一进程中执行时可用（如Celery eager模式或开发服务器）。
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscribe(self, channel):
+        subscription = _QueueSubscription(channel, self)
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.channel, None)
+
+
+class _RedisSubscription:
+    """Redis频道的订阅"""
+
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout):
+        """等待下一条事件，超时返回None"""
+        message = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if not message or message.get('type') != 'message':
+            return None
+        try:
+            return json.loads(message['data'])
+        except (TypeError, ValueError):
+            logger.warning("收到无法解析的查询进度消息")
+            return None
+
+    def close(self):
+        try:
+            self._pubsub.close()
+        except Exception:
+            pass
+
+
+class RedisProgressChannel:
+    """
+    基于Redis pub/sub的查询进度频道
+
+    Celery worker执行查询时发布事件，Web进程中的事件流订阅同名频道。
+    """
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, channel, event):
+        self._client.publish(CHANNEL_PREFIX + channel, json.dumps(event, default=str))
+
+    def subscribe(self, channel):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(CHANNEL_PREFIX + channel)
+        return _RedisSubscription(pubsub)
+
+
+_progress_channel = None
+_progress_channel_lock = threading.Lock()
+
+def get_progress_channel():
+    """
+    获取查询进度频道
+
+    QUERY_PROGRESS_BACKEND为'redis'（默认）时使用CELERY_BROKER_URL对应的Redis，
+    为'memory'时使用进程内频道。
+    """
+    global _progress_channel
+    with _progress_channel_lock:
+        if _progress_channel is None:
+            backend = getattr(settings, 'QUERY_PROGRESS_BACKEND', 'redis')
+            if backend == 'memory':
+                _progress_channel = InProcessProgressChannel()
+            else:
+                url = getattr(settings, 'QUERY_PROGRESS_REDIS_URL', None) or settings.CELERY_BROKER_URL
+                _progress_channel = RedisProgressChannel(url)
+        return _progress_channel
+
+def publish_progress(channel, event):
+    """发布查询进度事件，发布失败只记录日志，不影响查询执行"""
+    try:
+        get_progress_channel().publish(channel, event)
+    except Exception as e:
+        logger.warning(f"发布查询进度事件失败: {str(e)}")
@@ -4,7 +4,9 @@ import json
 import pickle
 import socket
 import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Dict, Any, Optional
@@ -23,6 +25,10 @@ django.setup()
 from apps.sstp.sstp_processor import SSTPProcessor
 from apps.sstp.traversal_processor import TraversalProcessor
 from apps.sstp.homomorphic_crypto import HomomorphicProcessor
+from apps.sstp.packing import SlotPacker
+from apps.sstp.admission import admission, AdmissionRejected
+from apps.query.result_cache import get_result_cache, get_epoch_tracker, make_query_key
+from apps.query.fog_sessions import get_fog_session
 from apps.stv.stv_processor import STVProcessor
 
 # 定义扩展的HomomorphicProcessor类
@@ -232,6 +238,20 @@ class ExtendedHomomorphicProcessor(HomomorphicProcessor):
             print(f"    解密十六进制字符串失败: {str(e)}")
             return hex_string
 
+class QueryCancelled(Exception):
+    """查询在执行过程中被取消"""
+    pass
+
+class QueryDeadlineExceeded(Exception):
+    """子查询在截止时间内没有得到任何雾服务器的结果"""
+    pass
+
+# 雾服务器查询线程池，主请求和对冲请求在此并发执行；超过截止时间的请求不再等待
+_fog_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'QUERY_FOG_WORKERS', 16))
+# 子查询协调线程池，每个子查询在此等待_fog_executor中的主请求和对冲请求；
+# 与_fog_executor分开，协调线程占满时不会阻塞其等待的雾服务器请求
+_subquery_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'QUERY_FOG_WORKERS', 16))
+
 class QueryProcessor:
     """查询处理器类，整合SSTP和STV功能"""
     
@@ -241,7 +261,15 @@ class QueryProcessor:
         self._setup_database()
         self.steps = []  # 添加步骤记录器
         self.parallel_steps = {}  # 用于模拟并行执行的步骤记录
+        self.step_listener = None  # 步骤回调，参数为步骤记录，附带实际记录时间recorded_at
+        self.cancel_check = None  # 取消检查回调，返回True时在下一个阶段边界中止查询
+        self.event_listener = None  # 进度事件回调，参数为 (事件类型, 数据)，用于扫描进度和部分结果
+        self.deadline = None  # 本次查询的截止时间（time.monotonic()）
+        self.partial = False  # 是否因超时、雾服务器失败或截断只得到部分结果
+        self.failed_queries = []  # 没有得到结果的子查询 [{'rid', 'reason', 'message'}]
+        self.priority = 'normal'  # 准入控制等待队列中的优先级：'high'、'normal'或'low'
         self.global_start_time = None  # 全局开始时间
+        self._steps_lock = threading.RLock()  # 子查询并发执行时对冲步骤在协调线程中记录
         
         # 初始化ExtendedHomomorphicProcessor
         try:
@@ -382,32 +410,33 @@ class QueryProcessor:
             
             # 如果缓存中没有找到，则查询数据库
             with connections['default'].cursor() as cursor:
-                # 首先尝试使用FIND_IN_SET进行精确匹配
+                # 通过关键词倒排索引fog_keyword连接查找
                 cursor.execute("""
-                    SELECT id, service_endpoint, keywords, status, keyword_load
-                    FROM fog_servers
-                    WHERE FIND_IN_SET(%s, keywords) > 0
-                    AND status = 'online'
-                    ORDER BY keyword_load ASC
+                    SELECT f.id, f.service_endpoint, f.keywords, f.status, f.keyword_load
+                    FROM fog_keyword k
+                    JOIN fog_servers f ON f.id = k.fog_server_id
+                    WHERE k.keyword = %s
+                    AND f.status = 'online'
+                    ORDER BY f.keyword_load ASC
                     LIMIT 1
                 """, [str(keyword)])
                 
                 row = cursor.fetchone()
                 
-                # 如果没有找到，尝试使用LIKE进行模糊匹配
                 if not row:
-                    print(f"未找到精确匹配关键词 {keyword} 的雾服务器，尝试使用LIKE查询")
+                    # 绕过save()写入的服务器（如bulk_create、原始SQL）没有索引行，回退为解析其keywords字段
                     cursor.execute("""
-                        SELECT id, service_endpoint, keywords, status, keyword_load
-                        FROM fog_servers
-                        WHERE keywords LIKE %s
-                        AND status = 'online'
-                        ORDER BY keyword_load ASC
-                        LIMIT 1
-                    """, [f'%{keyword}%'])
-                    
-                    row = cursor.fetchone()
-                
+                        SELECT f.id, f.service_endpoint, f.keywords, f.status, f.keyword_load
+                        FROM fog_servers f
+                        WHERE f.status = 'online'
+                        AND NOT EXISTS (SELECT 1 FROM fog_keyword k WHERE k.fog_server_id = f.id)
+                        ORDER BY f.keyword_load ASC
+                    """)
+                    row = next((
+                        candidate for candidate in cursor.fetchall()
+                        if str(keyword) in [kw.strip() for kw in (candidate[2] or '').split(',')]
+                    ), None)
+
                 if row:
                     fog_id = row[0]
                     service_endpoint = row[1]
@@ -637,6 +666,19 @@ class QueryProcessor:
                 'longitude_max': self.crypto.public_key.encrypt(int(params['point_range']['lon_max'] * 1e6)),
                 'time_max': self.crypto.public_key.encrypt(params['point_range']['time_max'])
             }
+            if getattr(settings, 'TRAJECTORY_PACKED_ENCODING', False):
+                # 打包编码的数据用一次同态比较同时检查纬度、经度、时间
+                packer = SlotPacker()
+                encrypted_query['Prange']['packed_min'] = packer.encrypt(self.crypto.public_key, [
+                    int(params['point_range']['lat_min'] * 1e6),
+                    int(params['point_range']['lon_min'] * 1e6),
+                    int(params['point_range']['time_min'])
+                ])
+                encrypted_query['Prange']['packed_max'] = packer.encrypt(self.crypto.public_key, [
+                    int(params['point_range']['lat_max'] * 1e6),
+                    int(params['point_range']['lon_max'] * 1e6),
+                    int(params['point_range']['time_max'])
+                ])
             
             return encrypted_query
         except Exception as e:
@@ -684,9 +726,21 @@ class QueryProcessor:
                     }
                 }
 
-    def _decrypt_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """解密查询结果"""
+    def _decrypt_results(self, results: List[Dict[str, Any]],
+                         traj_id_cache: Optional[Dict[str, Any]] = None,
+                         date_dictionary: Optional[Dict[Any, str]] = None) -> List[Dict[str, Any]]:
+        """解密查询结果
+        
+        Args:
+            results: 雾服务器返回的结果
+            traj_id_cache: 轨迹ID确定性标签到解密结果的映射，跨子查询共用；
+                带标签的行每个标签只解密一次traj_id
+            date_dictionary: 雾服务器随结果下发的加密日期字典 {date_code: t_date_hex}，
+                每个日期只解密一次
+        """
         decrypted_results = []
+        if traj_id_cache is None:
+            traj_id_cache = {}
         
         # 检查HomomorphicProcessor是否正确初始化
         if not hasattr(self.crypto, 'private_key') or self.crypto.private_key is None:
@@ -696,12 +750,26 @@ class QueryProcessor:
             
         print(f"\n开始解密 {len(results)} 条查询结果...")
         
+        # 先解密日期字典，数据行只携带日期编码
+        decrypted_dates = {}
+        for code, date_hex in (date_dictionary or {}).items():
+            try:
+                decrypted_dates[int(code)] = self.crypto.decrypt_hex_string(date_hex)
+            except Exception as e:
+                print(f"  解密日期字典项 {code} 失败: {str(e)}")
+        if decrypted_dates:
+            print(f"日期字典解密完成，共 {len(decrypted_dates)} 个日期")
+        
         for idx, item in enumerate(results):
             decrypted_item = item.copy()
             print(f"\n解密第 {idx+1} 条数据:")
             
+            # 同一轨迹的traj_id已解密过，直接复用
+            traj_tag = item.get('traj_tag')
+            if traj_tag and traj_tag in traj_id_cache:
+                decrypted_item['decrypted_traj_id'] = traj_id_cache[traj_tag]
             # 解密traj_id
-            if 'traj_id' in item:
+            elif 'traj_id' in item:
                 try:
                     print(f"  原始traj_id类型: {type(item['traj_id'])}")
                     print(f"  原始traj_id前100字符: {str(item['traj_id'])[:100]}...")
@@ -712,6 +780,8 @@ class QueryProcessor:
                         decrypted_traj_id = self.crypto.decrypt_hex_string(item['traj_id'])
                         print(f"  解密后traj_id: {decrypted_traj_id}")
                         decrypted_item['decrypted_traj_id'] = decrypted_traj_id
+                        if traj_tag:
+                            traj_id_cache[traj_tag] = decrypted_traj_id
                     else:
                         print("  警告: HomomorphicProcessor对象没有decrypt_hex_string方法，无法解密traj_id")
                         decrypted_item['decrypted_traj_id'] = item['traj_id']
@@ -719,8 +789,11 @@ class QueryProcessor:
                     print(f"  解密traj_id失败: {str(e)}")
                     decrypted_item['decrypted_traj_id'] = item['traj_id']
                     
+            # 字典编码的日期直接查表
+            if item.get('date_code') is not None:
+                decrypted_item['decrypted_date'] = decrypted_dates.get(int(item['date_code']), item['date_code'])
             # 解密t_date
-            if 't_date' in item:
+            elif 't_date' in item:
                 try:
                     print(f"  原始t_date类型: {type(item['t_date'])}")
                     print(f"  原始t_date前100字符: {str(item['t_date'])[:100]}...")
@@ -753,16 +826,27 @@ class QueryProcessor:
             fog_id: 雾服务器ID，用于并行步骤记录
             timestamp: 步骤时间戳
         """
-        timestamp = timestamp or datetime.now()
-        
+        with self._steps_lock:
+            self._record_step(step_name, details, query_id, fog_id, timestamp or datetime.now())
+    
+    def _record_step(self, step_name: str, details: dict, query_id, fog_id, timestamp):
+        """记录步骤，调用方持有_steps_lock"""
         # 记录全局步骤（串行方式）
-        self.steps.append({
+        step = {
             'step': step_name,
             'details': details,
             'timestamp': timestamp.isoformat(),
             'query_id': query_id,
             'fog_id': fog_id
-        })
+        }
+        self.steps.append(step)
+        
+        # 通知步骤回调，timestamp可能是模拟时间，recorded_at为实际记录时间
+        if self.step_listener is not None:
+            try:
+                self.step_listener(dict(step, recorded_at=datetime.now().isoformat()))
+            except Exception as e:
+                print(f"步骤回调失败: {str(e)}")
         
         # 记录并行执行模拟数据
         if query_id is not None and fog_id is not None:
@@ -800,13 +884,224 @@ class QueryProcessor:
                 'relative_time': f"{relative_time:.3f}s"  # 相对于线程启动的时间
             })
 
-    def process_query(self, queries: List[Dict[str, Any]], time_span: int, algorithm: str = 'sstp') -> List[int]:
+    def _publish_event(self, event_type: str, data: dict):
+        """通知进度事件回调"""
+        if self.event_listener is None:
+            return
+        try:
+            self.event_listener(event_type, data)
+        except Exception as e:
+            print(f"进度事件回调失败: {str(e)}")
+
+    def _check_cancelled(self):
+        """在阶段边界检查查询是否已被取消"""
+        if self.cancel_check is not None and self.cancel_check():
+            self._add_step('Query Cancelled', {'status': 'cancelled', 'message': 'Query cancelled by user'})
+            raise QueryCancelled()
+
+    def _remaining_budget(self) -> float:
+        """距截止时间的剩余秒数，未设置截止时间时为无穷大"""
+        if self.deadline is None:
+            return float('inf')
+        return self.deadline - time.monotonic()
+
+    def _get_fog_session(self, fog_server: Dict[str, Any]):
+        """
+        获取雾服务器的Cassandra会话
+        
+        连接失败时抛出异常，该子查询按失败处理（转发到副本或记入failed_queries）；
+        不回退到cqlengine默认连接，否则会读到其他雾服务器的数据。
+        """
+        try:
+            return get_fog_session(fog_server)
+        except Exception as e:
+            raise RuntimeError(f"连接雾服务器 {fog_server['name']} 的Cassandra失败: {str(e)}") from e
+
+    def _get_replica_fog_servers(self, keyword: int, exclude_id: int) -> List[Dict[str, Any]]:
+        """同样负责该关键词的其他在线雾服务器，按关键词负载排序"""
+        replicas = [
+            fog_server for fog_server in self.fog_servers.values()
+            if fog_server['id'] != exclude_id and keyword in fog_server['keywords']
+            and fog_server.get('status', 'online') == 'online'
+        ]
+        return sorted(replicas, key=lambda fog_server: fog_server.get('keyword_load', 0))
+
+    def _fog_admission(self, fog_server: Dict[str, Any]):
+        """单个雾服务器的准入许可，排队时间不超过查询剩余预算；未准入时抛出AdmissionRejected，由对冲逻辑转到副本"""
+        remaining = self._remaining_budget()
+        return admission(f"fog:{fog_server['id']}", self.priority,
+                         timeout=None if remaining == float('inf') else max(remaining, 0))
+
+    @staticmethod
+    def _is_failed_result(result: Optional[Dict[str, Any]]) -> bool:
+        return not result or 'error' in result or result.get('status') == 'error'
+
+    def _run_on_fog(self, fog_server: Dict[str, Any], encrypted_query: Dict[str, Any], algorithm: str) -> Dict[str, Any]:
+        """在指定雾服务器上执行一个子查询，截止时间传递给处理器及其中央服务器客户端"""
+        query_id = encrypted_query['rid']
+        if algorithm == 'traversal':
+            processor = TraversalProcessor(fog_id=fog_server['id'])
+            processor.progress_callback = (
+                lambda progress:
+                self._publish_event('scan_progress', dict(progress, query_id=query_id, fog_id=fog_server['id']))
+            )
+        else:
+            processor = SSTPProcessor(fog_id=fog_server['id'], session=self._get_fog_session(fog_server))
+        processor.set_deadline(self.deadline)
+        with self._fog_admission(fog_server):
+            return processor.process_query(encrypted_query)
+
+    def _execute_fog_query(self, query: Dict[str, Any], encrypted_query: Dict[str, Any], algorithm: str,
+                           shared_result: Optional[Dict[str, Any]] = None):
+        """
+        执行子查询，必要时向副本雾服务器发起对冲请求
+        
+        主雾服务器失败时立即转发到下一个副本；超过QUERY_HEDGE_DELAY_SECONDS仍未返回时
+        并发向副本发起同一查询，采用最先成功的结果。到截止时间仍无结果时放弃等待，
+        各处理器按自身的截止时间停止剩余工作。
+        
+        Returns:
+            (查询结果, 实际返回结果的雾服务器)
+        """
+        fog_server = query['fog_server']
+        if shared_result is not None and not self._is_failed_result(shared_result):
+            return shared_result, fog_server
+        
+        candidates = [fog_server] + self._get_replica_fog_servers(query['keyword'], fog_server['id'])
+        hedge_delay = getattr(settings, 'QUERY_HEDGE_DELAY_SECONDS', 2)
+        pending = {}
+        errors = []
+        
+        def launch():
+            target = candidates[len(pending) + len(errors)]
+            pending[_fog_executor.submit(self._run_on_fog, target, encrypted_query, algorithm)] = target
+        
+        if shared_result is not None:
+            # 合并请求失败视为主雾服务器失败，直接尝试副本
+            errors.append(f"{fog_server['name']}: {shared_result.get('error') or shared_result.get('message')}")
+            if len(candidates) > 1:
+                launch()
+        else:
+            launch()
+        
+        while pending:
+            remaining = self._remaining_budget()
+            if remaining <= 0:
+                break
+            can_hedge = len(pending) + len(errors) < len(candidates)
+            timeout = min(remaining, hedge_delay) if can_hedge else remaining
+            done, _ = wait(list(pending), timeout=None if timeout == float('inf') else timeout,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                if can_hedge:
+                    launch()
+                    self._add_step(f'Query {query["rid"]} Hedge', 
+                                  {'status': 'running', 'message': f'Primary slower than {hedge_delay}s, hedging to replica'}, 
+                                  query_id=query['rid'], fog_id=fog_server['id'])
+                continue
+            for future in done:
+                target = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'error': str(e)}
+                if not self._is_failed_result(result):
+                    for outstanding in pending:
+                        outstanding.cancel()
+                    return result, target
+                errors.append(f"{target['name']}: {result.get('error') or result.get('message')}")
+            if not pending and len(errors) < len(candidates):
+                launch()
+        
+        if pending:
+            for outstanding in pending:
+                outstanding.cancel()
+            raise QueryDeadlineExceeded(f"No fog server answered within the query deadline ({', '.join(t['name'] for t in pending.values())})")
+        raise RuntimeError('; '.join(errors) or 'Fog query failed')
+
+    def _plan_fog_requests(self, processed_queries: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        按雾服务器对子查询分组，返回 {fog_id: 子查询列表}，组内保持子查询原有顺序
+        
+        同一分组的子查询合并为一次多区间请求，雾服务器只遍历一次并按rid返回各自的结果。
+        """
+        plan = {}
+        for query in processed_queries:
+            plan.setdefault(query['fog_id'], []).append(query)
+        return plan
+
+    def _run_merged_on_fog(self, fog_server: Dict[str, Any], encrypted_queries: List[Dict[str, Any]],
+                           algorithm: str) -> List[Dict[str, Any]]:
+        """在指定雾服务器上以一次多区间请求执行一组子查询，返回与encrypted_queries一一对应的结果"""
+        if algorithm == 'traversal':
+            processor = TraversalProcessor(fog_id=fog_server['id'])
+            rids = [encrypted_query['rid'] for encrypted_query in encrypted_queries]
+            processor.progress_callback = (
+                lambda progress:
+                self._publish_event('scan_progress', dict(progress, query_ids=rids, fog_id=fog_server['id']))
+            )
+        else:
+            processor = SSTPProcessor(fog_id=fog_server['id'], session=self._get_fog_session(fog_server))
+        processor.set_deadline(self.deadline)
+        with self._fog_admission(fog_server):
+            return processor.process_queries(encrypted_queries)
+
+    def _run_merged_fog_requests(self, plan: Dict[int, List[Dict[str, Any]]],
+                                 encryption_results: Dict[int, Dict[str, Any]],
+                                 algorithm: str) -> Dict[int, Dict[str, Any]]:
+        """
+        对包含多个子查询的雾服务器分组发起合并请求，各雾服务器之间并发执行
+        
+        返回 {rid: 查询结果}；只有一个子查询的分组以及合并请求失败的分组不在结果中，
+        由调用方按单查询方式（含对冲）处理。
+        """
+        futures = {}
+        for fog_id, group in plan.items():
+            if len(group) < 2:
+                continue
+            fog_server = group[0]['fog_server']
+            encrypted_queries = [encryption_results[query['rid']] for query in group]
+            futures[_fog_executor.submit(self._run_merged_on_fog, fog_server, encrypted_queries, algorithm)] = group
+        
+        merged_results = {}
+        if not futures:
+            return merged_results
+        
+        remaining = self._remaining_budget()
+        done, not_done = wait(list(futures), timeout=None if remaining == float('inf') else max(remaining, 0))
+        for future in not_done:
+            future.cancel()
+            print(f"雾服务器 {futures[future][0]['fog_id']} 合并请求未在截止时间内完成")
+        
+        for future in done:
+            group = futures[future]
+            fog_id = group[0]['fog_id']
+            rids = [query['rid'] for query in group]
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"雾服务器 {fog_id} 合并请求失败，回退为逐个查询: {str(e)}")
+                continue
+            for query, result in zip(group, results):
+                merged_results[query['rid']] = result
+            self._add_step(f'Fog {fog_id} Merged Request', {
+                'status': 'success',
+                'query_ids': rids,
+                'message': f'{len(group)} sub-queries served by a single {algorithm} pass'
+            }, fog_id=fog_id)
+            print(f"✓ 雾服务器 {fog_id} 合并请求完成，合并 {len(group)} 个查询")
+        
+        return merged_results
+    
+    def process_query(self, queries: List[Dict[str, Any]], time_span: int, algorithm: str = 'sstp',
+                      deadline_seconds: Optional[float] = None) -> List[int]:
         """处理查询请求
         
         Args:
             queries: 查询参数列表
             time_span: 时间跨度
             algorithm: 使用的算法，可选 'sstp'(默认) 或 'traversal'
+            deadline_seconds: 查询时间预算（秒），默认使用QUERY_DEADLINE_SECONDS，0表示不限制
             
         Returns:
             有效轨迹ID列表
@@ -814,6 +1109,11 @@ class QueryProcessor:
         self.steps = []  # 清空步骤记录
         self.parallel_steps = {}  # 清空并行步骤记录
         self.global_start_time = datetime.now()  # 设置全局开始时间
+        self.partial = False
+        self.failed_queries = []
+        if deadline_seconds is None:
+            deadline_seconds = getattr(settings, 'QUERY_DEADLINE_SECONDS', 30)
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
         
         self._add_step('Query Started', {'queries_count': len(queries), 'time_span': time_span, 'algorithm': algorithm})
         
@@ -889,6 +1189,8 @@ class QueryProcessor:
         # 模拟并行处理 - 为每个查询创建相同的时间轴步骤
         # 这样在前端展示时会显示为并行执行
         
+        self._check_cancelled()
+        
         # 1. 模拟所有查询同时开始连接雾服务器
         base_time = datetime.now()
         for query in processed_queries:
@@ -910,6 +1212,13 @@ class QueryProcessor:
         # 2. 模拟所有查询建立连接(同时进行但完成时间略有不同)
         base_time = base_time + timedelta(seconds=0.5)  # 连接建立大约需要0.5秒
         
+        # 按雾服务器规划请求，同一雾服务器上的子查询只建立一次连接、发起一次合并请求
+        fog_plan = self._plan_fog_requests(processed_queries)
+        connected = {
+            fog_id: self._setup_fog_server_connection(group[0]['fog_server'])
+            for fog_id, group in fog_plan.items()
+        }
+        
         # 实际进行连接和查询处理(仍然串行)，但记录时使用模拟的时间戳
         for query in processed_queries:
             query_id = query['rid']
@@ -920,8 +1229,8 @@ class QueryProcessor:
             connect_finish_offset = random.randint(0, 300) / 1000
             connect_finish_time = base_time + timedelta(seconds=connect_finish_offset)
             
-            # 实际设置雾服务器连接
-            if not self._setup_fog_server_connection(fog_server):
+            # 雾服务器连接结果
+            if not connected[fog_id]:
                 self._add_step(f'Query {query_id} Connection', 
                               {'status': 'error', 'message': f'Failed to connect to fog server {fog_server["name"]}'}, 
                               query_id=query_id, fog_id=fog_id,
@@ -934,6 +1243,8 @@ class QueryProcessor:
                           query_id=query_id, fog_id=fog_id,
                           timestamp=connect_finish_time)
         
+        self._check_cancelled()
+        
         # 3. 模拟所有查询同时进行加密
         base_time = base_time + timedelta(seconds=0.2)  # 加密大约需要0.2秒
         encryption_results = {}
@@ -979,52 +1290,112 @@ class QueryProcessor:
         
         # 5. 实际执行查询并模拟并行完成
         query_results = {}
+        decrypted_by_query = {}  # 每个查询完成后立即解密，结果以部分结果事件推送
+        traj_id_cache = {}  # 轨迹ID标签 -> 解密后的轨迹ID
         base_time = base_time + timedelta(seconds=2)  # 查询执行大约需要2秒
         
+        # 同一雾服务器上的多个查询合并为一次请求，雾服务器只遍历一次
+        shared_results = self._run_merged_fog_requests(fog_plan, encryption_results, algorithm)
+        
+        runnable = []
         for query in processed_queries:
-            query_id = query['rid']
-            fog_id = query['fog_id']
-            fog_server = query['fog_server']
-            encrypted_query = encryption_results[query_id]
-            
-            # 根据算法选择处理器执行查询
-            result = None
-            try:
-                if algorithm == 'traversal':
-                    processor = TraversalProcessor(fog_id=fog_server['id'])
-                    result = processor.process_query(encrypted_query)
-                else:
-                    processor = SSTPProcessor(fog_id=fog_server['id'])
-                    result = processor.process_query(encrypted_query)
+            # 已到截止时间，不再向雾服务器发起新的查询
+            if self._remaining_budget() <= 0:
+                self.partial = True
+                self.failed_queries.append({'rid': query['rid'], 'reason': 'deadline', 'message': 'Deadline reached before execution'})
+                self._add_step(f'Query {query["rid"]} Execution', 
+                              {'status': 'error', 'algorithm': algorithm, 'message': 'Skipped: query deadline reached'}, 
+                              query_id=query['rid'], fog_id=query['fog_id'])
+                continue
+            runnable.append(query)
+        self._check_cancelled()
+        
+        # 所有子查询同时提交（超过对冲延迟或失败时转发到副本雾服务器），按完成顺序处理结果，
+        # 先完成的雾服务器无需等待其余查询
+        futures = {
+            _subquery_executor.submit(
+                self._execute_fog_query, query, encryption_results[query['rid']], algorithm,
+                shared_results.get(query['rid'])
+            ): query
+            for query in runnable
+        }
+        try:
+            for future in as_completed(futures):
+                query = futures[future]
+                query_id = query['rid']
+                fog_id = query['fog_id']
+                fog_server = query['fog_server']
+                self._check_cancelled()
                 
-                # 模拟查询完成时间有0-1000毫秒的随机差异
-                exec_finish_offset = random.randint(0, 1000) / 1000
-                exec_finish_time = base_time + timedelta(seconds=exec_finish_offset)
+                result = None
+                try:
+                    result, served_by = future.result()
+                    if result.get('partial'):
+                        self.partial = True
+                    if served_by['id'] != fog_server['id']:
+                        self._add_step(f'Query {query_id} Hedge', 
+                                      {'status': 'success', 'message': f'Result served by replica fog server {served_by["name"]}'}, 
+                                      query_id=query_id, fog_id=served_by['id'])
                 
-                # 记录查询成功完成
-                if algorithm == 'traversal':
-                    self._add_step(f'Query {query_id} Execution', 
-                                  {'status': 'success', 'algorithm': 'traversal', 'message': 'Traversal algorithm query completed'}, 
-                                  query_id=query_id, fog_id=fog_id,
-                                  timestamp=exec_finish_time)
-                else:
-                    self._add_step(f'Query {query_id} Execution', 
-                                  {'status': 'success', 'algorithm': 'sstp', 'message': 'SSTP algorithm query completed'}, 
-                                  query_id=query_id, fog_id=fog_id,
-                                  timestamp=exec_finish_time)
+                    # 模拟查询完成时间有0-1000毫秒的随机差异
+                    exec_finish_offset = random.randint(0, 1000) / 1000
+                    exec_finish_time = base_time + timedelta(seconds=exec_finish_offset)
                 
-                query_results[query_id] = result
+                    # 记录查询成功完成
+                    if algorithm == 'traversal':
+                        self._add_step(f'Query {query_id} Execution', 
+                                      {'status': 'success', 'algorithm': 'traversal', 'message': 'Traversal algorithm query completed'}, 
+                                      query_id=query_id, fog_id=fog_id,
+                                      timestamp=exec_finish_time)
+                    else:
+                        self._add_step(f'Query {query_id} Execution', 
+                                      {'status': 'success', 'algorithm': 'sstp', 'message': 'SSTP algorithm query completed'}, 
+                                      query_id=query_id, fog_id=fog_id,
+                                      timestamp=exec_finish_time)
                 
-            except Exception as e:
-                # 模拟错误发生时间，通常会比成功执行快一些
-                error_offset = random.randint(0, 500) / 1000
-                error_time = base_time + timedelta(seconds=error_offset)
+                    query_results[query_id] = result
                 
-                self._add_step(f'Query {query_id} Execution', 
-                              {'status': 'error', 'algorithm': algorithm, 'message': str(e)}, 
-                              query_id=query_id, fog_id=fog_id,
-                              timestamp=error_time)
-                continue
+                    # 解密该查询的结果并推送，先完成的雾服务器无需等待其余查询
+                    if result and 'results' in result and result['results']:
+                        decrypted_results = self._decrypt_results(
+                            result['results'], traj_id_cache, result.get('date_dictionary')
+                        )
+                        for res in decrypted_results:
+                            res['rid'] = query_id
+                        decrypted_by_query[query_id] = decrypted_results
+                        self._publish_event('partial_result', {
+                            'query_id': query_id,
+                            'fog_id': fog_id,
+                            'trajectories': [
+                                {key: res.get(key) for key in ('decrypted_traj_id', 'decrypted_date', 'rid')}
+                                for res in decrypted_results
+                            ]
+                        })
+                
+                except Exception as e:
+                    # 失败的子查询不再静默跳过，记录到failed_queries并标记部分结果
+                    self.partial = True
+                    if isinstance(e, QueryDeadlineExceeded):
+                        reason = 'deadline'
+                    elif isinstance(e, AdmissionRejected):
+                        reason = 'overloaded'
+                    else:
+                        reason = 'error'
+                    self.failed_queries.append({'rid': query_id, 'reason': reason, 'message': str(e)})
+                
+                    # 模拟错误发生时间，通常会比成功执行快一些
+                    error_offset = random.randint(0, 500) / 1000
+                    error_time = base_time + timedelta(seconds=error_offset)
+                
+                    self._add_step(f'Query {query_id} Execution', 
+                                  {'status': 'error', 'algorithm': algorithm, 'message': str(e)}, 
+                                  query_id=query_id, fog_id=fog_id,
+                                  timestamp=error_time)
+                    continue
+        finally:
+            # 取消或异常退出时不再启动排队中的子查询
+            for future in futures:
+                future.cancel()
         
         # 6. 处理和解密结果
         base_time = base_time + timedelta(seconds=0.5)  # 解密开始大约需要0.5秒准备
@@ -1036,6 +1407,7 @@ class QueryProcessor:
             # 跳过没有成功执行的查询
             if query_id not in query_results:
                 continue
+            self._check_cancelled()
                 
             result = query_results[query_id]
             
@@ -1050,11 +1422,8 @@ class QueryProcessor:
                               query_id=query_id, fog_id=fog_id,
                               timestamp=decrypt_start_time)
                 
-                # 实际解密
-                decrypted_results = self._decrypt_results(result['results'])
-                # 为每个结果添加查询ID
-                for res in decrypted_results:
-                    res['rid'] = query_id
+                # 执行阶段已完成解密（按轨迹ID标签去重，各子查询共用缓存）
+                decrypted_results = decrypted_by_query.get(query_id, [])
                 
                 # 模拟解密完成的时间 - 时间与结果数量成正比
                 decrypt_duration = 0.2 + (len(result['results']) * 0.005)  # 基础0.2秒 + 每个结果0.005秒
@@ -1103,6 +1472,7 @@ class QueryProcessor:
         })
                 
         # 执行STV验证
+        self._check_cancelled()
         try:
             if hasattr(self.stv_processor, 'verify_trajectories'):
                 valid_trajectories = self.stv_processor.verify_trajectories(
@@ -1130,19 +1500,74 @@ class QueryProcessor:
             self._add_step('STV Verification', {'status': 'error', 'message': str(e)})
             return []
         
-    def query_api(self, queries: List[Dict[str, Any]], time_span: int, algorithm: str = 'sstp') -> Dict[str, Any]:
+    def query_api(self, queries: List[Dict[str, Any]], time_span: int, algorithm: str = 'sstp',
+                  deadline_seconds: Optional[float] = None, priority: str = 'normal') -> Dict[str, Any]:
         """查询API接口
         
         Args:
             queries: 查询参数列表
             time_span: 时间跨度
             algorithm: 使用的算法，可选 'sstp'(默认) 或 'traversal'
+            deadline_seconds: 查询时间预算（秒），默认使用QUERY_DEADLINE_SECONDS
+            priority: 准入控制优先级，可选 'high'、'normal'(默认) 或 'low'
             
         Returns:
-            查询结果
+            查询结果；未被准入时status为'error'，code为'overloaded'，并给出retry_after秒数
         """
+        self.priority = priority
         try:
-            valid_trajectories = self.process_query(queries, time_span, algorithm)
+            # 重复的明文查询直接返回缓存结果，不再经过加密查询流程
+            cache = get_result_cache()
+            if cache is not None:
+                cache_key = make_query_key(queries, time_span, algorithm)
+                fog_epochs = self._get_fog_epochs(queries)
+                cached_trajectories = cache.get(cache_key, fog_epochs)
+                if cached_trajectories is not None:
+                    self.steps = []
+                    self.parallel_steps = {}
+                    self._add_step('Result Cache', {
+                        'status': 'success',
+                        'message': 'Results served from query result cache',
+                        'valid_trajectories_count': len(cached_trajectories)
+                    })
+                    return {
+                        'status': 'success',
+                        'data': {
+                            'valid_trajectories': cached_trajectories,
+                            'total_count': len(cached_trajectories),
+                            'algorithm': algorithm,
+                            'cached': True,
+                            'partial': False,
+                            'failed_queries': [],
+                            'steps': self.steps,
+                            'parallel_steps': []
+                        }
+                    }
+            
+            # 全局准入控制：排队时间计入查询预算，过载时直接拒绝而不是让下游超时
+            if deadline_seconds is None:
+                deadline_seconds = getattr(settings, 'QUERY_DEADLINE_SECONDS', 30)
+            try:
+                with admission('global', priority, timeout=deadline_seconds or None) as waited:
+                    if deadline_seconds:
+                        deadline_seconds = max(deadline_seconds - waited, 0.001)
+                    valid_trajectories = self.process_query(queries, time_span, algorithm, deadline_seconds)
+            except AdmissionRejected as e:
+                return {
+                    'status': 'error',
+                    'code': 'overloaded',
+                    'message': str(e),
+                    'retry_after': e.retry_after,
+                    'algorithm': algorithm,
+                    'steps': [],
+                    'parallel_steps': []
+                }
+            
+            # 只缓存所有子查询都成功且各雾服务器版本号可读的结果，避免缓存部分结果
+            if cache is not None and fog_epochs and None not in fog_epochs.values() and not self.partial and not any(
+                step['details'].get('status') == 'error' for step in self.steps
+            ):
+                cache.put(cache_key, valid_trajectories, fog_epochs)
             
             # 清空 sstp_queryrequest 表
             try:
@@ -1158,10 +1583,15 @@ class QueryProcessor:
                     'valid_trajectories': valid_trajectories,
                     'total_count': len(valid_trajectories),
                     'algorithm': algorithm,
+                    'cached': False,
+                    'partial': self.partial,  # 存在超时、失败或被截断的子查询
+                    'failed_queries': self.failed_queries,
                     'steps': self.steps,  # 常规串行步骤记录
                     'parallel_steps': list(self.parallel_steps.values())  # 并行执行模拟步骤记录
                 }
             }
+        except QueryCancelled:
+            raise
         except Exception as e:
             import traceback
             traceback_str = traceback.format_exc()
@@ -1174,6 +1604,17 @@ class QueryProcessor:
                 'parallel_steps': list(self.parallel_steps.values())  # 并行执行模拟步骤记录
             }
             
+    def _get_fog_epochs(self, queries: List[Dict[str, Any]]) -> Dict[int, Any]:
+        """读取查询涉及的各雾服务器的摄取版本号，返回 {fog_id: epoch}"""
+        fog_servers = {}
+        for query in queries:
+            if 'keyword' not in query:
+                continue
+            fog_server = self._get_fog_server_by_keyword(query['keyword'])
+            if fog_server:
+                fog_servers[fog_server['id']] = fog_server
+        return get_epoch_tracker().get_epochs(fog_servers.values())
+    
     def _simple_stv_verification(self, trajectories, query_params):
         """
         简化版的STV验证，根据查询参数验证轨迹
@@ -0,0 +1,165 @@
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+from .fog_sessions import get_fog_session
+
+# 参与缓存键计算的明文查询字段，rid、fog_server等由处理流程填充的字段不计入
+QUERY_KEY_FIELDS = ('keyword', 'morton_range', 'grid_range', 'point_range')
+
+
+def make_query_key(queries, time_span, algorithm):
+    """
+    计算明文查询的规范化哈希
+
+    子查询顺序决定rid编号和STV验证的查询区间，因此保留顺序；
+    字典字段按键排序，整数值的浮点数统一为整数，保证等价的查询得到同一个键。
+    """
+    def normalize(value):
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    canonical = {
+        'queries': [
+            {field: normalize(query.get(field)) for field in QUERY_KEY_FIELDS}
+            for query in queries
+        ],
+        'time_span': normalize(time_span),
+        'algorithm': algorithm
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class QueryResultCache:
+    """
+    查询客户端的结果缓存
+
+    以明文查询的规范化哈希为键，缓存解密并经过STV验证的轨迹结果。
+    条目在TTL到期或任一相关雾服务器的摄取版本号（IngestionEpoch）变化时失效。
+    """
+
+    def __init__(self, ttl, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (过期时间, {fog_id: epoch}, 结果)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, current_epochs):
+        """
+        读取缓存
+
+        current_epochs: {fog_id: 当前摄取版本号}，与写入时记录的版本号不一致则视为失效
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, epochs, value = entry
+                if expires_at > time.monotonic() and all(
+                    current_epochs.get(fog_id) is not None and current_epochs.get(fog_id) == epoch
+                    for fog_id, epoch in epochs.items()
+                ):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, epochs):
+        """写入缓存，epochs为计算结果时各雾服务器的摄取版本号"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(epochs), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+class FogEpochTracker:
+    """
+    雾服务器摄取版本号读取器
+
+    雾服务器的Cassandra会话由get_fog_session复用；两次读取之间至少间隔check_interval秒，
+    期间直接返回上次读到的版本号，使重复查询不必访问雾服务器。
+    """
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self._epochs = {}  # fog_id -> (读取时间, 版本号)
+        self._lock = threading.Lock()
+
+    def get_epochs(self, fog_servers):
+        """返回 {fog_id: 版本号}，读取失败的雾服务器版本号为None"""
+        return {fog_server['id']: self._get_epoch(fog_server) for fog_server in fog_servers}
+
+    def _get_epoch(self, fog_server):
+        fog_id = fog_server['id']
+        now = time.monotonic()
+        with self._lock:
+            cached = self._epochs.get(fog_id)
+            if cached is not None and now - cached[0] < self.check_interval:
+                return cached[1]
+
+        try:
+            row = get_fog_session(fog_server).execute(
+                "SELECT epoch FROM gko_space.IngestionEpoch WHERE name = 'trajectory'"
+            ).one()
+            epoch = row.epoch if row else 0
+        except Exception as e:
+            print(f"读取雾服务器 {fog_id} 摄取版本号失败: {str(e)}")
+            epoch = None
+
+        with self._lock:
+            self._epochs[fog_id] = (now, epoch)
+        return epoch
+
+
+_result_cache = None
+_epoch_tracker = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """获取进程内共享的查询结果缓存，QUERY_RESULT_CACHE_TTL为0时返回None"""
+    global _result_cache, _epoch_tracker
+    ttl = getattr(settings, 'QUERY_RESULT_CACHE_TTL', 300)
+    if not ttl:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = QueryResultCache(ttl, getattr(settings, 'QUERY_RESULT_CACHE_MAX_ENTRIES', 256))
+            _epoch_tracker = FogEpochTracker(getattr(settings, 'QUERY_RESULT_CACHE_EPOCH_CHECK_INTERVAL', 5))
+        return _result_cache
+
+def get_epoch_tracker():
+    """获取与结果缓存配套的雾服务器摄取版本号读取器"""
+    get_result_cache()
+    return _epoch_tracker
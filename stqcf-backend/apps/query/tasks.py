@@ -0,0 +1,110 @@
+import json
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.utils import timezone
+
+from .models import QueryJob
+from .progress import publish_progress
+
+logger = get_task_logger(__name__)
+
+
+@shared_task(bind=True)
+def run_query_job(self, job_id):
+    """在Celery worker中执行异步查询任务，持久化步骤记录和结果，并发布进度事件"""
+    # QueryProcessor模块导入时会初始化Django和加密组件，只在worker执行任务时导入
+    from .query_processor import QueryProcessor, QueryCancelled
+
+    try:
+        job = QueryJob.objects.get(pk=job_id)
+    except QueryJob.DoesNotExist:
+        logger.error(f"查询任务 {job_id} 不存在")
+        return
+
+    # 条件更新认领任务：取消请求或其他worker写入的结束状态不会被覆盖
+    claimed = QueryJob.objects.filter(
+        pk=job_id, status__in=['pending', 'running'], cancel_requested=False
+    ).update(status='running', started_at=timezone.now())
+    if not claimed:
+        # 请求取消时仍处于执行中的任务（例如重新投递的消息）直接结束为取消状态
+        QueryJob.objects.filter(pk=job_id, status='running', cancel_requested=True).update(
+            status='cancelled', finished_at=timezone.now()
+        )
+        logger.info(f"查询任务 {job_id} 已取消或已结束，跳过执行")
+        return
+
+    channel = str(job_id)
+    steps = []
+    partial_results = []
+    # 之后的写入只对执行中的任务生效
+    running = QueryJob.objects.filter(pk=job_id, status='running')
+
+    def record_step(step):
+        steps.append(step)
+        running.update(steps=json.dumps(steps, default=str))
+        publish_progress(channel, {'type': 'step', 'seq': len(steps) - 1, 'data': step})
+
+    def record_event(event_type, data):
+        if event_type == 'partial_result':
+            # 部分结果持久化，事件流连接晚于结果产生时可以补发
+            partial_results.append(data)
+            running.update(partial_results=json.dumps(partial_results, default=str))
+            publish_progress(channel, {'type': event_type, 'seq': len(partial_results) - 1, 'data': data})
+        else:
+            publish_progress(channel, {'type': event_type, 'data': data})
+
+    def is_cancelled():
+        # 已请求取消或任务已不在执行中（被取消或结束）时停止
+        return not running.filter(cancel_requested=False).exists()
+
+    def finish(status, **fields):
+        targets = running if status == 'cancelled' else running.filter(cancel_requested=False)
+        updated = targets.update(
+            status=status, steps=json.dumps(steps, default=str), finished_at=timezone.now(), **fields
+        )
+        if not updated:
+            if status != 'cancelled' and running.exists():
+                # 执行结束前收到取消请求，以取消状态结束
+                logger.info(f"查询任务 {job_id} 在完成前被取消")
+                finish('cancelled')
+            return
+        publish_progress(channel, {
+            'type': 'done',
+            'data': {'status': status, 'total_count': fields.get('total_count', 0), 'error': fields.get('error')}
+        })
+
+    try:
+        processor = QueryProcessor()
+        processor.step_listener = record_step
+        processor.event_listener = record_event
+        processor.cancel_check = is_cancelled
+        # 异步任务以低优先级排队，过载时让位于同步查询
+        result = processor.query_api(job.get_queries(), job.time_span, job.algorithm, priority='low')
+    except QueryCancelled:
+        logger.info(f"查询任务 {job_id} 已取消")
+        finish('cancelled')
+        return
+    except Exception as e:
+        logger.error(f"查询任务 {job_id} 执行失败: {str(e)}")
+        finish('failed', error=str(e))
+        return
+
+    if result.get('code') == 'overloaded' and self.request.retries < getattr(settings, 'QUERY_JOB_OVERLOAD_RETRIES', 5):
+        # 未被准入的任务回到等待状态，按建议的重试时间重新排队
+        logger.info(f"查询任务 {job_id} 未被准入，{result['retry_after']:.1f} 秒后重试")
+        if not running.filter(cancel_requested=False).update(status='pending', steps=json.dumps(steps, default=str)):
+            finish('cancelled')
+            return
+        raise self.retry(countdown=result['retry_after'])
+
+    if result['status'] == 'success':
+        valid_trajectories = result['data']['valid_trajectories']
+        finish(
+            'completed',
+            results=json.dumps(valid_trajectories, default=str),
+            total_count=len(valid_trajectories)
+        )
+        logger.info(f"查询任务 {job_id} 完成，结果数量: {len(valid_trajectories)}")
+    else:
+        finish('failed', error=result.get('message', '查询处理失败'))
@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+
+from apps.query.progress import InProcessProgressChannel
+
+
+class InProcessProgressChannelTest(SimpleTestCase):
+    """进程内查询进度频道测试"""
+
+    def test_publish_reaches_subscribers_of_channel(self):
+        channel = InProcessProgressChannel()
+        first = channel.subscribe('job-1')
+        second = channel.subscribe('job-2')
+
+        channel.publish('job-1', {'type': 'step', 'seq': 0})
+
+        self.assertEqual(first.get(timeout=0.1), {'type': 'step', 'seq': 0})
+        self.assertIsNone(second.get(timeout=0.01))
+
+    def test_closed_subscription_stops_receiving(self):
+        channel = InProcessProgressChannel()
+        subscription = channel.subscribe('job-1')
+        subscription.close()
+
+        channel.publish('job-1', {'type': 'done'})
+
+        self.assertIsNone(subscription.get(timeout=0.01))
+        self.assertEqual(channel._subscribers, {})
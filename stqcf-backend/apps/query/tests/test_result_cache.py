@@ -0,0 +1,67 @@
+from django.test import SimpleTestCase
+
+from apps.query.result_cache import QueryResultCache, make_query_key
+
+
+QUERY = {
+    'keyword': 1,
+    'morton_range': {'min': '123456', 'max': '123789'},
+    'grid_range': {'min_x': 1.0, 'min_y': 2, 'min_z': 1, 'max_x': 3, 'max_y': 4, 'max_z': 2},
+    'point_range': {'lat_min': 39.9, 'lat_max': 40.0, 'lon_min': 116.3, 'lon_max': 116.4,
+                    'time_min': 0, 'time_max': 86400}
+}
+
+
+class QueryKeyTest(SimpleTestCase):
+    """明文查询规范化哈希测试"""
+
+    def test_ignores_fields_added_by_processing(self):
+        processed = dict(QUERY, rid=1, fog_id=2, fog_server={'id': 2})
+        self.assertEqual(make_query_key([QUERY], 7, 'sstp'), make_query_key([processed], 7, 'sstp'))
+
+    def test_integral_floats_normalized(self):
+        other = dict(QUERY, grid_range=dict(QUERY['grid_range'], min_x=1))
+        self.assertEqual(make_query_key([QUERY], 7, 'sstp'), make_query_key([other], 7, 'sstp'))
+
+    def test_algorithm_and_time_span_in_key(self):
+        key = make_query_key([QUERY], 7, 'sstp')
+        self.assertNotEqual(key, make_query_key([QUERY], 7, 'traversal'))
+        self.assertNotEqual(key, make_query_key([QUERY], 8, 'sstp'))
+
+
+class QueryResultCacheTest(SimpleTestCase):
+    """查询结果缓存测试"""
+
+    def test_hit_returns_copy(self):
+        cache = QueryResultCache(ttl=60)
+        cache.put('k', [{'traj_id': 1}], {1: 3})
+        value = cache.get('k', {1: 3})
+        self.assertEqual(value, [{'traj_id': 1}])
+        value[0]['traj_id'] = 2
+        self.assertEqual(cache.get('k', {1: 3}), [{'traj_id': 1}])
+
+    def test_epoch_change_invalidates(self):
+        cache = QueryResultCache(ttl=60)
+        cache.put('k', [1], {1: 3, 2: 5})
+        self.assertIsNone(cache.get('k', {1: 3, 2: 6}))
+        self.assertIsNone(cache.get('k', {1: 3, 2: 5}))  # 失效条目已删除
+
+    def test_unreadable_epoch_is_miss(self):
+        cache = QueryResultCache(ttl=60)
+        cache.put('k', [1], {1: None})
+        self.assertIsNone(cache.get('k', {1: None}))
+
+    def test_ttl_expiry(self):
+        cache = QueryResultCache(ttl=0)
+        cache.put('k', [1], {1: 3})
+        self.assertIsNone(cache.get('k', {1: 3}))
+
+    def test_lru_capacity(self):
+        cache = QueryResultCache(ttl=60, max_entries=2)
+        cache.put('a', [1], {})
+        cache.put('b', [2], {})
+        cache.get('a', {})
+        cache.put('c', [3], {})
+        self.assertIsNone(cache.get('b', {}))
+        self.assertEqual(cache.get('a', {}), [1])
+        self.assertEqual(cache.stats()['entries'], 2)
@@ -3,6 +3,12 @@ from .views import (
     trajectory_query,
     trajectory_query_traversal,
     QueryProcessView,
+    submit_query_job,
+    query_job_status,
+    query_job_results,
+    cancel_query_job,
+    query_job_events,
+    admission_metrics,
 )
 
 app_name = 'query'
@@ -13,4 +19,12 @@ urlpatterns = [
     # 添加新的URL模式
     path('api/trajectory', trajectory_query, name='trajectory_query'),
     path('api/trajectory/traversal', trajectory_query_traversal, name='trajectory_query_traversal'),
+    # 异步查询任务接口
+    path('api/jobs', submit_query_job, name='submit_query_job'),
+    path('api/jobs/<uuid:job_id>', query_job_status, name='query_job_status'),
+    path('api/jobs/<uuid:job_id>/results', query_job_results, name='query_job_results'),
+    path('api/jobs/<uuid:job_id>/cancel', cancel_query_job, name='cancel_query_job'),
+    path('api/jobs/<uuid:job_id>/events', query_job_events, name='query_job_events'),
+    # 准入控制指标
+    path('api/admission/metrics', admission_metrics, name='admission_metrics'),
 ] 
\ No newline at end of file
@@ -3,13 +3,19 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 import json
+import math
 import logging
 import traceback
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
 from apps.query.query_processor import QueryProcessor
+from apps.query.models import QueryJob
+from apps.query.tasks import run_query_job
+from apps.query.progress import get_progress_channel, publish_progress
+from apps.sstp.admission import PRIORITIES, get_admission_controller
 
 logger = logging.getLogger(__name__)
 
@@ -100,6 +106,9 @@ class QueryProcessView(APIView):
             # 如果查询成功，返回结果
             if result['status'] == 'success':
                 return Response(result)
+            elif result.get('code') == 'overloaded':
+                return Response(result, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                headers={'Retry-After': str(math.ceil(result['retry_after']))})
             else:
                 # 如果查询失败，返回错误信息
                 return Response({
@@ -117,6 +126,14 @@ class QueryProcessView(APIView):
                 'message': f'综合查询处理失败: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _query_response(result):
+    """把query_api的结果转换为HTTP响应，未被准入的查询返回503并带Retry-After头"""
+    if result.get('code') == 'overloaded':
+        response = JsonResponse(result, status=503)
+        response['Retry-After'] = str(math.ceil(result['retry_after']))
+        return response
+    return JsonResponse(result)
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def trajectory_query(request):
@@ -140,9 +157,13 @@ def trajectory_query(request):
             }
         ],
         "time_span": 7,
-        "algorithm": "sstp"  // 可选，默认为"sstp"，也可以是"traversal"
+        "algorithm": "sstp",  // 可选，默认为"sstp"，也可以是"traversal"
+        "deadline_seconds": 10,  // 可选，查询时间预算，超时的子查询以部分结果返回
+        "priority": "normal"  // 可选，过载排队时的优先级："high"、"normal"或"low"
     }
     
+    过载时返回503，响应体code为"overloaded"，Retry-After头给出建议的重试秒数。
+    
     响应格式:
     {
         "status": "success/error",
@@ -150,6 +171,8 @@ def trajectory_query(request):
             "valid_trajectories": [轨迹ID列表],
             "total_count": 轨迹数量,
             "algorithm": "使用的算法",
+            "partial": 是否只返回了部分结果,
+            "failed_queries": [未得到结果的子查询],
             "steps": [处理步骤记录]
         }
     }
@@ -162,6 +185,8 @@ def trajectory_query(request):
         queries = data.get('queries', [])
         time_span = data.get('time_span', 7)  # 默认7天
         algorithm = data.get('algorithm', 'sstp')  # 默认使用SSTP算法
+        deadline_seconds = data.get('deadline_seconds')  # 可选，默认使用QUERY_DEADLINE_SECONDS
+        priority = data.get('priority', 'normal')
         
         # 验证算法参数
         if algorithm not in ['sstp', 'traversal']:
@@ -170,14 +195,20 @@ def trajectory_query(request):
                 'message': '不支持的算法类型，必须是 "sstp" 或 "traversal"'
             }, status=400)
         
+        if priority not in PRIORITIES:
+            return JsonResponse({
+                'status': 'error',
+                'message': '不支持的优先级，必须是 "high"、"normal" 或 "low"'
+            }, status=400)
+        
         # 初始化查询处理器
         processor = QueryProcessor()
         
         # 执行查询
-        result = processor.query_api(queries, time_span, algorithm)
+        result = processor.query_api(queries, time_span, algorithm, deadline_seconds, priority)
         
         # 返回结果
-        return JsonResponse(result)
+        return _query_response(result)
         
     except json.JSONDecodeError:
         logger.error("无效的JSON请求")
@@ -215,7 +246,7 @@ def trajectory_query_traversal(request):
         result = processor.query_api(queries, time_span, 'traversal')
         
         # 返回结果
-        return JsonResponse(result)
+        return _query_response(result)
         
     except json.JSONDecodeError:
         logger.error("无效的JSON请求")
@@ -228,4 +259,256 @@ def trajectory_query_traversal(request):
         return JsonResponse({
             'status': 'error',
             'message': f'内部服务器错误: {str(e)}'
-        }, status=500) 
\ No newline at end of file
+        }, status=500) 
+
+def _job_summary(job):
+    """异步查询任务的状态摘要"""
+    return {
+        'job_id': str(job.id),
+        'status': job.status,
+        'algorithm': job.algorithm,
+        'total_count': job.total_count,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def submit_query_job(request):
+    """
+    提交异步轨迹查询任务
+    
+    请求格式与trajectory_query相同，立即返回任务ID，查询在Celery worker中执行。
+    
+    响应格式:
+    {
+        "status": "success",
+        "data": {"job_id": "任务ID", "status": "pending", ...}
+    }
+    """
+    try:
+        data = json.loads(request.body)
+        
+        queries = data.get('queries', [])
+        time_span = data.get('time_span', 7)  # 默认7天
+        algorithm = data.get('algorithm', 'sstp')  # 默认使用SSTP算法
+        
+        if not queries:
+            return JsonResponse({
+                'status': 'error',
+                'message': '缺少查询参数'
+            }, status=400)
+        
+        if algorithm not in ['sstp', 'traversal']:
+            return JsonResponse({
+                'status': 'error',
+                'message': '不支持的算法类型，必须是 "sstp" 或 "traversal"'
+            }, status=400)
+        
+        job = QueryJob.objects.create(
+            algorithm=algorithm,
+            time_span=time_span,
+            queries=json.dumps(queries)
+        )
+        async_result = run_query_job.delay(str(job.id))
+        QueryJob.objects.filter(pk=job.id).update(celery_task_id=async_result.id)
+        
+        logger.info(f"提交异步查询任务 {job.id}: queries={len(queries)}, algorithm={algorithm}")
+        return JsonResponse({
+            'status': 'success',
+            'data': _job_summary(job)
+        }, status=202)
+        
+    except json.JSONDecodeError:
+        logger.error("无效的JSON请求")
+        return JsonResponse({
+            'status': 'error',
+            'message': '无效的JSON格式'
+        }, status=400)
+    except Exception as e:
+        logger.exception(f"提交异步查询任务时发生错误: {str(e)}")
+        return JsonResponse({
+            'status': 'error',
+            'message': f'内部服务器错误: {str(e)}'
+        }, status=500)
+
+@require_http_methods(["GET"])
+def query_job_status(request, job_id):
+    """
+    查询异步任务状态
+    
+    参数:
+    since: 只返回第since条之后的步骤记录，便于前端增量轮询（默认0）
+    """
+    try:
+        job = QueryJob.objects.get(pk=job_id)
+    except QueryJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': '查询任务不存在'}, status=404)
+    
+    try:
+        since = max(int(request.GET.get('since', 0)), 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'since参数必须是整数'}, status=400)
+    
+    steps = job.get_steps()
+    data = _job_summary(job)
+    data.update({
+        'steps': steps[since:],
+        'next_since': len(steps)
+    })
+    return JsonResponse({'status': 'success', 'data': data})
+
+@require_http_methods(["GET"])
+def query_job_results(request, job_id):
+    """
+    分页获取异步任务的结果轨迹
+    
+    参数:
+    page: 页码，从1开始（默认1）
+    page_size: 每页数量（默认100，最大1000）
+    """
+    try:
+        job = QueryJob.objects.get(pk=job_id)
+    except QueryJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': '查询任务不存在'}, status=404)
+    
+    if job.status != 'completed':
+        return JsonResponse({
+            'status': 'error',
+            'message': f'查询任务尚未完成，当前状态: {job.status}'
+        }, status=409)
+    
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', 100)), 1), 1000)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': '分页参数必须是整数'}, status=400)
+    
+    results = job.get_results()
+    start = (page - 1) * page_size
+    return JsonResponse({
+        'status': 'success',
+        'data': {
+            'job_id': str(job.id),
+            'valid_trajectories': results[start:start + page_size],
+            'total_count': len(results),
+            'page': page,
+            'page_size': page_size,
+            'has_more': start + page_size < len(results)
+        }
+    })
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def cancel_query_job(request, job_id):
+    """
+    取消异步查询任务
+    
+    未开始的任务直接标记为已取消并撤销Celery任务；执行中的任务在下一个阶段边界中止。
+    """
+    try:
+        job = QueryJob.objects.get(pk=job_id)
+    except QueryJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': '查询任务不存在'}, status=404)
+    
+    if job.is_finished:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'查询任务已结束，当前状态: {job.status}'
+        }, status=409)
+    
+    QueryJob.objects.filter(pk=job_id).update(cancel_requested=True)
+    # 仍在排队的任务直接取消，执行中的任务由worker检查取消标记后结束
+    QueryJob.objects.filter(pk=job_id, status='pending').update(status='cancelled')
+    if job.celery_task_id:
+        run_query_job.app.control.revoke(job.celery_task_id)
+    
+    job.refresh_from_db()
+    if job.status == 'cancelled':
+        publish_progress(str(job_id), {'type': 'done', 'data': {'status': 'cancelled', 'total_count': 0, 'error': None}})
+    logger.info(f"取消异步查询任务 {job_id}，当前状态: {job.status}")
+    return JsonResponse({'status': 'success', 'data': _job_summary(job)})
+
+def _sse_message(event):
+    """格式化为text/event-stream消息"""
+    lines = [f"event: {event['type']}"]
+    if 'seq' in event:
+        lines.append(f"id: {event['type']}-{event['seq']}")
+    lines.append(f"data: {json.dumps(event.get('data'), default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+def _job_event_stream(job_id):
+    """
+    异步查询任务的事件流
+    
+    先订阅进度频道，再补发已持久化的步骤和部分结果，之后转发实时事件；
+    step和partial_result事件按序号去重。任务结束后发送done事件并关闭。
+    """
+    keepalive = getattr(settings, 'QUERY_PROGRESS_KEEPALIVE', 15)
+    subscription = get_progress_channel().subscribe(str(job_id))
+    try:
+        job = QueryJob.objects.get(pk=job_id)
+        sent = {'step': 0, 'partial_result': 0}
+        for step in job.get_steps():
+            yield _sse_message({'type': 'step', 'seq': sent['step'], 'data': step})
+            sent['step'] += 1
+        for partial in job.get_partial_results():
+            yield _sse_message({'type': 'partial_result', 'seq': sent['partial_result'], 'data': partial})
+            sent['partial_result'] += 1
+        
+        while not job.is_finished:
+            event = subscription.get(timeout=keepalive)
+            if event is None:
+                # 超时发送注释保持连接，并确认任务是否已在订阅前结束
+                yield ': keepalive\n\n'
+                job.refresh_from_db(fields=['status', 'total_count', 'error'])
+                continue
+            if event['type'] in sent:
+                if event['seq'] < sent[event['type']]:
+                    continue
+                sent[event['type']] = event['seq'] + 1
+            elif event['type'] == 'done':
+                break
+            yield _sse_message(event)
+        
+        job.refresh_from_db(fields=['status', 'total_count', 'error'])
+        yield _sse_message({
+            'type': 'done',
+            'data': {'status': job.status, 'total_count': job.total_count, 'error': job.error}
+        })
+    finally:
+        subscription.close()
+
+@require_http_methods(["GET"])
+def query_job_events(request, job_id):
+    """
+    异步查询任务的Server-Sent Events进度流
+    
+    事件类型:
+    step: query_api记录的步骤（路由、连接、加密、执行、解密、STV验证）
+    scan_progress: 遍历算法每完成一个令牌环区间的扫描进度
+    partial_result: 某个子查询完成并解密后的轨迹（STV验证前）
+    done: 任务结束，附带最终状态和结果数量
+    """
+    if not QueryJob.objects.filter(pk=job_id).exists():
+        return JsonResponse({'status': 'error', 'message': '查询任务不存在'}, status=404)
+    
+    response = StreamingHttpResponse(_job_event_stream(job_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 禁止Nginx缓冲事件流
+    return response
+
+@require_http_methods(["GET"])
+def admission_metrics(request):
+    """
+    准入控制指标：各准入键（global、fog:<id>、central）的队列深度、执行中请求数、
+    准入/排队/拒绝/挤出/超时计数以及平均和最大等待时间
+    
+    指标只反映处理本请求的进程。
+    """
+    controller = get_admission_controller()
+    if controller is None:
+        return JsonResponse({'status': 'success', 'data': {'enabled': False}})
+    return JsonResponse({'status': 'success', 'data': dict(controller.metrics(), enabled=True)})
@@ -0,0 +1,253 @@
+import time
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+# 等待队列优先级，数值越小越优先
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入（等待队列已满、被更高优先级请求挤出或等待超时），调用方应返回过载响应"""
+
+    def __init__(self, key, reason, retry_after):
+        self.key = key
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{key} 过载（{reason}），建议 {retry_after:.1f} 秒后重试")
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数，capacity为桶容量；rate为0时不限速"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self, now):
+        self._refill(now)
+        return not self.rate or self._tokens >= 1
+
+    def take(self, now):
+        self._refill(now)
+        if self.rate:
+            self._tokens -= 1
+
+    def time_until_available(self, now):
+        """距下一个令牌可用的秒数"""
+        self._refill(now)
+        if not self.rate or self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class _Limit:
+    """单个准入键（全局、某个雾服务器或中央服务器）的令牌桶和并发上限"""
+
+    def __init__(self, rate, burst, concurrency):
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.in_flight = 0
+
+    def available(self, now):
+        return (not self.concurrency or self.in_flight < self.concurrency) and self.bucket.available(now)
+
+
+class _Waiter:
+    __slots__ = ('key', 'priority', 'seq', 'shed')
+
+    def __init__(self, key, priority, seq):
+        self.key = key
+        self.priority = priority
+        self.seq = seq
+        self.shed = False
+
+    def order(self):
+        return (self.priority, self.seq)
+
+
+class AdmissionController:
+    """
+    准入控制器
+
+    每个准入键各有一个令牌桶（限制速率）和并发上限（限制同时执行的请求数），
+    键的前缀（'global'、'fog'、'central'）决定使用哪一组限额，如 'fog:2' 使用雾服务器限额。
+    暂时无法准入的请求进入有界等待队列，按优先级和到达顺序准入；队列已满时
+    更高优先级的请求挤出优先级最低的等待者，否则拒绝新请求。
+
+    限额在进程内生效，Web进程和每个Celery worker各自计数。
+    """
+
+    def __init__(self, limits, max_queue=100, max_wait=10):
+        self.limits = limits  # {键前缀: (速率, 突发容量, 并发上限)}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._keys = {}
+        self._waiters = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._metrics = {}
+
+    def _limit(self, key):
+        limit = self._keys.get(key)
+        if limit is None:
+            rate, burst, concurrency = self.limits.get(key.split(':')[0], (0, 1, 0))
+            limit = self._keys[key] = _Limit(rate, burst, concurrency)
+        return limit
+
+    def _key_metrics(self, key):
+        metrics = self._metrics.get(key)
+        if metrics is None:
+            metrics = self._metrics[key] = {
+                'admitted': 0, 'queued': 0, 'rejected': 0, 'shed': 0, 'timed_out': 0,
+                'total_wait': 0.0, 'max_wait': 0.0
+            }
+        return metrics
+
+    def _is_next(self, waiter):
+        """同一键上没有优先级更高或更早到达的等待者时轮到该等待者，不同键的等待者互不阻塞"""
+        return not any(
+            other.key == waiter.key and other.order() < waiter.order()
+            for other in self._waiters
+        )
+
+    def _retry_after(self, limit, now):
+        return max(limit.bucket.time_until_available(now), 1.0)
+
+    @contextmanager
+    def admit(self, key, priority='normal', timeout=None):
+        """
+        获取一个准入许可，离开上下文时释放并发占用
+
+        timeout为调用方愿意等待的秒数（不超过max_wait），超时抛出AdmissionRejected。
+        """
+        waited = self._acquire(key, PRIORITIES.get(priority, PRIORITIES['normal']), timeout)
+        try:
+            yield waited
+        finally:
+            self._release(key)
+
+    def _acquire(self, key, priority, timeout):
+        with self._cond:
+            now = time.monotonic()
+            limit = self._limit(key)
+            metrics = self._key_metrics(key)
+            waiting_on_key = any(waiter.key == key for waiter in self._waiters)
+            if not waiting_on_key and limit.available(now):
+                self._take(limit, metrics, now, 0.0)
+                return 0.0
+
+            if len(self._waiters) >= self.max_queue:
+                worst = max(self._waiters, key=_Waiter.order)
+                if worst.priority <= priority:
+                    metrics['rejected'] += 1
+                    raise AdmissionRejected(key, 'queue full', self._retry_after(limit, now))
+                # 挤出优先级最低的等待者，为更高优先级的请求腾出队列位置
+                worst.shed = True
+                self._waiters.remove(worst)
+                self._cond.notify_all()
+
+            self._seq += 1
+            waiter = _Waiter(key, priority, self._seq)
+            self._waiters.append(waiter)
+            metrics['queued'] += 1
+            started = now
+            wait_limit = self.max_wait if timeout is None else min(timeout, self.max_wait)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if waiter.shed:
+                        metrics['shed'] += 1
+                        raise AdmissionRejected(key, 'shed', self._retry_after(limit, now))
+                    if self._is_next(waiter) and limit.available(now):
+                        self._take(limit, metrics, now, now - started)
+                        return now - started
+                    remaining = started + wait_limit - now
+                    if remaining <= 0:
+                        metrics['timed_out'] += 1
+                        raise AdmissionRejected(key, 'wait timeout', self._retry_after(limit, now))
+                    # 令牌补充不会触发通知，按令牌可用时间定时醒来
+                    refill = limit.bucket.time_until_available(now)
+                    self._cond.wait(min(remaining, refill) if refill else remaining)
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._cond.notify_all()
+
+    def _take(self, limit, metrics, now, waited):
+        limit.bucket.take(now)
+        limit.in_flight += 1
+        metrics['admitted'] += 1
+        metrics['total_wait'] += waited
+        metrics['max_wait'] = max(metrics['max_wait'], waited)
+
+    def _release(self, key):
+        with self._cond:
+            self._keys[key].in_flight -= 1
+            self._cond.notify_all()
+
+    def metrics(self):
+        """各准入键的队列深度、执行中请求数、准入/拒绝计数和等待时间"""
+        with self._cond:
+            result = {}
+            for key, metrics in self._metrics.items():
+                limit = self._keys[key]
+                result[key] = dict(
+                    metrics,
+                    queue_depth=sum(1 for waiter in self._waiters if waiter.key == key),
+                    in_flight=limit.in_flight,
+                    concurrency=limit.concurrency,
+                    avg_wait=metrics['total_wait'] / metrics['admitted'] if metrics['admitted'] else 0.0
+                )
+            return {'queue_depth': len(self._waiters), 'max_queue': self.max_queue, 'keys': result}
+
+
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+def get_admission_controller():
+    """获取进程内共享的准入控制器，QUERY_ADMISSION_ENABLED为False时返回None"""
+    global _admission_controller
+    if not getattr(settings, 'QUERY_ADMISSION_ENABLED', True):
+        return None
+    with _admission_controller_lock:
+        if _admission_controller is None:
+            _admission_controller = AdmissionController(
+                {
+                    'global': (
+                        getattr(settings, 'QUERY_ADMISSION_GLOBAL_RATE', 20),
+                        getattr(settings, 'QUERY_ADMISSION_GLOBAL_BURST', 40),
+                        getattr(settings, 'QUERY_ADMISSION_GLOBAL_CONCURRENCY', 16)
+                    ),
+                    'fog': (
+                        getattr(settings, 'QUERY_ADMISSION_FOG_RATE', 10),
+                        getattr(settings, 'QUERY_ADMISSION_FOG_BURST', 20),
+                        getattr(settings, 'QUERY_ADMISSION_FOG_CONCURRENCY', 4)
+                    ),
+                    'central': (
+                        getattr(settings, 'QUERY_ADMISSION_CENTRAL_RATE', 0),
+                        getattr(settings, 'QUERY_ADMISSION_CENTRAL_BURST', 1),
+                        getattr(settings, 'QUERY_ADMISSION_CENTRAL_CONCURRENCY', 32)
+                    )
+                },
+                max_queue=getattr(settings, 'QUERY_ADMISSION_MAX_QUEUE', 100),
+                max_wait=getattr(settings, 'QUERY_ADMISSION_MAX_WAIT', 10)
+            )
+        return _admission_controller
+
+@contextmanager
+def admission(key, priority='normal', timeout=None):
+    """在准入控制下执行，准入控制关闭时直接执行"""
+    controller = get_admission_controller()
+    if controller is None:
+        yield 0.0
+        return
+    with controller.admit(key, priority, timeout) as waited:
+        yield waited
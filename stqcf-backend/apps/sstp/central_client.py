@@ -2,8 +2,10 @@ import requests
 import json
 import logging
 import pickle
+import time
 from django.conf import settings
 from .security import generate_secure_token
+from .admission import admission, AdmissionRejected
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -19,6 +21,7 @@ class CentralServerClient:
         self.base_url = getattr(settings, 'CENTRAL_SERVER_URL', 'http://localhost:8000')
         self.api_key = getattr(settings, 'CENTRAL_SERVER_API_KEY', 'default-api-key')
         self.timeout = getattr(settings, 'CENTRAL_SERVER_TIMEOUT', 5)  # 减少超时时间到5秒
+        self.deadline = None  # 查询截止时间（time.monotonic()），设置后请求超时不超过剩余预算
         
         logger.debug(f"初始化中央服务器客户端: URL={self.base_url}, timeout={self.timeout}")
         
@@ -172,6 +175,62 @@ class CentralServerClient:
                 'message': f'发生未知错误: {str(e)}'
             }
     
+    def check_morton_range_batch(self, node_mc, ranges):
+        """
+        请求中央服务器一次检查节点Morton码是否落在多个查询的加密范围内
+        
+        参数:
+        node_mc: 节点的Morton码列表 [mc_min, mc_max]
+        ranges: 查询范围列表，每项为 {'rid', 'enc_min', 'enc_max'}
+        
+        返回:
+        包含results字段的结果字典，results与ranges一一对应，每项包含in_range字段
+        """
+        # 如果节点没有Morton码，则全部通过（不剪枝）
+        if not node_mc or len(node_mc) < 2:
+            logger.debug("节点没有Morton码，不进行剪枝")
+            return {'results': [{'rid': item['rid'], 'in_range': True} for item in ranges]}
+        
+        payload = {
+            'node_mc': node_mc,
+            'ranges': ranges
+        }
+        
+        # 生成安全令牌
+        token = generate_secure_token(f"{len(ranges)}:{node_mc[0]}:{node_mc[1]}")
+        if token:
+            payload['token'] = token
+        
+        return self._make_request('/api/check-morton-range-batch/', payload)
+    
+    def check_grid_range_batch(self, node_gc, ranges):
+        """
+        请求中央服务器一次检查节点网格坐标与多个查询的加密范围是否有交集
+        
+        参数:
+        node_gc: 节点的网格坐标 [min_x, min_y, max_x, max_y, z]
+        ranges: 查询范围列表，每项为 {'rid', 'enc_min_x', 'enc_min_y', 'enc_max_x', 'enc_max_y'}
+        
+        返回:
+        包含results字段的结果字典，results与ranges一一对应，每项包含in_range字段
+        """
+        # 如果节点没有网格坐标，则全部通过（不剪枝）
+        if not node_gc or len(node_gc) < 4:
+            logger.debug("节点没有网格坐标，不进行剪枝")
+            return {'results': [{'rid': item['rid'], 'in_range': True} for item in ranges]}
+        
+        payload = {
+            'node_gc': node_gc,
+            'ranges': ranges
+        }
+        
+        # 生成安全令牌
+        token = generate_secure_token(f"{len(ranges)}:{node_gc[0]}:{node_gc[1]}:{node_gc[2]}:{node_gc[3]}")
+        if token:
+            payload['token'] = token
+        
+        return self._make_request('/api/check-grid-range-batch/', payload)
+    
     def check_fully_covered(self, rid, node_gc, enc_min_x, enc_min_y, enc_max_x, enc_max_y):
         """
         请求中央服务器检查节点是否完全被加密的查询范围覆盖
@@ -201,7 +260,8 @@ class CentralServerClient:
         
         return self._make_request('/api/check-fully-covered/', payload)
     
-    def verify_points_in_range(self, rid, points_data, enc_p_min_x, enc_p_min_y, enc_p_max_x, enc_p_max_y):
+    def verify_points_in_range(self, rid, points_data, enc_p_min_x, enc_p_min_y, enc_p_max_x, enc_p_max_y,
+                               enc_t_min=None, enc_t_max=None):
         """
         请求中央服务器解密轨迹点并验证是否在加密的P范围内
         
@@ -210,6 +270,7 @@ class CentralServerClient:
         points_data: 轨迹点数据列表，每个点包含加密的经纬度和轨迹ID
         enc_p_min_x, enc_p_min_y: 加密的查询点范围最小坐标
         enc_p_max_x, enc_p_max_y: 加密的查询点范围最大坐标
+        enc_t_min, enc_t_max: 可选的加密时间范围，提供时同时验证点的时间
         
         返回:
         验证结果列表，每个结果包含in_range字段
@@ -222,6 +283,9 @@ class CentralServerClient:
             'enc_p_max_x': enc_p_max_x,
             'enc_p_max_y': enc_p_max_y
         }
+        if enc_t_min is not None and enc_t_max is not None:
+            payload['enc_t_min'] = enc_t_min
+            payload['enc_t_max'] = enc_t_max
         
         # 生成安全令牌
         token = generate_secure_token(f"{rid}:{len(points_data)}")
@@ -253,6 +317,15 @@ class CentralServerClient:
         
         return self._make_request('/api/receive-ctk-results/', payload)
     
+    def _request_timeout(self):
+        """本次请求的超时时间，取配置超时和查询剩余预算的较小值"""
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout('查询截止时间已到')
+        return min(self.timeout, remaining)
+    
     def _make_request(self, endpoint, payload):
         """
         发送API请求到中央服务器
@@ -275,16 +348,18 @@ class CentralServerClient:
             logger.debug(f"发送请求到: {url}")
             logger.debug(f"请求头: Authorization=ApiKey {self.api_key[:5]}..., Content-Type=application/json")
             
-            response = self.session.post(
-                url,
-                json=serialized_payload,
-                headers={
-                    'Authorization': f'ApiKey {self.api_key}',
-                    'Content-Type': 'application/json',
-                    'X-Fog-ID': str(getattr(settings, 'FOG_SERVER_ID', 'unknown'))
-                },
-                timeout=self.timeout
-            )
+            # 限制对中央服务器的并发请求，过载时排队而不是让请求超时
+            with admission('central', timeout=self._request_timeout()):
+                response = self.session.post(
+                    url,
+                    json=serialized_payload,
+                    headers={
+                        'Authorization': f'ApiKey {self.api_key}',
+                        'Content-Type': 'application/json',
+                        'X-Fog-ID': str(getattr(settings, 'FOG_SERVER_ID', 'unknown'))
+                    },
+                    timeout=self._request_timeout()
+                )
             
             logger.debug(f"收到响应: {response.status_code}")
             response.raise_for_status()
@@ -294,6 +369,14 @@ class CentralServerClient:
             logger.debug(f"响应数据: {json.dumps(result, indent=2)}")
             return self._deserialize_response(result)
             
+        except AdmissionRejected as e:
+            logger.error(f"中央服务器请求未被准入: {endpoint}: {str(e)}")
+            return {
+                'error': 'overloaded',
+                'status': 'error',
+                'message': str(e),
+                'retry_after': e.retry_after
+            }
         except requests.exceptions.Timeout:
             logger.error(f"请求超时: {endpoint}")
             return {
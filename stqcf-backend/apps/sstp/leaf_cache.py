@@ -0,0 +1,149 @@
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 元组和字符串对象的固定开销估算（字节）
+_ENTRY_OVERHEAD = sys.getsizeof(()) + 64
+_ROW_OVERHEAD = sys.getsizeof(()) + 3 * sys.getsizeof('')
+
+
+class LeafPartitionCache:
+    """
+    雾服务器本地的叶子分区LRU缓存
+
+    以 (fog_id, keyword, node_id) 为键缓存已解码的TrajectoryDate分区，
+    值为 [(traj_id_hex, t_date_hex, traj_tag_hex), ...]。同一进程可能查询多个雾服务器，
+    键中的fog_id区分不同雾服务器上的同名分区。缓存按估算字节数限容，
+    某个雾服务器的摄取版本号（IngestionEpoch）变化时只失效该雾服务器的分区。
+    """
+
+    def __init__(self, max_bytes, epoch_check_interval=5):
+        self.max_bytes = max_bytes
+        self.epoch_check_interval = epoch_check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._epochs = {}  # fog_id -> 摄取版本号
+        self._epoch_checked_at = {}  # fog_id -> 上次检查时间
+        self._generation = 0  # 每次清空加1，防止清空前发起的加载写回旧数据
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        """读取缓存，未命中时调用loader()加载并写入缓存"""
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return rows
+            self.misses += 1
+            generation = self._generation
+
+        rows = loader()
+        self.put(key, rows, generation)
+        return rows
+
+    def put(self, key, rows, generation=None):
+        """写入缓存，超出容量时淘汰最久未使用的分区"""
+        size = self._estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._bytes -= self._estimate_size(self._entries.pop(key))
+            self._entries[key] = rows
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._estimate_size(evicted)
+                self.evictions += 1
+
+    def clear(self, fog_id=None):
+        """清空缓存，指定fog_id时只清空该雾服务器的分区"""
+        with self._lock:
+            if fog_id is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                for key in [key for key in self._entries if key[0] == fog_id]:
+                    self._bytes -= self._estimate_size(self._entries.pop(key))
+            self._generation += 1
+
+    def sync_epoch(self, session, fog_id):
+        """
+        通过雾服务器的会话检查其摄取版本号，变化时清空该雾服务器的分区
+
+        为避免每次查询都访问Cassandra，同一雾服务器两次检查之间至少间隔epoch_check_interval秒。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._epoch_checked_at.get(fog_id, float('-inf')) < self.epoch_check_interval:
+                return
+            self._epoch_checked_at[fog_id] = now
+            previous = self._epochs.get(fog_id)
+        try:
+            row = session.execute(
+                "SELECT epoch FROM gko_space.IngestionEpoch WHERE name = 'trajectory'"
+            ).one()
+        except Exception as e:
+            # 读不到版本号时无法判断数据是否更新，保守地清空该雾服务器的分区
+            logger.warning(f"读取雾服务器 {fog_id} 的摄取版本号失败，清空其叶子缓存: {str(e)}")
+            with self._lock:
+                self._epochs.pop(fog_id, None)
+            self.clear(fog_id)
+            return
+        epoch = row.epoch if row else None
+        if epoch != previous or fog_id not in self._epochs:
+            if previous is not None:
+                logger.info(f"雾服务器 {fog_id} 的摄取版本号由 {previous} 变为 {epoch}，清空其叶子缓存")
+            with self._lock:
+                self._epochs[fog_id] = epoch
+            self.clear(fog_id)
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'epochs': dict(self._epochs)
+            }
+
+    @staticmethod
+    def _estimate_size(rows):
+        return _ENTRY_OVERHEAD + sum(
+            _ROW_OVERHEAD + sum(len(field) for field in row if isinstance(field, str)) for row in rows
+        )
+
+
+_leaf_cache = None
+_leaf_cache_lock = threading.Lock()
+
+def get_leaf_cache():
+    """获取进程内共享的叶子分区缓存，SSTP_LEAF_CACHE_MAX_BYTES为0时返回None"""
+    global _leaf_cache
+    max_bytes = getattr(settings, 'SSTP_LEAF_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    if not max_bytes:
+        return None
+    with _leaf_cache_lock:
+        if _leaf_cache is None:
+            _leaf_cache = LeafPartitionCache(
+                max_bytes,
+                getattr(settings, 'SSTP_LEAF_CACHE_EPOCH_CHECK_INTERVAL', 5)
+            )
+        return _leaf_cache
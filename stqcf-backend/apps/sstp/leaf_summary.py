@@ -0,0 +1,57 @@
+import time
+import threading
+from django.conf import settings
+
+# 叶子摘要表构建完成时写入IngestionEpoch的记录名，值为构建时的摄取版本号
+LEAF_SUMMARY_EPOCH_NAME = 'leaf_summary'
+
+
+class LeafSummaryStatus:
+    """
+    判断雾服务器上的叶子摘要表（LeafTrajectorySummary）是否可用
+
+    数据迁移清空轨迹表时更新摄取版本号，全部写完后再把leaf_summary记录设为同一版本号；
+    两者相等说明摘要表与TrajectoryDate一致，迁移进行中或旧数据没有摘要时读取点级数据。
+    按会话缓存判断结果，两次读取之间至少间隔check_interval秒。
+    """
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self._status = {}  # id(session) -> (读取时间, 是否可用)
+        self._lock = threading.Lock()
+
+    def is_ready(self, session):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._status.get(id(session))
+        if cached is not None and now - cached[0] < self.check_interval:
+            return cached[1]
+        try:
+            epochs = {
+                row.name: row.epoch
+                for row in session.execute(
+                    "SELECT name, epoch FROM gko_space.IngestionEpoch WHERE name IN ('trajectory', %s)",
+                    (LEAF_SUMMARY_EPOCH_NAME,)
+                )
+            }
+            ready = epochs.get(LEAF_SUMMARY_EPOCH_NAME) is not None and \
+                epochs.get(LEAF_SUMMARY_EPOCH_NAME) == epochs.get('trajectory')
+        except Exception:
+            ready = False
+        with self._lock:
+            self._status[id(session)] = (now, ready)
+        return ready
+
+
+_status = None
+_status_lock = threading.Lock()
+
+def leaf_summary_ready(session):
+    """会话所在雾服务器的叶子摘要表是否可用，SSTP_LEAF_SUMMARY_ENABLED为False时始终返回False"""
+    global _status
+    if not getattr(settings, 'SSTP_LEAF_SUMMARY_ENABLED', True):
+        return False
+    with _status_lock:
+        if _status is None:
+            _status = LeafSummaryStatus(getattr(settings, 'SSTP_LEAF_CACHE_EPOCH_CHECK_INTERVAL', 5))
+    return _status.is_ready(session)
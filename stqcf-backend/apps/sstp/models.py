@@ -5,6 +5,9 @@ from cassandra.cqlengine.models import Model
 # 这里我们不需要创建新的数据模型，因为我们将使用现有的OctreeNode和TrajectoryDate表
 # 但我们需要定义这些表的模型，以便在SSTP模块中使用
 
+# OctreeLeafOrder表中每个分区容纳的叶子数量（与数据迁移脚本保持一致）
+LEAF_ORDER_BUCKET_SIZE = 1024
+
 class OctreeNode(Model):
     """八叉树节点模型（明文数据）"""
     node_id = columns.Integer(primary_key=True)
@@ -13,21 +16,57 @@ class OctreeNode(Model):
     is_leaf = columns.Integer()
     MC = columns.List(value_type=columns.Integer)  # Morton码
     GC = columns.List(value_type=columns.Integer)  # 网格坐标
+    first_leaf = columns.Integer()  # 子树先序遍历中第一个叶子的序号
+    last_leaf = columns.Integer()  # 子树先序遍历中最后一个叶子的序号
     
     class Meta:
         app_label = 'sstp'
         db_table = 'OctreeNode'
         keyspace = 'gko_db'  # 添加keyspace配置
 
+class OctreeLeafOrder(Model):
+    """叶子先序序号到节点ID的映射，按序号范围整段读取子树的全部叶子"""
+    bucket = columns.Integer(primary_key=True, partition_key=True)  # leaf_rank // LEAF_ORDER_BUCKET_SIZE
+    leaf_rank = columns.Integer(primary_key=True, clustering_order="ASC")
+    node_id = columns.Integer()
+    
+    class Meta:
+        app_label = 'sstp'
+        db_table = 'OctreeLeafOrder'
+        keyspace = 'gko_db'  # 添加keyspace配置
+
+class KeywordNodePresence(Model):
+    """关键词节点存在位图（见presence.NodePresenceBitmap），由数据迁移脚本维护"""
+    keyword = columns.Integer(primary_key=True)
+    node_bitmap = columns.Blob()  # 第node_id位为1表示该节点子树在此关键词下有数据
+    
+    class Meta:
+        app_label = 'sstp'
+        db_table = 'KeywordNodePresence'
+        keyspace = 'gko_db'  # 添加keyspace配置
+
+class DateDictionary(Model):
+    """加密日期字典，TrajectoryDate行通过date_code引用"""
+    date_code = columns.Integer(primary_key=True)
+    t_date = columns.Blob()  # 加密的日期
+    
+    class Meta:
+        app_label = 'sstp'
+        db_table = 'DateDictionary'
+        keyspace = 'gko_db'  # 添加keyspace配置
+
 class TrajectoryDate(Model):
     """轨迹日期模型（加密数据）"""
     keyword = columns.Blob(primary_key=True, partition_key=True)
     node_id = columns.Integer(primary_key=True, partition_key=True)
     traj_id = columns.Blob(primary_key=True)
+    traj_tag = columns.Blob()  # 轨迹ID确定性标签（HMAC），用于解密前分组去重
     t_date = columns.Blob()
+    date_code = columns.Integer()  # 日期字典编码，新数据的t_date为空
     latitude = columns.Blob()  # 加密的纬度
     longitude = columns.Blob()  # 加密的经度
     time = columns.Blob()  # 加密的时间戳
+    packed_point = columns.Blob()  # 纬度、经度、时间打包加密的密文（开启打包编码时使用）
     
     class Meta:
         app_label = 'sstp'
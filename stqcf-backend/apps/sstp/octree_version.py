@@ -0,0 +1,104 @@
+import time
+import threading
+from django.conf import settings
+
+# 当前生效的八叉树版本保存在ActiveOctree表的这一行中
+OCTREE_POINTER_NAME = 'octree'
+
+
+def octree_table_names(version):
+    """
+    八叉树版本对应的 (节点表, 叶子序号表)
+
+    Cassandra不支持重命名表，数据迁移把新八叉树写入带版本号的表，
+    写完后更新ActiveOctree指针完成切换；version为None时是未分版本的旧表。
+    """
+    if version is None:
+        return 'OctreeNode', 'OctreeLeafOrder'
+    return f'OctreeNode_v{version}', f'OctreeLeafOrder_v{version}'
+
+
+def read_active_version(session):
+    """读取当前生效的八叉树版本，指针表不存在或没有记录时返回None"""
+    try:
+        row = session.execute(
+            "SELECT version FROM gko_space.ActiveOctree WHERE name = %s", (OCTREE_POINTER_NAME,)
+        ).one()
+    except Exception:
+        return None
+    return row.version if row else None
+
+
+def activate_version(session, version):
+    """把八叉树指针切换到指定版本，单行写入对读取方是原子的"""
+    session.execute(
+        "INSERT INTO gko_space.ActiveOctree (name, version) VALUES (%s, %s)", (OCTREE_POINTER_NAME, version)
+    )
+
+
+def write_octree_keywords(session, version, keywords):
+    """
+    记录八叉树版本构建时覆盖的关键词
+
+    稀疏分发的八叉树只含这些关键词的数据节点；keywords为None表示完整八叉树，覆盖任何关键词。
+    """
+    session.execute(
+        "INSERT INTO gko_space.OctreeKeywords (version, full_tree, keywords) VALUES (%s, %s, %s)",
+        (version, keywords is None, set(keywords or ()))
+    )
+
+
+def read_octree_keywords(session, version):
+    """
+    读取八叉树版本覆盖的关键词集合
+
+    返回None表示完整八叉树或没有记录（未分版本的旧表、记录表不存在），视为覆盖任何关键词。
+    """
+    if version is None:
+        return None
+    try:
+        row = session.execute(
+            "SELECT full_tree, keywords FROM gko_space.OctreeKeywords WHERE version = %s", (version,)
+        ).one()
+    except Exception:
+        return None
+    if row is None or row.full_tree:
+        return None
+    return set(row.keywords or ())
+
+
+class ActiveOctreeResolver:
+    """
+    解析雾服务器当前生效的八叉树表名
+
+    按会话缓存读到的版本号，两次读取之间至少间隔check_interval秒，
+    指针切换后最迟check_interval秒内生效。
+    """
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self._versions = {}  # id(session) -> (读取时间, 版本号)
+        self._lock = threading.Lock()
+
+    def get_tables(self, session):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._versions.get(id(session))
+        if cached is not None and now - cached[0] < self.check_interval:
+            return octree_table_names(cached[1])
+        version = read_active_version(session)
+        with self._lock:
+            self._versions[id(session)] = (now, version)
+        return octree_table_names(version)
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+def get_octree_tables(session):
+    """返回会话所在雾服务器当前生效的 (节点表, 叶子序号表)"""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = ActiveOctreeResolver(getattr(settings, 'SSTP_OCTREE_VERSION_CHECK_INTERVAL', 5))
+    return _resolver.get_tables(session)
@@ -0,0 +1,107 @@
+import logging
+import secrets
+
+logger = logging.getLogger(__name__)
+
+# 轨迹点打包字段顺序（从低位槽到高位槽）
+POINT_FIELDS = ('latitude', 'longitude', 'time')
+
+
+class SlotPacker:
+    """
+    Paillier多槽打包编码
+
+    把若干个有符号整数放进同一个明文：第i个值加上偏移量OFFSET后占据第i个槽
+    [i*slot_bits, (i+1)*slot_bits)。槽宽 = 值位数 + 盲化因子位数 + 保护位，
+    保证同态减法、乘以盲化因子、加上比较偏置之后每个槽仍落在 [0, 2^slot_bits) 内，
+    槽之间不会产生借位或进位。
+
+    2048位的Paillier明文空间可以容纳二十多个默认宽度（82位）的槽，因此一个点的
+    纬度、经度、时间（或多个点的同一字段）只需一个密文。
+    """
+
+    def __init__(self, value_bits=48, blind_bits=32, guard_bits=2):
+        self.value_bits = value_bits
+        self.blind_bits = blind_bits
+        self.slot_bits = value_bits + blind_bits + guard_bits
+        self.offset = 1 << (value_bits - 1)
+        self.slot_mask = (1 << self.slot_bits) - 1
+        # 比较结果中每个槽加上的偏置，槽值 >= 偏置表示差值非负
+        self.compare_bias = 1 << (self.slot_bits - 1)
+
+    def max_slots(self, public_key):
+        """公钥明文空间可容纳的槽数（phe要求明文小于n/3）"""
+        return (public_key.n // 3).bit_length() // self.slot_bits
+
+    def pack(self, values):
+        """把整数列表打包为一个明文"""
+        packed = 0
+        for i, value in enumerate(values):
+            value = int(value)
+            if not -self.offset <= value < self.offset:
+                raise ValueError(f"值 {value} 超出槽容量（{self.value_bits}位）")
+            packed |= (value + self.offset) << (i * self.slot_bits)
+        return packed
+
+    def unpack(self, packed, count):
+        """把明文拆分为count个整数"""
+        return [
+            ((packed >> (i * self.slot_bits)) & self.slot_mask) - self.offset
+            for i in range(count)
+        ]
+
+    def encrypt(self, public_key, values):
+        """打包并加密"""
+        if len(values) > self.max_slots(public_key):
+            raise ValueError(f"槽数 {len(values)} 超过公钥容量 {self.max_slots(public_key)}")
+        return public_key.encrypt(self.pack(values))
+
+    def decrypt_batch(self, private_key, ciphertexts, count):
+        """批量解密并拆包，返回与ciphertexts一一对应的整数列表"""
+        return [self.unpack(private_key.decrypt(c), count) for c in ciphertexts]
+
+    def compare_ge(self, enc_left, enc_right, count):
+        """
+        同态计算每个槽上 left >= right 的盲化比较值
+
+        结果明文的第i个槽为 r*(left_i - right_i) + s_i + 2^(slot_bits-1)，r为正的随机盲化因子，
+        s_i为每个槽独立的随机数，0 <= s_i < r，不改变差值的符号。打包密文只能整体乘以一个标量，
+        乘法因子r由各槽共用，s_i使各槽的盲化值互相独立：相等的差值得到不同的结果，
+        差值为0时也不会暴露为r的整数倍。解密方只能据此得知每个槽差值的符号。
+        """
+        r = secrets.randbelow((1 << self.blind_bits) - 2) + 2
+        noise = sum(secrets.randbelow(r) << (i * self.slot_bits) for i in range(count))
+        return (enc_left - enc_right) * r + (noise + self._bias(count))
+
+    def compare_points_in_range(self, enc_points, enc_min, enc_max, count):
+        """
+        批量计算打包点是否落在打包范围 [min, max] 内
+
+        返回列表，每项为 {'packed_min': 密文, 'packed_max': 密文}，
+        由中央服务器用decode_comparison解密判断。
+        """
+        return [
+            {
+                'packed_min': self.compare_ge(enc_point, enc_min, count),
+                'packed_max': self.compare_ge(enc_max, enc_point, count)
+            }
+            for enc_point in enc_points
+        ]
+
+    def decode_comparison(self, plaintext, count):
+        """解码比较结果明文，返回每个槽的差值是否非负"""
+        return [
+            ((plaintext >> (i * self.slot_bits)) & self.slot_mask) >= self.compare_bias
+            for i in range(count)
+        ]
+
+    def decrypt_in_range_batch(self, private_key, comparisons, count):
+        """批量解密compare_points_in_range的结果，返回每个点是否所有槽都在范围内"""
+        return [
+            all(self.decode_comparison(private_key.decrypt(item['packed_min']), count))
+            and all(self.decode_comparison(private_key.decrypt(item['packed_max']), count))
+            for item in comparisons
+        ]
+
+    def _bias(self, count):
+        return sum(self.compare_bias << (i * self.slot_bits) for i in range(count))
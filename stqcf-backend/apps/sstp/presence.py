@@ -0,0 +1,74 @@
+class NodePresenceBitmap:
+    """
+    关键词节点存在位图
+
+    第i位为1表示节点i（或其子树中的某个叶子）在该关键词下存在TrajectoryDate数据。
+    位图在数据迁移时生成并写入雾服务器的KeywordNodePresence表，
+    查询时在任何同态比较之前先查位图，跳过不可能产生结果的子树。
+    """
+
+    def __init__(self, data=b''):
+        self._bits = bytearray(data or b'')
+
+    @classmethod
+    def from_node_ids(cls, node_ids, parent_map=None):
+        """
+        由叶子节点ID集合构建位图
+
+        参数:
+        node_ids: 含有数据的叶子节点ID
+        parent_map: {node_id: parent_id}，提供时会把存在标记传播到全部祖先节点
+        """
+        bitmap = cls()
+        for node_id in node_ids:
+            bitmap.add(node_id)
+            if not parent_map:
+                continue
+            # 沿父节点链向上标记，遇到已标记的祖先即可停止
+            parent_id = parent_map.get(node_id)
+            visited = {node_id}
+            while parent_id is not None and parent_id not in visited:
+                if bitmap.contains(parent_id):
+                    break
+                bitmap.add(parent_id)
+                visited.add(parent_id)
+                parent_id = parent_map.get(parent_id)
+        return bitmap
+
+    def add(self, node_id):
+        """标记节点存在数据"""
+        if node_id is None or node_id < 0:
+            return
+        byte_index = node_id >> 3
+        if byte_index >= len(self._bits):
+            self._bits.extend(b'\x00' * (byte_index + 1 - len(self._bits)))
+        self._bits[byte_index] |= 1 << (node_id & 7)
+
+    def contains(self, node_id):
+        """判断节点是否存在数据"""
+        if node_id is None or node_id < 0:
+            return False
+        byte_index = node_id >> 3
+        if byte_index >= len(self._bits):
+            return False
+        return bool(self._bits[byte_index] & (1 << (node_id & 7)))
+
+    def node_ids(self):
+        """按升序列出所有存在数据的节点ID"""
+        return [
+            (byte_index << 3) + bit
+            for byte_index, byte in enumerate(self._bits) if byte
+            for bit in range(8) if byte & (1 << bit)
+        ]
+
+    def filter(self, node_ids):
+        """过滤出存在数据的节点ID"""
+        return [node_id for node_id in node_ids if self.contains(node_id)]
+
+    def to_bytes(self):
+        """序列化为BLOB"""
+        return bytes(self._bits)
+
+    def __len__(self):
+        """已标记的节点数量"""
+        return sum(bin(byte).count('1') for byte in self._bits)
@@ -5,6 +5,7 @@ import secrets
 import logging
 import base64
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 logger = logging.getLogger(__name__)
 
@@ -94,6 +95,48 @@ def verify_secure_token(data, token, secret_key=None, max_age=300):
         logger.error(f"验证安全令牌失败: {str(e)}")
         return False
 
+def get_traj_tag_secret_key():
+    """
+    读取轨迹ID标签密钥
+    
+    返回:
+    配置的TRAJ_TAG_SECRET_KEY
+    
+    异常:
+    ImproperlyConfigured: 未配置TRAJ_TAG_SECRET_KEY
+    """
+    secret_key = getattr(settings, 'TRAJ_TAG_SECRET_KEY', '')
+    if not secret_key:
+        # 公开的默认密钥会让任何人都能由标签反推轨迹ID，必须显式配置
+        raise ImproperlyConfigured("未配置TRAJ_TAG_SECRET_KEY，无法生成轨迹ID标签")
+    return secret_key
+
+def generate_traj_tag(traj_id, secret_key=None):
+    """
+    生成轨迹ID的确定性标签
+    
+    同一轨迹ID在任何数据行、叶子节点和雾服务器上得到相同标签，客户端据此在解密前
+    对结果分组去重；密钥只保存在中心侧，雾服务器无法由标签反推轨迹ID。
+    
+    参数:
+    traj_id: 明文轨迹ID
+    secret_key: 密钥，如果为None则使用配置中的TRAJ_TAG_SECRET_KEY
+    
+    返回:
+    16字节的HMAC-SHA256截断值
+    
+    异常:
+    ImproperlyConfigured: 未配置TRAJ_TAG_SECRET_KEY
+    """
+    if secret_key is None:
+        secret_key = get_traj_tag_secret_key()
+    
+    return hmac.new(
+        secret_key.encode(),
+        str(traj_id).encode(),
+        hashlib.sha256
+    ).digest()[:16]
+
 def generate_api_key():
     """
     生成随机API密钥
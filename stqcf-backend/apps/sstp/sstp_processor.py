@@ -1,11 +1,17 @@
 import os
 import pickle
 import logging
+import threading
+import time
 from django.conf import settings
 from .models import OctreeNode, TrajectoryDate, QueryRequest
 from .homomorphic_crypto import HomomorphicProcessor
 from .central_client import CentralServerClient
+from .leaf_cache import get_leaf_cache
+from .octree_version import get_octree_tables
+from .leaf_summary import leaf_summary_ready
 from cassandra.cqlengine.connection import get_session
+from cassandra.query import ValueSequence
 
 # 配置日志
 logging.basicConfig(level=logging.DEBUG)
@@ -14,11 +20,17 @@ logger = logging.getLogger(__name__)
 class SSTPProcessor:
     """处理SSTP查询的主类"""
     
-    def __init__(self, fog_id):
+    def __init__(self, fog_id, session=None):
         logger.debug(f"初始化 SSTPProcessor，fog_id: {fog_id}")
         self.fog_id = fog_id
+        self.session = session  # 指定雾服务器的Cassandra会话，为空时使用cqlengine默认连接（部署在雾服务器本地时）
+        self.deadline = None  # 查询截止时间（time.monotonic()），到期后停止遍历并返回部分结果
+        self.range_check_errors = 0  # 中央服务器范围检查失败次数，失败的节点被保守剪枝，结果标记为部分结果
         self.crypto = HomomorphicProcessor()
         self.central_client = CentralServerClient()
+        self.leaf_cache = get_leaf_cache()
+        if self.leaf_cache is not None:
+            self.leaf_cache.sync_epoch(self._session(), fog_id)
         logger.debug("SSTPProcessor 初始化完成")
         
     def process_query(self, encrypted_query):
@@ -60,13 +72,16 @@ class SSTPProcessor:
         L = []  # 待处理节点队列
         SNodes = []  # 选中的叶子节点
         CTK = {}  # 候选轨迹结果集，格式: {traj_id: {date: node_id}}
+        traj_tags = {}  # 轨迹ID确定性标签，格式: {traj_id: traj_tag}
         
         # 3. 获取根节点开始处理
         try:
             logger.debug("尝试获取根节点")
-            session = get_session()
+            session = self._session()
             # 使用原生CQL查询，添加 ALLOW FILTERING
-            result = session.execute("SELECT * FROM gko_space.octreenode WHERE node_id = 0 ALLOW FILTERING")
+            # 数据迁移以带版本号的表切换八叉树，每次查询开始时确定读取哪张表
+            octree_table = get_octree_tables(session)[0]
+            result = session.execute(f"SELECT * FROM gko_space.{octree_table} WHERE node_id = 0 ALLOW FILTERING")
             row = result.one()
             if row:
                 root_node = OctreeNode(**dict(row))
@@ -81,7 +96,12 @@ class SSTPProcessor:
             
             # 4. 执行八叉树遍历和剪枝
             node_count = 0
+            partial = False
             while L:
+                if self._deadline_exceeded():
+                    logger.warning(f"查询 {rid}: 已到截止时间，剩余 {len(L)} 个节点未遍历，返回部分结果")
+                    partial = True
+                    break
                 node = L.pop(0)  # 取出队列第一个节点
                 node_count += 1
                 logger.debug(f"处理节点 {node.node_id} (第 {node_count} 个节点)")
@@ -106,8 +126,8 @@ class SSTPProcessor:
                 if node.is_leaf != 1:
                     logger.debug(f"查询 {rid}: 节点 {node.node_id} 是非叶子节点，添加子节点到队列")
                     # 使用原生CQL查询，添加 ALLOW FILTERING
-                    session = get_session()
-                    result = session.execute(f"SELECT * FROM gko_space.octreenode WHERE parent_id = {node.node_id} ALLOW FILTERING")
+                    session = self._session()
+                    result = session.execute(f"SELECT * FROM gko_space.{octree_table} WHERE parent_id = {node.node_id} ALLOW FILTERING")
                     child_nodes = [OctreeNode(**dict(row)) for row in result]
                     L.extend(child_nodes)
                     logger.debug(f"添加了 {len(child_nodes)} 个子节点到队列")
@@ -128,6 +148,8 @@ class SSTPProcessor:
                         continue
                 # 否则检查错误
                 elif 'error' in gc_check_result or not gc_check_result.get('in_range', False):
+                    if 'error' in gc_check_result:
+                        self.range_check_errors += 1
                     logger.debug(f"查询 {rid}: 节点 {node.node_id} 不在网格坐标范围内，剪枝")
                     continue  # 不在网格范围内，剪枝
                     
@@ -136,58 +158,35 @@ class SSTPProcessor:
                 SNodes.append(node)
                 
             logger.info(f"八叉树遍历完成，共处理 {node_count} 个节点")
+            if self.range_check_errors:
+                logger.warning(f"查询 {rid}: {self.range_check_errors} 次范围检查失败，相应节点被剪枝，返回部分结果")
+                partial = True
             
             # 5. 处理选中的叶子节点
             if not SNodes:
                 logger.info(f"查询 {rid}: 没有找到符合条件的节点")
                 self._update_query_status(rid, "completed")
-                return {"message": "No matching nodes found"}
+                return {"message": "No matching nodes found", "partial": partial}
             
             logger.debug(f"开始处理 {len(SNodes)} 个选中的叶子节点")
                 
-            # 6. 获取轨迹数据
+            # 6. 获取轨迹数据（优先读取叶子分区缓存）
             for node in SNodes:
-                logger.debug(f"获取节点 {node.node_id} 的轨迹数据")
-                session = get_session()
-                result = session.execute(f"SELECT * FROM gko_space.TrajectoryDate WHERE node_id = {node.node_id} ALLOW FILTERING")
-                trajectories = [TrajectoryDate(**dict(row)) for row in result]
-                
-                logger.debug(f"节点 {node.node_id} 的轨迹数量: {len(trajectories)}")
-                for traj in trajectories:
-                    logger.debug(f"原始轨迹数据: traj_id={traj.traj_id}, traj_id类型={type(traj.traj_id)}")
-                    logger.debug(f"原始轨迹数据: t_date={traj.t_date}, t_date类型={type(traj.t_date)}")
-                    
-                    # 将二进制数据转换为十六进制字符串
-                    try:
-                        # 确保t_date的处理方式与traj_id完全一致
-                        traj_id_hex = traj.traj_id.hex() if isinstance(traj.traj_id, bytes) else str(traj.traj_id)
-                        date_hex = traj.t_date.hex() if isinstance(traj.t_date, bytes) else str(traj.t_date)
-                        logger.debug(f"转换后数据: traj_id={traj_id_hex}, t_date={date_hex}")
-                        
-                        # 添加更多调试信息
-                        if traj.t_date is None:
-                            logger.error(f"t_date为None，完整轨迹数据: {traj}")
-                            logger.error(f"轨迹ID: {traj_id_hex}")
-                            logger.error(f"节点ID: {node.node_id}")
-                        
-                        if traj_id_hex not in CTK:
-                            CTK[traj_id_hex] = {}
-                        CTK[traj_id_hex][date_hex] = node.node_id
-                    except Exception as e:
-                        logger.error(f"数据转换错误: {str(e)}")
-                        logger.error("错误详情:", exc_info=True)
-                        continue
+                if self._deadline_exceeded():
+                    logger.warning(f"查询 {rid}: 已到截止时间，跳过剩余叶子节点")
+                    partial = True
+                    break
+                rows = self._get_leaf_rows(keyword, node.node_id)
+                logger.debug(f"节点 {node.node_id} 的轨迹数量: {len(rows)}")
+                for traj_id_hex, date_hex, tag_hex in rows:
+                    if traj_id_hex not in CTK:
+                        CTK[traj_id_hex] = {}
+                    CTK[traj_id_hex][date_hex] = node.node_id
+                    traj_tags[traj_id_hex] = tag_hex
             
             # 7. 准备结果数据
             logger.debug("准备结果数据")
-            result_data = []
-            for traj_id, dates in CTK.items():
-                for t_date, node_id in dates.items():
-                    result_data.append({
-                        'traj_id': traj_id,
-                        't_date': t_date,
-                        'node_id': node_id
-                    })
+            result_data = self._build_result_data(CTK, traj_tags)
             
             # 8. 更新查询状态
             logger.debug("更新查询状态为完成")
@@ -198,7 +197,9 @@ class SSTPProcessor:
                 "rid": rid,
                 "keyword": keyword,
                 "result_count": len(result_data),
-                "results": result_data
+                "results": result_data,
+                "date_dictionary": self._load_date_dictionary(result_data),
+                "partial": partial
             }
             
         except Exception as e:
@@ -207,14 +208,253 @@ class SSTPProcessor:
             self._update_query_status(rid, "failed")
             return {"error": str(e), "rid": rid, "keyword": keyword}
             
+    def process_queries(self, encrypted_queries):
+        """
+        共享扫描：一次八叉树遍历同时处理多个加密查询
+        
+        每个待处理节点携带仍然存活的查询集合，Morton码和网格检查对该集合发起一次批量请求；
+        每个存活叶子的轨迹数据只读取一次，再分发给选中它的各个查询。
+        返回与encrypted_queries一一对应的结果列表，单个结果格式与process_query相同。
+        """
+        if not encrypted_queries:
+            return []
+        
+        logger.info(f"共享扫描: 在雾服务器 {self.fog_id} 上合并处理 {len(encrypted_queries)} 个查询")
+        for query in encrypted_queries:
+            self._record_query_request(query['rid'], query['keyword'])
+            self._update_query_status(query['rid'], "processing")
+        
+        morton_ranges = [
+            {
+                'rid': query['rid'],
+                'enc_min': query['Mrange']['morton_min'],
+                'enc_max': query['Mrange']['morton_max']
+            }
+            for query in encrypted_queries
+        ]
+        grid_ranges = [
+            {
+                'rid': query['rid'],
+                'enc_min_x': query['Grange']['grid_min_x'],
+                'enc_min_y': query['Grange']['grid_min_y'],
+                'enc_max_x': query['Grange']['grid_max_x'],
+                'enc_max_y': query['Grange']['grid_max_y']
+            }
+            for query in encrypted_queries
+        ]
+        CTKs = [{} for _ in encrypted_queries]  # 每个查询各自的候选轨迹结果集
+        traj_tags = {}  # 轨迹ID确定性标签，各查询共用
+        partial = False
+        
+        try:
+            session = self._session()
+            # 数据迁移以带版本号的表切换八叉树，每次查询开始时确定读取哪张表
+            octree_table = get_octree_tables(session)[0]
+            result = session.execute(f"SELECT * FROM gko_space.{octree_table} WHERE node_id = 0 ALLOW FILTERING")
+            row = result.one()
+            if not row:
+                logger.error("共享扫描: 未找到八叉树根节点")
+                for query in encrypted_queries:
+                    self._update_query_status(query['rid'], "failed")
+                return [{"error": "Octree root node not found"} for _ in encrypted_queries]
+            
+            # 队列元素为 (节点, 存活查询下标列表)
+            L = [(OctreeNode(**dict(row)), list(range(len(encrypted_queries))))]
+            selected_leaves = []  # (叶子节点, 选中该叶子的查询下标列表)
+            node_count = 0
+            
+            while L:
+                if self._deadline_exceeded():
+                    logger.warning(f"共享扫描: 已到截止时间，剩余 {len(L)} 个节点未遍历，返回部分结果")
+                    partial = True
+                    break
+                node, active = L.pop(0)
+                node_count += 1
+                
+                mc_result = self.central_client.check_morton_range_batch(
+                    node.MC or [], [morton_ranges[i] for i in active]
+                )
+                active = [i for i, ok in zip(active, self._batch_in_range(mc_result, len(active))) if ok]
+                if not active:
+                    continue
+                
+                if node.is_leaf != 1:
+                    result = session.execute(f"SELECT * FROM gko_space.{octree_table} WHERE parent_id = {node.node_id} ALLOW FILTERING")
+                    L.extend((OctreeNode(**dict(child)), active) for child in result)
+                    continue
+                
+                gc_result = self.central_client.check_grid_range_batch(
+                    node.GC or [], [grid_ranges[i] for i in active]
+                )
+                active = [i for i, ok in zip(active, self._batch_in_range(gc_result, len(active))) if ok]
+                if active:
+                    selected_leaves.append((node, active))
+            
+            logger.info(f"共享扫描完成，共处理 {node_count} 个节点，选中 {len(selected_leaves)} 个叶子节点")
+            if self.range_check_errors:
+                logger.warning(f"共享扫描: {self.range_check_errors} 次范围检查失败，相应节点被剪枝，返回部分结果")
+                partial = True
+            
+            # 每个叶子分区只读取一次，再分发给各个查询
+            for node, active in selected_leaves:
+                if self._deadline_exceeded():
+                    logger.warning("共享扫描: 已到截止时间，跳过剩余叶子节点")
+                    partial = True
+                    break
+                leaf_rows = {}
+                for i in active:
+                    keyword = encrypted_queries[i]['keyword']
+                    if keyword not in leaf_rows:
+                        leaf_rows[keyword] = self._get_leaf_rows(keyword, node.node_id)
+                    for traj_id_hex, date_hex, tag_hex in leaf_rows[keyword]:
+                        CTKs[i].setdefault(traj_id_hex, {})[date_hex] = node.node_id
+                        traj_tags[traj_id_hex] = tag_hex
+            
+        except Exception as e:
+            logger.error(f"共享扫描过程中发生错误: {str(e)}")
+            logger.error("错误详情:", exc_info=True)
+            for query in encrypted_queries:
+                self._update_query_status(query['rid'], "failed")
+            return [{"error": str(e), "rid": query['rid'], "keyword": query['keyword']} for query in encrypted_queries]
+        
+        results = []
+        for query, CTK in zip(encrypted_queries, CTKs):
+            self._update_query_status(query['rid'], "completed")
+            if not CTK:
+                results.append({"message": "No matching nodes found", "rid": query['rid'], "partial": partial})
+                continue
+            result_data = self._build_result_data(CTK, traj_tags)
+            results.append({
+                "message": "Query completed successfully",
+                "rid": query['rid'],
+                "keyword": query['keyword'],
+                "result_count": len(result_data),
+                "results": result_data,
+                "date_dictionary": self._load_date_dictionary(result_data),
+                "partial": partial
+            })
+        return results
+    
+    def set_deadline(self, deadline):
+        """设置查询截止时间，同时限制中央服务器请求的超时"""
+        self.deadline = deadline
+        self.central_client.deadline = deadline
+    
+    def _deadline_exceeded(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+    
+    def _session(self):
+        return self.session if self.session is not None else get_session()
+    
+    def _get_leaf_rows(self, keyword, node_id):
+        """
+        读取叶子分区的轨迹数据，返回 [(traj_id_hex, t_date, traj_tag_hex), ...]
+        
+        t_date为日期密文的十六进制字符串；按日期字典存储的新数据为整数date_code。
+        
+        明文整数关键词按 (keyword, node_id) 分区读取并经过叶子分区缓存；
+        其他关键词沿用按node_id过滤的读取方式，不做缓存。
+        """
+        if not isinstance(keyword, int) or self.leaf_cache is None:
+            return self._load_leaf_rows(keyword, node_id)
+        return self.leaf_cache.get((self.fog_id, keyword, node_id), lambda: self._load_leaf_rows(keyword, node_id))
+    
+    def _load_leaf_rows(self, keyword, node_id):
+        """
+        从Cassandra读取叶子分区并把二进制字段转换为十六进制字符串
+        
+        SSTP只需要叶子中不重复的 (轨迹, 日期)，叶子摘要表可用时从摘要表读取，
+        每个轨迹日一行，不再读取逐点的加密坐标和时间。
+        """
+        session = self._session()
+        if isinstance(keyword, int) and leaf_summary_ready(session):
+            result = session.execute(
+                "SELECT traj_id, traj_tag, date_code FROM gko_space.LeafTrajectorySummary WHERE keyword = %s AND node_id = %s",
+                (keyword, node_id)
+            )
+            return [(row.traj_id.hex(), row.date_code, row.traj_tag.hex()) for row in result]
+        if isinstance(keyword, int):
+            result = session.execute(
+                "SELECT traj_id, traj_tag, t_date, date_code FROM gko_space.TrajectoryDate WHERE keyword = %s AND node_id = %s",
+                (keyword, node_id)
+            )
+        else:
+            result = session.execute(f"SELECT traj_id, traj_tag, t_date, date_code FROM gko_space.TrajectoryDate WHERE node_id = {node_id} ALLOW FILTERING")
+        
+        rows = []
+        for row in result:
+            if row.traj_id is None or (row.t_date is None and row.date_code is None):
+                logger.error(f"节点 {node_id} 存在traj_id或t_date为空的记录，已跳过")
+                continue
+            traj_id_hex = row.traj_id.hex() if isinstance(row.traj_id, bytes) else str(row.traj_id)
+            if row.t_date is None:
+                date_hex = row.date_code
+            else:
+                date_hex = row.t_date.hex() if isinstance(row.t_date, bytes) else str(row.t_date)
+            # 旧数据没有标签，客户端对这类行逐行解密
+            tag_hex = row.traj_tag.hex() if row.traj_tag else None
+            rows.append((traj_id_hex, date_hex, tag_hex))
+        return rows
+    
+    def _build_result_data(self, CTK, traj_tags):
+        """把CTK展开为结果列表，每行附带轨迹ID确定性标签；字典编码的日期放在date_code字段"""
+        result_data = []
+        for traj_id, dates in CTK.items():
+            for t_date, node_id in dates.items():
+                item = {
+                    'traj_id': traj_id,
+                    'traj_tag': traj_tags.get(traj_id),
+                    't_date': t_date,
+                    'node_id': node_id
+                }
+                if isinstance(t_date, int):
+                    item['t_date'] = None
+                    item['date_code'] = t_date
+                result_data.append(item)
+        return result_data
+    
+    def _load_date_dictionary(self, result_data):
+        """读取结果中引用到的加密日期，返回 {date_code: t_date_hex}，随结果只下发一次"""
+        codes = {item['date_code'] for item in result_data if item.get('date_code') is not None}
+        if not codes:
+            return {}
+        session = self._session()
+        # 按主键只读取引用到的日期，不读取整个字典的密文
+        result = session.execute(
+            "SELECT date_code, t_date FROM gko_space.DateDictionary WHERE date_code IN %s",
+            (ValueSequence(sorted(codes)),)
+        )
+        return {
+            row.date_code: row.t_date.hex() if isinstance(row.t_date, bytes) else str(row.t_date)
+            for row in result
+        }
+    
+    def _batch_in_range(self, result, count):
+        """解析批量范围检查结果，出错时与单查询一致采取保守策略（全部剪枝）"""
+        if 'error' in result or result.get('status') == 'error':
+            logger.error(f"批量范围检查失败: {result.get('message', '未知错误')}")
+            self.range_check_errors += 1
+            return [False] * count
+        items = result.get('results', [])
+        if len(items) != count:
+            logger.error(f"批量范围检查结果数量不匹配: 期望 {count}，实际 {len(items)}")
+            self.range_check_errors += 1
+            return [False] * count
+        return [bool(item.get('in_range', False)) for item in items]
+    
     def _record_query_request(self, rid, keyword):
         """记录查询请求"""
         try:
             logger.debug(f"记录查询请求 {rid}")
-            QueryRequest.objects.create(
+            # 对冲请求会在副本雾服务器上以同一rid重复执行，记录只由先到的雾服务器创建，
+            # 后到的副本不覆盖已有的状态和fog_id
+            QueryRequest.objects.get_or_create(
                 rid=rid,
-                fog_id=self.fog_id,
-                keyword=keyword.encode() if isinstance(keyword, str) else keyword
+                defaults={
+                    'fog_id': self.fog_id,
+                    'keyword': keyword.encode() if isinstance(keyword, str) else keyword,
+                    'status': 'pending'
+                }
             )
             logger.info(f"查询请求 {rid} 已记录")
         except Exception as e:
@@ -225,12 +465,18 @@ class SSTPProcessor:
         """更新查询状态"""
         try:
             logger.debug(f"更新查询 {rid} 状态为 {status}")
-            query = QueryRequest.objects.get(rid=rid)
-            query.status = status
-            query.save()
+            # 对冲请求的各副本共用rid对应的一条记录：按rid更新并写入本雾服务器的fog_id，
+            # 已完成的记录不再更新，fog_id保留为最先返回结果的雾服务器
+            updated = QueryRequest.objects.filter(rid=rid).exclude(status='completed').update(
+                status=status, fog_id=self.fog_id
+            )
+            if not updated:
+                if QueryRequest.objects.filter(rid=rid).exists():
+                    logger.info(f"查询 {rid} 已由其他雾服务器完成，不再更新状态")
+                else:
+                    logger.error(f"查询请求 {rid} 不存在")
+                return
             logger.info(f"查询 {rid} 状态已更新为 {status}")
-        except QueryRequest.DoesNotExist:
-            logger.error(f"查询请求 {rid} 不存在")
         except Exception as e:
             logger.error(f"更新查询状态失败: {str(e)}")
             logger.error("错误详情:", exc_info=True)
@@ -252,7 +498,8 @@ class SSTPProcessor:
             # 检查是否有错误
             if 'error' in result or 'status' in result and result['status'] == 'error':
                 logger.error(f"Morton码范围检查失败: {result.get('message', '未知错误')}")
-                # 在连接错误时，我们选择保守策略：返回False
+                # 在连接错误时，我们选择保守策略：返回False，并把结果标记为部分结果
+                self.range_check_errors += 1
                 return False
                 
             return result.get('in_range', False)
@@ -260,5 +507,60 @@ class SSTPProcessor:
         except Exception as e:
             logger.error(f"Morton码范围检查异常: {str(e)}")
             logger.error("错误详情:", exc_info=True)
-            # 在异常情况下，我们选择保守策略：返回False
-            return False
\ No newline at end of file
+            # 在异常情况下，我们选择保守策略：返回False，并把结果标记为部分结果
+            self.range_check_errors += 1
+            return False
+
+class SharedScanBatcher:
+    """
+    把短时间窗口内到达同一雾服务器的查询合并为一次共享扫描
+    
+    第一个到达的请求成为领头者，等待窗口结束后取走全部排队查询执行process_queries，
+    其余请求阻塞等待各自的结果。
+    """
+    
+    def __init__(self, fog_id, window):
+        self.fog_id = fog_id
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = []
+        self._leader_active = False
+    
+    def submit(self, encrypted_query):
+        """提交查询并等待结果，返回值与SSTPProcessor.process_query相同"""
+        entry = {'query': encrypted_query, 'event': threading.Event(), 'result': None}
+        with self._lock:
+            self._pending.append(entry)
+            is_leader = not self._leader_active
+            self._leader_active = True
+        
+        if is_leader:
+            time.sleep(self.window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._leader_active = False
+            try:
+                results = SSTPProcessor(self.fog_id).process_queries([item['query'] for item in batch])
+            except Exception as e:
+                logger.error(f"共享扫描执行失败: {str(e)}")
+                results = [{"error": str(e), "rid": item['query'].get('rid')} for item in batch]
+            for item, result in zip(batch, results):
+                item['result'] = result
+                item['event'].set()
+        
+        entry['event'].wait()
+        return entry['result']
+
+
+_shared_scan_batchers = {}
+_shared_scan_batchers_lock = threading.Lock()
+
+def get_shared_scan_batcher(fog_id):
+    """获取雾服务器对应的共享扫描合并器，SSTP_SHARED_SCAN_WINDOW为0时返回None"""
+    window = getattr(settings, 'SSTP_SHARED_SCAN_WINDOW', 0)
+    if not window:
+        return None
+    with _shared_scan_batchers_lock:
+        if fog_id not in _shared_scan_batchers:
+            _shared_scan_batchers[fog_id] = SharedScanBatcher(fog_id, window)
+        return _shared_scan_batchers[fog_id]
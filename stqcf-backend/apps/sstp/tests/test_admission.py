@@ -0,0 +1,90 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from apps.sstp.admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+def controller(rate=0, burst=1, concurrency=1, max_queue=10, max_wait=1):
+    return AdmissionController({'fog': (rate, burst, concurrency)}, max_queue=max_queue, max_wait=max_wait)
+
+
+class TokenBucketTest(SimpleTestCase):
+    """令牌桶测试"""
+
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        now = time.monotonic()
+        bucket.take(now)
+        bucket.take(now)
+        self.assertFalse(bucket.available(now))
+        self.assertAlmostEqual(bucket.time_until_available(now), 0.1, places=3)
+        self.assertTrue(bucket.available(now + 0.11))
+
+    def test_zero_rate_is_unlimited(self):
+        bucket = TokenBucket(rate=0, capacity=1)
+        now = time.monotonic()
+        for _ in range(5):
+            bucket.take(now)
+        self.assertTrue(bucket.available(now))
+
+
+class AdmissionControllerTest(SimpleTestCase):
+    """准入控制器测试"""
+
+    def test_concurrency_limit_times_out(self):
+        admission = controller(concurrency=1)
+        with admission.admit('fog:1'):
+            with self.assertRaises(AdmissionRejected) as cm:
+                with admission.admit('fog:1', timeout=0.05):
+                    pass
+        self.assertEqual(cm.exception.reason, 'wait timeout')
+        # 不同雾服务器各自计数
+        with admission.admit('fog:1'), admission.admit('fog:2'):
+            pass
+        metrics = admission.metrics()['keys']['fog:1']
+        self.assertEqual((metrics['admitted'], metrics['timed_out'], metrics['in_flight']), (2, 1, 0))
+
+    def test_waiter_admitted_on_release(self):
+        admission = controller(concurrency=1)
+        waited = []
+
+        def second():
+            with admission.admit('fog:1') as seconds:
+                waited.append(seconds)
+
+        with admission.admit('fog:1'):
+            thread = threading.Thread(target=second)
+            thread.start()
+            time.sleep(0.05)
+            self.assertEqual(admission.metrics()['keys']['fog:1']['queue_depth'], 1)
+        thread.join(1)
+        self.assertEqual(len(waited), 1)
+        self.assertGreater(waited[0], 0)
+
+    def test_full_queue_rejects_or_sheds_lower_priority(self):
+        admission = controller(concurrency=1, max_queue=1)
+        errors = []
+
+        def waiter(priority):
+            try:
+                with admission.admit('fog:1', priority):
+                    pass
+            except AdmissionRejected as e:
+                errors.append(e.reason)
+
+        with admission.admit('fog:1'):
+            low = threading.Thread(target=waiter, args=('low',))
+            low.start()
+            time.sleep(0.05)
+            # 同等优先级的新请求被拒绝，更高优先级的请求挤出排队中的低优先级请求
+            with self.assertRaises(AdmissionRejected):
+                with admission.admit('fog:1', 'low'):
+                    pass
+            high = threading.Thread(target=waiter, args=('high',))
+            high.start()
+            low.join(1)
+            self.assertEqual(errors, ['shed'])
+        high.join(1)
+        self.assertEqual(errors, ['shed'])
@@ -0,0 +1,62 @@
+from django.test import SimpleTestCase
+
+from process_octree_data import OctreeDataDistributor
+
+
+def _node(node_id, parent_id, is_leaf, mc=None, gc=None):
+    return {'node_id': node_id, 'parent_id': parent_id, 'level': 0, 'is_leaf': is_leaf, 'MC': mc, 'GC': gc}
+
+
+class FogSubtreeTest(SimpleTestCase):
+    """雾节点稀疏子树计算测试"""
+
+    def setUp(self):
+        self.distributor = OctreeDataDistributor()
+        # 0 -> 1 -> (11, 12), 0 -> 2 -> 21, 0 -> 3
+        self.nodes = [
+            _node(0, None, 0, [0, 100], [0, 0, 100, 100]),
+            _node(1, 0, 0, [0, 50], [0, 0, 50, 50]),
+            _node(2, 0, 0, [50, 100], [50, 50, 100, 100]),
+            _node(3, 0, 1, [0, 100], [0, 50, 50, 100]),
+            _node(11, 1, 1, [0, 20], [0, 0, 20, 20]),
+            _node(12, 1, 1, [30, 50], [30, 30, 50, 50]),
+            _node(21, 2, 1, [60, 80], [60, 60, 80, 80]),
+        ]
+
+    def test_keeps_data_nodes_and_ancestors(self):
+        subtree = self.distributor.fog_subtree(self.nodes, {12})
+        self.assertEqual([n['node_id'] for n in subtree], [0, 1, 12])
+
+    def test_keeps_root_without_data(self):
+        subtree = self.distributor.fog_subtree(self.nodes, set())
+        self.assertEqual([n['node_id'] for n in subtree], [0])
+
+    def test_ignores_unknown_node_ids(self):
+        subtree = self.distributor.fog_subtree(self.nodes, {21, 999})
+        self.assertEqual([n['node_id'] for n in subtree], [0, 2, 21])
+
+    def test_tightens_internal_ranges_to_kept_children(self):
+        by_id = {n['node_id']: n for n in self.distributor.fog_subtree(self.nodes, {12, 21})}
+
+        self.assertEqual(by_id[1]['MC'], [30, 50])
+        self.assertEqual(by_id[1]['GC'], [30, 30, 50, 50])
+        self.assertEqual(by_id[0]['MC'], [30, 80])
+        self.assertEqual(by_id[0]['GC'], [30, 30, 80, 80])
+        # 叶子保留自身网格范围
+        self.assertEqual(by_id[21]['MC'], [60, 80])
+
+    def test_tightening_never_widens_parent_range(self):
+        nodes = [_node(0, None, 0, [10, 40], [10, 10, 40, 40]), _node(1, 0, 1, [0, 50], [0, 0, 50, 50])]
+        by_id = {n['node_id']: n for n in self.distributor.fog_subtree(nodes, {1})}
+        self.assertEqual(by_id[0]['MC'], [10, 40])
+        self.assertEqual(by_id[0]['GC'], [10, 10, 40, 40])
+
+    def test_keeps_range_when_child_range_missing(self):
+        nodes = [_node(0, None, 0, [0, 100], [0, 0, 100, 100]), _node(1, 0, 1)]
+        by_id = {n['node_id']: n for n in self.distributor.fog_subtree(nodes, {1})}
+        self.assertEqual(by_id[0]['MC'], [0, 100])
+        self.assertEqual(by_id[0]['GC'], [0, 0, 100, 100])
+
+    def test_does_not_modify_input_nodes(self):
+        self.distributor.fog_subtree(self.nodes, {12})
+        self.assertEqual(self.nodes[0]['MC'], [0, 100])
@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+from django.test import SimpleTestCase
+
+from apps.sstp.leaf_cache import LeafPartitionCache
+
+EpochRow = namedtuple('EpochRow', ['epoch'])
+
+
+class FakeSession:
+    def __init__(self, epoch):
+        self.epoch = epoch
+
+    def execute(self, query, params=None):
+        return FakeResult(EpochRow(self.epoch))
+
+
+class FakeResult:
+    def __init__(self, row):
+        self.row = row
+
+    def one(self):
+        return self.row
+
+
+class LeafPartitionCacheTest(SimpleTestCase):
+    """叶子分区LRU缓存测试"""
+
+    def test_hit_after_miss(self):
+        cache = LeafPartitionCache(max_bytes=1024 * 1024)
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return [('aa', 'bb', 'cc')]
+
+        self.assertEqual(cache.get((1, 1, 10), loader), [('aa', 'bb', 'cc')])
+        self.assertEqual(cache.get((1, 1, 10), loader), [('aa', 'bb', 'cc')])
+        self.assertEqual(len(loads), 1)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_evicts_least_recently_used(self):
+        rows = [('a' * 100, 'b' * 100, 'c' * 32)]
+        entry_size = LeafPartitionCache._estimate_size(rows)
+        cache = LeafPartitionCache(max_bytes=entry_size * 2)
+
+        cache.put((1, 1, 1), rows)
+        cache.put((1, 1, 2), rows)
+        cache.get((1, 1, 1), lambda: self.fail('应命中缓存'))
+        cache.put((1, 1, 3), rows)
+
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['entries'], 2)
+        self.assertLessEqual(stats['bytes'], stats['max_bytes'])
+        self.assertEqual(cache.get((1, 1, 2), lambda: []), [])
+
+    def test_clear_discards_in_flight_load(self):
+        cache = LeafPartitionCache(max_bytes=1024 * 1024)
+
+        def loader():
+            # 加载期间摄取版本号变化导致缓存被清空
+            cache.clear()
+            return [('old', 'data', None)]
+
+        cache.get((1, 1, 1), loader)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_epoch_change_clears_only_that_fog(self):
+        cache = LeafPartitionCache(max_bytes=1024 * 1024, epoch_check_interval=0)
+        sessions = {1: FakeSession(1), 2: FakeSession(1)}
+        for fog_id, session in sessions.items():
+            cache.sync_epoch(session, fog_id)
+            cache.put((fog_id, 7, 10), [('aa', 'bb', 'cc')])
+
+        sessions[2].epoch = 2
+        for fog_id, session in sessions.items():
+            cache.sync_epoch(session, fog_id)
+
+        cache.get((1, 7, 10), lambda: self.fail('雾服务器1的分区应仍在缓存中'))
+        self.assertEqual(cache.get((2, 7, 10), lambda: []), [])
+        self.assertEqual(cache.stats()['epochs'], {1: 1, 2: 2})
+
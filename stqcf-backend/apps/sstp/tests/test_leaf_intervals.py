@@ -0,0 +1,45 @@
+from django.test import SimpleTestCase
+
+from process_octree_data import OctreeDataDistributor
+
+
+def _node(node_id, parent_id, is_leaf):
+    return {'node_id': node_id, 'parent_id': parent_id, 'level': 0, 'is_leaf': is_leaf, 'MC': None, 'GC': None}
+
+
+class LeafIntervalTest(SimpleTestCase):
+    """先序叶子区间计算测试"""
+
+    def setUp(self):
+        self.distributor = OctreeDataDistributor()
+
+    def test_intervals_cover_subtree_leaves(self):
+        nodes = [
+            _node(0, None, 0),
+            _node(1, 0, 0),
+            _node(2, 0, 0),
+            _node(11, 1, 1),
+            _node(12, 1, 1),
+            _node(21, 2, 1),
+            _node(3, 0, 1),
+        ]
+        leaf_order = self.distributor.assign_leaf_intervals(nodes)
+        by_id = {n['node_id']: n for n in nodes}
+
+        self.assertEqual(leaf_order, [11, 12, 21, 3])
+        self.assertEqual((by_id[0]['first_leaf'], by_id[0]['last_leaf']), (0, 3))
+        self.assertEqual((by_id[1]['first_leaf'], by_id[1]['last_leaf']), (0, 1))
+        self.assertEqual((by_id[2]['first_leaf'], by_id[2]['last_leaf']), (2, 2))
+        self.assertEqual((by_id[3]['first_leaf'], by_id[3]['last_leaf']), (3, 3))
+
+    def test_childless_internal_node_counts_as_leaf(self):
+        # 节点1标记为非叶子但没有子节点，按叶子编号
+        nodes = [_node(0, None, 0), _node(1, 0, 0), _node(2, 0, 1)]
+        leaf_order = self.distributor.assign_leaf_intervals(nodes)
+        self.assertEqual(leaf_order, [1, 2])
+
+    def test_orphan_parent_becomes_root(self):
+        nodes = [_node(5, 99, 0), _node(6, 5, 1)]
+        leaf_order = self.distributor.assign_leaf_intervals(nodes)
+        self.assertEqual(leaf_order, [6])
+        self.assertEqual((nodes[0]['first_leaf'], nodes[0]['last_leaf']), (0, 0))
@@ -0,0 +1,37 @@
+from collections import namedtuple
+
+from django.test import SimpleTestCase
+
+from apps.sstp.leaf_summary import LeafSummaryStatus
+
+EpochRow = namedtuple('EpochRow', ['name', 'epoch'])
+
+
+class FakeSession:
+    def __init__(self, epochs):
+        self.epochs = epochs
+        self.reads = 0
+
+    def execute(self, query, params=None):
+        self.reads += 1
+        return [EpochRow(name, epoch) for name, epoch in self.epochs.items()]
+
+
+class LeafSummaryStatusTest(SimpleTestCase):
+    """叶子摘要表可用性判断测试"""
+
+    def test_ready_only_when_summary_matches_ingestion_epoch(self):
+        status = LeafSummaryStatus(check_interval=0)
+        self.assertTrue(status.is_ready(FakeSession({'trajectory': 5, 'leaf_summary': 5})))
+        # 迁移清空表后摄取版本号已更新，摘要表尚未写完
+        self.assertFalse(status.is_ready(FakeSession({'trajectory': 6, 'leaf_summary': 5})))
+        # 旧数据没有摘要表
+        self.assertFalse(status.is_ready(FakeSession({'trajectory': 6})))
+
+    def test_result_cached_within_check_interval(self):
+        status = LeafSummaryStatus(check_interval=60)
+        session = FakeSession({'trajectory': 5, 'leaf_summary': 5})
+        self.assertTrue(status.is_ready(session))
+        session.epochs['trajectory'] = 6
+        self.assertTrue(status.is_ready(session))
+        self.assertEqual(session.reads, 1)
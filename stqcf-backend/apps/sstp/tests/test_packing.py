@@ -0,0 +1,50 @@
+from django.test import SimpleTestCase
+
+from apps.sstp.packing import SlotPacker, POINT_FIELDS
+
+
+class SlotPackerTest(SimpleTestCase):
+    """多槽打包编码测试（槽运算与同态运算一致，直接在明文上验证）"""
+
+    def setUp(self):
+        self.packer = SlotPacker()
+        self.count = len(POINT_FIELDS)
+
+    def test_pack_unpack_roundtrip(self):
+        values = [39908722, -116397499, 1700000000]
+        self.assertEqual(self.packer.unpack(self.packer.pack(values), self.count), values)
+
+    def test_pack_rejects_overflow(self):
+        with self.assertRaises(ValueError):
+            self.packer.pack([1 << 47])
+
+    def test_compare_ge_per_slot(self):
+        left = self.packer.pack([5, -3, 100])
+        right = self.packer.pack([5, 2, 99])
+        comparison = self.packer.compare_ge(left, right, self.count)
+        self.assertEqual(self.packer.decode_comparison(comparison, self.count), [True, False, True])
+
+    def test_compare_ge_blinds_slots_independently(self):
+        left = self.packer.pack([7, 7, 7])
+        right = self.packer.pack([3, 3, 3])
+        comparison = self.packer.compare_ge(left, right, self.count)
+        self.assertEqual(self.packer.decode_comparison(comparison, self.count), [True, True, True])
+        slots = [(comparison >> (i * self.packer.slot_bits)) & self.packer.slot_mask for i in range(self.count)]
+        # 相等的差值在三个槽中的盲化值几乎不可能全部相同
+        self.assertGreater(len(set(slots)), 1)
+
+    def test_compare_points_in_range(self):
+        enc_min = self.packer.pack([10, 20, 1000])
+        enc_max = self.packer.pack([30, 40, 2000])
+        points = [
+            self.packer.pack([10, 40, 1500]),   # 边界值
+            self.packer.pack([31, 30, 1500]),   # 纬度越界
+            self.packer.pack([20, 30, 999]),    # 时间越界
+        ]
+        comparisons = self.packer.compare_points_in_range(points, enc_min, enc_max, self.count)
+        in_range = [
+            all(self.packer.decode_comparison(item['packed_min'], self.count))
+            and all(self.packer.decode_comparison(item['packed_max'], self.count))
+            for item in comparisons
+        ]
+        self.assertEqual(in_range, [True, False, False])
@@ -0,0 +1,32 @@
+from django.test import SimpleTestCase
+
+from apps.sstp.presence import NodePresenceBitmap
+
+
+class NodePresenceBitmapTest(SimpleTestCase):
+    """关键词节点存在位图测试"""
+
+    def test_marks_leaves_and_ancestors(self):
+        parent_map = {1: 0, 2: 0, 11: 1, 12: 1, 21: 2}
+        bitmap = NodePresenceBitmap.from_node_ids([12], parent_map)
+
+        self.assertTrue(bitmap.contains(12))
+        self.assertTrue(bitmap.contains(1))
+        self.assertTrue(bitmap.contains(0))
+        self.assertFalse(bitmap.contains(11))
+        self.assertFalse(bitmap.contains(2))
+        self.assertFalse(bitmap.contains(21))
+
+    def test_round_trip_bytes(self):
+        bitmap = NodePresenceBitmap.from_node_ids([3, 8, 100])
+        restored = NodePresenceBitmap(bitmap.to_bytes())
+
+        self.assertEqual(restored.filter(range(200)), [3, 8, 100])
+        self.assertEqual(len(restored), 3)
+        self.assertEqual(restored.node_ids(), [3, 8, 100])
+
+    def test_empty_bitmap_contains_nothing(self):
+        bitmap = NodePresenceBitmap(b'')
+        self.assertFalse(bitmap.contains(0))
+        self.assertEqual(bitmap.filter([0, 1, 2]), [])
+        self.assertEqual(bitmap.node_ids(), [])
@@ -4,9 +4,11 @@ import json
 import pickle
 import logging
 import socket
+import time
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from django.conf import settings
 from django.db import connections
 
@@ -18,6 +20,13 @@ logger = logging.getLogger(__name__)
 from apps.sstp.homomorphic_crypto import HomomorphicProcessor
 from apps.sstp.models import QueryRequest
 import apps.sstp.security as security
+from apps.sstp.central_client import CentralServerClient
+from apps.sstp.octree_version import get_octree_tables
+from apps.sstp.presence import NodePresenceBitmap
+
+# Murmur3Partitioner令牌环范围
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
 
 class TraversalProcessor:
     """
@@ -30,6 +39,10 @@ class TraversalProcessor:
         self.fog_id = fog_id
         # 初始化同态加密处理器
         self.crypto = HomomorphicProcessor()
+        self.central_client = CentralServerClient()
+        self.scan_stats = {'scanned_rows': 0, 'failed_batches': 0, 'timed_out': False}
+        self.progress_callback = None  # 扫描进度回调，每完成一个令牌环区间调用一次
+        self.deadline = None  # 查询截止时间（time.monotonic()），到期后放弃未完成的区间
         
         # 日志初始化
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
@@ -177,8 +190,11 @@ class TraversalProcessor:
                 'status': 'success',
                 'rid': query_params.get('rid'),
                 'results': results,
+                'date_dictionary': self._load_date_dictionary(results),
                 'count': len(results),
-                'duration': duration
+                'duration': duration,
+                'scanned_rows': self.scan_stats['scanned_rows'],
+                'partial': self.scan_stats['failed_batches'] > 0 or self.scan_stats.get('timed_out', False)
             }
             
         except Exception as e:
@@ -188,6 +204,54 @@ class TraversalProcessor:
                 'message': str(e)
             }
             
+    def process_queries(self, queries_params: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """一次令牌环扫描同时处理同一雾服务器上的多个子查询
+        
+        Args:
+            queries_params: 子查询参数列表
+            
+        Returns:
+            与queries_params一一对应的结果列表，单个结果格式与process_query相同，并带有各自的rid
+        """
+        try:
+            start_time = datetime.now()
+            self.logger.info(f"开始合并处理 {len(queries_params)} 个查询: {[q.get('rid') for q in queries_params]}")
+            
+            for query_params in queries_params:
+                self._save_query_request(query_params)
+            
+            if not self.cassandra_session:
+                self.logger.info("Cassandra连接不可用，尝试重新连接")
+                self._setup_cassandra_connection()
+            if not self.cassandra_session:
+                raise RuntimeError("Cassandra连接不可用，无法执行查询")
+            
+            results_by_query = [[] for _ in queries_params]
+            for index, matches in self.iter_scan_multi(queries_params):
+                results_by_query[index].extend(matches)
+            
+            duration = (datetime.now() - start_time).total_seconds()
+            self.logger.info(f"合并查询处理完成，耗时: {duration}秒，扫描 {self.scan_stats['scanned_rows']} 条数据")
+            
+            partial = self.scan_stats['failed_batches'] > 0 or self.scan_stats.get('timed_out', False)
+            return [
+                {
+                    'status': 'success',
+                    'rid': query_params.get('rid'),
+                    'results': results,
+                    'date_dictionary': self._load_date_dictionary(results),
+                    'count': len(results),
+                    'duration': duration,
+                    'scanned_rows': self.scan_stats['scanned_rows'],
+                    'partial': partial
+                }
+                for query_params, results in zip(queries_params, results_by_query)
+            ]
+            
+        except Exception as e:
+            self.logger.error(f"合并查询处理失败: {str(e)}", exc_info=True)
+            return [{'status': 'error', 'rid': query_params.get('rid'), 'message': str(e)} for query_params in queries_params]
+    
     def _save_query_request(self, query_params: Dict[str, Any]) -> None:
         """保存查询请求到数据库
         
@@ -241,57 +305,269 @@ class TraversalProcessor:
         candidate_set = []  # 初始化候选集
         
         try:
-            # 提取查询参数
-            keyword = query_params.get('keyword')
-            prange = query_params.get('Prange', {})
-            
             # 检查Cassandra连接是否可用
             if not self.cassandra_session:
                 self.logger.error("Cassandra连接不可用，无法执行查询")
                 return []
-                
-            # 执行查询
-            try:
-                # 构建CQL查询语句
-                cql_query = "SELECT traj_id, t_date, node_id FROM trajectorydate LIMIT 5000"
-                
-                # 执行查询
-                rows = self.cassandra_session.execute(cql_query)
-                
-                # 处理结果
-                for row in rows:
-                    try:
-                        traj_id = row.traj_id
-                        t_date = row.t_date
-                        node_id = row.node_id
-                        
-                        # 将二进制数据转换为十六进制字符串
-                        traj_id_hex = traj_id.hex() if isinstance(traj_id, bytes) else str(traj_id)
-                        date_hex = t_date.hex() if isinstance(t_date, bytes) else str(t_date)
-                        
-                        # 添加到候选集
-                        candidate_set.append({
-                            'traj_id': traj_id_hex,
-                            't_date': date_hex,
-                            'node_id': node_id
-                        })
-                    except Exception as e:
-                        self.logger.error(f"处理Cassandra查询结果行时出错: {str(e)}")
-                        continue
-                
-                self.logger.info(f"从Cassandra获取了 {len(candidate_set)} 条数据")
-                
-            except Exception as e:
-                self.logger.error(f"执行Cassandra查询失败: {str(e)}")
-                return []
+            
+            for batch in self.iter_scan(query_params):
+                candidate_set.extend(batch)
         
-            self.logger.info(f"遍历处理完成，找到 {len(candidate_set)} 条符合条件的轨迹点")
+            self.logger.info(f"遍历处理完成，扫描 {self.scan_stats['scanned_rows']} 条数据，"
+                             f"找到 {len(candidate_set)} 条符合条件的轨迹点")
             return candidate_set
             
         except Exception as e:
             self.logger.error(f"遍历叶子节点失败: {str(e)}", exc_info=True)
             return []
     
+    def iter_scan(self, query_params: Dict[str, Any]):
+        """并发扫描轨迹数据，逐批产出通过点范围验证的轨迹点
+        
+        明文整数关键词按KeywordNodePresence位图列出该关键词的 (keyword, node_id) 分区并逐个直接读取；
+        其他情况把令牌环切分为TRAVERSAL_SCAN_SPLITS个区间全表扫描。扫描单元由
+        TRAVERSAL_SCAN_CONCURRENCY个线程并发执行，数据按TRAVERSAL_VERIFY_BATCH_SIZE
+        分批对照Prange验证，每个扫描单元完成后立即产出结果。
+        
+        Args:
+            query_params: 查询参数
+            
+        Yields:
+            满足条件的轨迹点列表
+        """
+        for _, matches in self.iter_scan_multi([query_params]):
+            yield matches
+    
+    def iter_scan_multi(self, queries_params: List[Dict[str, Any]]):
+        """一次扫描同时验证多个子查询，扫描方式同iter_scan
+        
+        每行数据只读取一次，再分发给关键词匹配的各个子查询分别验证。
+        所有子查询的关键词是同一个明文整数时只读取该关键词的分区。
+        
+        Yields:
+            (子查询下标, 满足该子查询条件的轨迹点列表)
+        """
+        keywords = {query_params.get('keyword') for query_params in queries_params}
+        keyword = next(iter(keywords)) if len(keywords) == 1 else None
+        concurrency = getattr(settings, 'TRAVERSAL_SCAN_CONCURRENCY', 8)
+        self.scan_stats = {'scanned_rows': 0, 'failed_batches': 0, 'timed_out': False}
+        
+        columns = "keyword, node_id, traj_id, traj_tag, t_date, date_code, latitude, longitude, time"
+        if isinstance(keyword, int):
+            statement = self.cassandra_session.prepare(
+                f"SELECT {columns} FROM trajectorydate WHERE keyword = ? AND node_id = ?"
+            )
+            units = [(keyword, node_id) for node_id in self._keyword_node_ids(keyword)]
+        else:
+            statement = self.cassandra_session.prepare(
+                f"SELECT {columns} FROM trajectorydate "
+                "WHERE token(keyword, node_id) > ? AND token(keyword, node_id) <= ?"
+            )
+            units = self._split_token_ring(getattr(settings, 'TRAVERSAL_SCAN_SPLITS', 64))
+        statement.fetch_size = getattr(settings, 'TRAVERSAL_SCAN_FETCH_SIZE', 1000)
+        
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            futures = [
+                executor.submit(self._scan_unit, statement, params, queries_params, keyword)
+                for params in units
+            ]
+            timeout = None if self.deadline is None else max(self.deadline - time.monotonic(), 0)
+            for completed, future in enumerate(as_completed(futures, timeout=timeout), 1):
+                matches_by_query, scanned, failed_batches = future.result()
+                self.scan_stats['scanned_rows'] += scanned
+                self.scan_stats['failed_batches'] += failed_batches
+                self._report_progress(completed, len(futures), sum(len(matches) for matches in matches_by_query))
+                for index, matches in enumerate(matches_by_query):
+                    if matches:
+                        yield index, matches
+        except FuturesTimeoutError:
+            unfinished = sum(1 for future in futures if not future.done())
+            self.logger.warning(f"已到截止时间，放弃 {unfinished} 个未完成的扫描单元")
+            self.scan_stats['timed_out'] = True
+        finally:
+            # 截止时间到达或调用方提前结束时取消排队中的扫描单元，不等待正在执行的单元
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _keyword_node_ids(self, keyword: int) -> List[int]:
+        """列出关键词在本雾服务器上可能有数据的节点ID，即该关键词的 (keyword, node_id) 分区
+        
+        优先读取数据迁移写入的KeywordNodePresence位图；没有位图时退回八叉树的全部叶子节点。
+        """
+        try:
+            row = self.cassandra_session.execute(
+                "SELECT node_bitmap FROM KeywordNodePresence WHERE keyword = %s", (keyword,)
+            ).one()
+            if row is not None:
+                return NodePresenceBitmap(row.node_bitmap).node_ids()
+        except Exception as e:
+            self.logger.warning(f"读取关键词 {keyword} 的节点存在位图失败: {str(e)}")
+        octree_table = get_octree_tables(self.cassandra_session)[0]
+        rows = self.cassandra_session.execute(f"SELECT node_id, is_leaf FROM gko_space.{octree_table}")
+        return sorted(row.node_id for row in rows if row.is_leaf)
+    
+    def set_deadline(self, deadline: Optional[float]) -> None:
+        """设置查询截止时间，同时限制中央服务器请求的超时"""
+        self.deadline = deadline
+        self.central_client.deadline = deadline
+    
+    def _report_progress(self, completed: int, total: int, matches: int) -> None:
+        """通知扫描进度回调"""
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback({
+                'completed_ranges': completed,
+                'total_ranges': total,
+                'scanned_rows': self.scan_stats['scanned_rows'],
+                'matches': matches
+            })
+        except Exception as e:
+            self.logger.warning(f"扫描进度回调失败: {str(e)}")
+    
+    def _split_token_ring(self, splits: int) -> List[tuple]:
+        """把Murmur3令牌环切分为首尾相接的 (start, end] 区间"""
+        step = (MAX_TOKEN - MIN_TOKEN) // splits
+        bounds = [MIN_TOKEN + i * step for i in range(splits)] + [MAX_TOKEN]
+        return list(zip(bounds[:-1], bounds[1:]))
+    
+    def _scan_unit(self, statement, params: tuple, queries_params: List[Dict[str, Any]],
+                   keyword: Any = None) -> tuple:
+        """扫描单个令牌区间或 (keyword, node_id) 分区，按子查询分批验证
+        
+        Args:
+            params: 令牌区间 (start, end] 或分区键 (keyword, node_id)
+            keyword: 语句中作为过滤条件的明文整数关键词，为None时扫描区间内全部数据
+            
+        Returns:
+            (每个子查询满足条件的轨迹点列表, 扫描行数, 验证失败的批次数)
+        """
+        batch_size = getattr(settings, 'TRAVERSAL_VERIFY_BATCH_SIZE', 500)
+        
+        matches = [[] for _ in queries_params]
+        batches = [[] for _ in queries_params]
+        scanned = 0
+        failed_batches = 0
+        
+        def flush(index):
+            nonlocal failed_batches
+            verified = self._verify_batch(batches[index], queries_params[index])
+            if verified is None:
+                failed_batches += 1
+            else:
+                matches[index].extend(verified)
+            batches[index] = []
+        
+        try:
+            for row in self.cassandra_session.execute(statement, params):
+                scanned += 1
+                for index, query_params in enumerate(queries_params):
+                    if not isinstance(keyword, int) and not self._row_matches_keyword(query_params.get('keyword'), row.keyword):
+                        continue
+                    batches[index].append(row)
+                    if len(batches[index]) >= batch_size:
+                        flush(index)
+            for index, batch in enumerate(batches):
+                if batch:
+                    flush(index)
+        except Exception as e:
+            self.logger.error(f"扫描 {params} 失败: {str(e)}")
+            failed_batches += 1
+        return matches, scanned, failed_batches
+    
+    def _row_matches_keyword(self, query_keyword: Any, row_keyword: Any) -> bool:
+        """判断一行数据是否属于子查询的关键词"""
+        if isinstance(query_keyword, int):
+            return row_keyword == query_keyword
+        return self._check_keyword_match(query_keyword, row_keyword)
+    
+    def _verify_batch(self, rows: List[Any], query_params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """对一批轨迹点做Prange验证
+        
+        加密的Prange一次性交给中央服务器批量验证；明文Prange在本地用
+        _check_coordinate_range/_check_time_range验证。
+        
+        Returns:
+            满足条件的轨迹点列表，中央服务器验证失败时返回None
+        """
+        prange = query_params.get('Prange', {})
+        
+        if prange.get('latitude_min').__class__.__name__ == 'EncryptedNumber':
+            points = [
+                {
+                    'traj_id': row.traj_id.hex() if isinstance(row.traj_id, bytes) else str(row.traj_id),
+                    'enc_x': row.longitude.hex() if isinstance(row.longitude, bytes) else row.longitude,
+                    'enc_y': row.latitude.hex() if isinstance(row.latitude, bytes) else row.latitude,
+                    'enc_t': row.time.hex() if isinstance(row.time, bytes) else row.time
+                }
+                for row in rows
+            ]
+            result = self.central_client.verify_points_in_range(
+                query_params.get('rid'), points,
+                prange.get('longitude_min'), prange.get('latitude_min'),
+                prange.get('longitude_max'), prange.get('latitude_max'),
+                enc_t_min=prange.get('time_min'), enc_t_max=prange.get('time_max')
+            )
+            if 'error' in result:
+                self.logger.error(f"批量点位验证失败: {result.get('message', result['error'])}")
+                return None
+            verdicts = result.get('results', [])
+            if len(verdicts) != len(rows):
+                self.logger.error(f"批量点位验证结果数量不匹配: 期望 {len(rows)}，实际 {len(verdicts)}")
+                return None
+            selected = [row for row, verdict in zip(rows, verdicts) if verdict.get('in_range', False)]
+        else:
+            selected = [
+                row for row in rows
+                if self._check_coordinate_range(self._load_blob(row.latitude), prange.get('latitude_min'), prange.get('latitude_max'))
+                and self._check_coordinate_range(self._load_blob(row.longitude), prange.get('longitude_min'), prange.get('longitude_max'))
+                and self._check_time_range(self._load_blob(row.time), prange.get('time_min'), prange.get('time_max'))
+            ]
+        
+        matches = []
+        for row in selected:
+            item = {
+                'traj_id': row.traj_id.hex() if isinstance(row.traj_id, bytes) else str(row.traj_id),
+                'traj_tag': row.traj_tag.hex() if row.traj_tag else None,
+                't_date': row.t_date.hex() if isinstance(row.t_date, bytes) else str(row.t_date),
+                'node_id': row.node_id
+            }
+            # 按日期字典存储的数据只返回编码，密文随结果一次性下发
+            if row.t_date is None and row.date_code is not None:
+                item['t_date'] = None
+                item['date_code'] = row.date_code
+            matches.append(item)
+        return matches
+    
+    def _load_date_dictionary(self, results: List[Dict[str, Any]]) -> Dict[int, str]:
+        """读取结果中引用到的加密日期，返回 {date_code: t_date_hex}"""
+        codes = {item['date_code'] for item in results if item.get('date_code') is not None}
+        if not codes or not self.cassandra_session:
+            return {}
+        try:
+            from cassandra.query import ValueSequence
+            # 按主键只读取引用到的日期，不读取整个字典的密文
+            rows = self.cassandra_session.execute(
+                "SELECT date_code, t_date FROM DateDictionary WHERE date_code IN %s",
+                (ValueSequence(sorted(codes)),)
+            )
+            return {
+                row.date_code: row.t_date.hex() if isinstance(row.t_date, bytes) else str(row.t_date)
+                for row in rows
+            }
+        except Exception as e:
+            self.logger.error(f"读取日期字典失败: {str(e)}")
+            return {}
+    
+    def _load_blob(self, value: Any) -> Any:
+        """反序列化pickle存储的加密字段"""
+        if isinstance(value, bytes):
+            try:
+                return pickle.loads(value)
+            except Exception:
+                return value
+        return value
+    
     def _check_keyword_match(self, query_keyword: int, node_keywords: Any) -> bool:
         """检查关键词是否匹配
         
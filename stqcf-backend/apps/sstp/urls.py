@@ -6,4 +6,5 @@ app_name = 'sstp'
 urlpatterns = [
     path('receive-pruning-command/', views.receive_pruning_command, name='receive_pruning_command'),
     path('query-status/<str:rid>/', views.query_status, name='query_status'),
+    path('leaf-cache-stats/', views.leaf_cache_stats, name='leaf_cache_stats'),
 ] 
\ No newline at end of file
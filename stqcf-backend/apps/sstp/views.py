@@ -7,8 +7,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 
-from .sstp_processor import SSTPProcessor
+from .sstp_processor import SSTPProcessor, get_shared_scan_batcher
 from .models import QueryRequest
+from .leaf_cache import get_leaf_cache
 from .security import verify_api_key, verify_secure_token
 
 logger = logging.getLogger(__name__)
@@ -94,10 +95,13 @@ def receive_pruning_command(request):
             }, status=400)
         
         logger.info(f"接收到查询请求 {data['rid']} 用于雾服务器 {fog_id}")
-        processor = SSTPProcessor(fog_id)
         
-        # 处理查询
-        results = processor.process_query(data)
+        # 处理查询，开启共享扫描时与同一窗口内的其他查询合并遍历
+        batcher = get_shared_scan_batcher(fog_id)
+        if batcher:
+            results = batcher.submit(data)
+        else:
+            results = SSTPProcessor(fog_id).process_query(data)
         
         if 'error' in results:
             return JsonResponse({
@@ -171,6 +175,27 @@ def query_status(request, rid):
             "details": str(e)
         }, status=500)
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def leaf_cache_stats(request):
+    """
+    获取叶子分区缓存的统计信息
+    
+    响应格式:
+    {
+        "status": "success/error",
+        "enabled": true,
+        "stats": {"entries", "bytes", "max_bytes", "hits", "misses", "hit_rate", "evictions", "epoch"}
+    }
+    """
+    if not _verify_request_auth(request):
+        return JsonResponse({"status": "error", "message": "Unauthorized"}, status=401)
+    
+    cache = get_leaf_cache()
+    if cache is None:
+        return JsonResponse({"status": "success", "enabled": False, "stats": None})
+    return JsonResponse({"status": "success", "enabled": True, "stats": cache.stats()})
+
 def _verify_request_auth(request):
     """
     验证API请求的认证信息
@@ -16,6 +16,12 @@ SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'your-secret-key-here')
 CENTRAL_SERVER_URL = os.environ.get('CENTRAL_SERVER_URL', 'http://localhost:8000')
 CENTRAL_SERVER_API_KEY = os.environ.get('CENTRAL_SERVER_API_KEY', 'default-api-key')
 CENTRAL_SERVER_TIMEOUT = int(os.environ.get('CENTRAL_SERVER_TIMEOUT', 30))
+# 轨迹ID确定性标签密钥，只配置在中心侧（数据迁移和查询客户端），不下发给雾服务器；未配置时无法生成标签
+TRAJ_TAG_SECRET_KEY = os.environ.get('TRAJ_TAG_SECRET_KEY', '')
+# 轨迹点打包编码：纬度、经度、时间额外打包进同一个Paillier明文（packed_point列），并随查询下发打包的Prange边界。
+# 遍历算法的批量验证仍读取逐字段的列，逐字段密文照常写入，开启后每点4个密文，存储和加密时间增加；
+# 目前只减少SSTP逐点比较的验证流量（每点一次比较），因此默认关闭
+TRAJECTORY_PACKED_ENCODING = os.environ.get('TRAJECTORY_PACKED_ENCODING', 'False').lower() == 'true'
 
 # Application definition
 INSTALLED_APPS = [
@@ -37,6 +43,7 @@ INSTALLED_APPS = [
     'apps.fog_management',
     'apps.sstp',
     'apps.stv',
+    'apps.query',
 ]
 
 MIDDLEWARE = [
@@ -187,4 +194,85 @@ CENTRAL_SERVER_TIMEOUT = int(os.environ.get('CENTRAL_SERVER_TIMEOUT', 30))
 
 # STV模块配置
 STV_SERVICE_URL = 'http://localhost:8000/api/stv/query/'
-SSTP_SERVICE_URL = 'http://localhost:8000/api/sstp' 
\ No newline at end of file
+SSTP_SERVICE_URL = 'http://localhost:8000/api/sstp'
+# 共享扫描合并窗口（秒），0表示关闭，同一窗口内到达同一雾服务器的查询合并为一次八叉树遍历
+SSTP_SHARED_SCAN_WINDOW = float(os.environ.get('SSTP_SHARED_SCAN_WINDOW', 0))
+# 叶子分区缓存容量（字节），0表示关闭；摄取版本号检查间隔（秒）
+SSTP_LEAF_CACHE_MAX_BYTES = int(os.environ.get('SSTP_LEAF_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+SSTP_LEAF_CACHE_EPOCH_CHECK_INTERVAL = float(os.environ.get('SSTP_LEAF_CACHE_EPOCH_CHECK_INTERVAL', 5))
+# 雾服务器读取当前生效八叉树版本（ActiveOctree指针）的最小间隔（秒）
+SSTP_OCTREE_VERSION_CHECK_INTERVAL = float(os.environ.get('SSTP_OCTREE_VERSION_CHECK_INTERVAL', 5))
+# 遍历算法全表扫描：令牌环切分数、并发数、分页大小、每批验证的点数
+TRAVERSAL_SCAN_SPLITS = int(os.environ.get('TRAVERSAL_SCAN_SPLITS', 64))
+TRAVERSAL_SCAN_CONCURRENCY = int(os.environ.get('TRAVERSAL_SCAN_CONCURRENCY', 8))
+TRAVERSAL_SCAN_FETCH_SIZE = int(os.environ.get('TRAVERSAL_SCAN_FETCH_SIZE', 1000))
+TRAVERSAL_VERIFY_BATCH_SIZE = int(os.environ.get('TRAVERSAL_VERIFY_BATCH_SIZE', 500))
+# 查询结果缓存：TTL（秒，0表示关闭）、最大条目数、雾服务器摄取版本号检查间隔（秒）
+QUERY_RESULT_CACHE_TTL = int(os.environ.get('QUERY_RESULT_CACHE_TTL', 300))
+QUERY_RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_RESULT_CACHE_MAX_ENTRIES', 256))
+QUERY_RESULT_CACHE_EPOCH_CHECK_INTERVAL = float(os.environ.get('QUERY_RESULT_CACHE_EPOCH_CHECK_INTERVAL', 5))
+# 查询进度事件频道：'redis'（默认，使用Celery broker）或'memory'（进程内）；事件流保活间隔（秒）
+QUERY_PROGRESS_BACKEND = os.environ.get('QUERY_PROGRESS_BACKEND', 'redis')
+QUERY_PROGRESS_KEEPALIVE = int(os.environ.get('QUERY_PROGRESS_KEEPALIVE', 15))
+# 查询截止时间（秒，即尾延迟SLO，0表示不限制）、向副本雾服务器发起对冲请求前的等待时间（秒）、雾服务器查询线程数
+QUERY_DEADLINE_SECONDS = float(os.environ.get('QUERY_DEADLINE_SECONDS', 30))
+QUERY_HEDGE_DELAY_SECONDS = float(os.environ.get('QUERY_HEDGE_DELAY_SECONDS', 2))
+QUERY_FOG_WORKERS = int(os.environ.get('QUERY_FOG_WORKERS', 16)) 
+# 准入控制：每个键的速率（每秒请求数，0表示不限速）、突发容量、并发上限（0表示不限制），
+# global为整个查询，fog为单个雾服务器，central为雾服务器发往中央服务器的比较请求；
+# 等待队列长度、最长等待时间（秒），异步查询任务过载时的重试次数
+QUERY_ADMISSION_ENABLED = os.environ.get('QUERY_ADMISSION_ENABLED', 'true').lower() == 'true'
+QUERY_ADMISSION_GLOBAL_RATE = float(os.environ.get('QUERY_ADMISSION_GLOBAL_RATE', 20))
+QUERY_ADMISSION_GLOBAL_BURST = int(os.environ.get('QUERY_ADMISSION_GLOBAL_BURST', 40))
+QUERY_ADMISSION_GLOBAL_CONCURRENCY = int(os.environ.get('QUERY_ADMISSION_GLOBAL_CONCURRENCY', 16))
+QUERY_ADMISSION_FOG_RATE = float(os.environ.get('QUERY_ADMISSION_FOG_RATE', 10))
+QUERY_ADMISSION_FOG_BURST = int(os.environ.get('QUERY_ADMISSION_FOG_BURST', 20))
+QUERY_ADMISSION_FOG_CONCURRENCY = int(os.environ.get('QUERY_ADMISSION_FOG_CONCURRENCY', 4))
+QUERY_ADMISSION_CENTRAL_RATE = float(os.environ.get('QUERY_ADMISSION_CENTRAL_RATE', 0))
+QUERY_ADMISSION_CENTRAL_BURST = int(os.environ.get('QUERY_ADMISSION_CENTRAL_BURST', 1))
+QUERY_ADMISSION_CENTRAL_CONCURRENCY = int(os.environ.get('QUERY_ADMISSION_CENTRAL_CONCURRENCY', 32))
+QUERY_ADMISSION_MAX_QUEUE = int(os.environ.get('QUERY_ADMISSION_MAX_QUEUE', 100))
+QUERY_ADMISSION_MAX_WAIT = float(os.environ.get('QUERY_ADMISSION_MAX_WAIT', 10))
+QUERY_JOB_OVERLOAD_RETRIES = int(os.environ.get('QUERY_JOB_OVERLOAD_RETRIES', 5))
+# Cassandra批量写入：每个单分区批次的最大行数和字节数、缓存的最大行数、
+# 初始和最大并发批次数、目标批次延迟（秒，超过时并发减半）
+INGEST_BATCH_MAX_ROWS = int(os.environ.get('INGEST_BATCH_MAX_ROWS', 100))
+INGEST_BATCH_MAX_BYTES = int(os.environ.get('INGEST_BATCH_MAX_BYTES', 32 * 1024))
+INGEST_MAX_BUFFERED_ROWS = int(os.environ.get('INGEST_MAX_BUFFERED_ROWS', 20000))
+INGEST_INITIAL_CONCURRENCY = int(os.environ.get('INGEST_INITIAL_CONCURRENCY', 8))
+INGEST_MAX_CONCURRENCY = int(os.environ.get('INGEST_MAX_CONCURRENCY', 64))
+INGEST_TARGET_BATCH_LATENCY = float(os.environ.get('INGEST_TARGET_BATCH_LATENCY', 0.2))
+# 失败批次重试的退避基数和上限（秒），第n次重试在 [0, min(上限, 基数*2^(n-1))] 内随机等待
+INGEST_RETRY_BACKOFF = float(os.environ.get('INGEST_RETRY_BACKOFF', 0.1))
+INGEST_RETRY_BACKOFF_MAX = float(os.environ.get('INGEST_RETRY_BACKOFF_MAX', 5))
+
+# 数据迁移任务：轨迹分块行数、八叉树分块行数、分块失败重试次数、单个分块任务的时间上限（秒）
+MIGRATION_CHUNK_ROWS = int(os.environ.get('MIGRATION_CHUNK_ROWS', 2000))
+MIGRATION_OCTREE_CHUNK_ROWS = int(os.environ.get('MIGRATION_OCTREE_CHUNK_ROWS', 50000))
+MIGRATION_CHUNK_MAX_RETRIES = int(os.environ.get('MIGRATION_CHUNK_MAX_RETRIES', 3))
+MIGRATION_CHUNK_TIME_LIMIT = int(os.environ.get('MIGRATION_CHUNK_TIME_LIMIT', 1800))
+# 八叉树迁移只向每个雾服务器分发覆盖其关键词数据的子树；关键词重新分配后轨迹迁移拒绝执行，需先重新迁移八叉树
+OCTREE_SPARSE_DISTRIBUTION = os.environ.get('OCTREE_SPARSE_DISTRIBUTION', 'True').lower() == 'true'
+# SSTP从叶子摘要表读取候选轨迹（每个轨迹日一行），摘要表未构建完成时自动读取逐点数据
+SSTP_LEAF_SUMMARY_ENABLED = os.environ.get('SSTP_LEAF_SUMMARY_ENABLED', 'True').lower() == 'true'
+
+# 轨迹CSV导入：上传文件保存目录（需与Celery worker共享）、每个提交分块的行数、bulk_create批大小、
+# 是否使用LOAD DATA LOCAL INFILE（需MySQL服务端开启local_infile）、导入任务的时间上限（秒）
+TRACK_IMPORT_DIR = os.environ.get('TRACK_IMPORT_DIR', os.path.join(BASE_DIR, 'uploads', 'track_imports'))
+TRACK_IMPORT_CHUNK_ROWS = int(os.environ.get('TRACK_IMPORT_CHUNK_ROWS', 5000))
+TRACK_IMPORT_BATCH_SIZE = int(os.environ.get('TRACK_IMPORT_BATCH_SIZE', 1000))
+TRACK_IMPORT_USE_LOAD_DATA = os.environ.get('TRACK_IMPORT_USE_LOAD_DATA', 'False').lower() == 'true'
+TRACK_IMPORT_TIME_LIMIT = int(os.environ.get('TRACK_IMPORT_TIME_LIMIT', 6 * 3600))
+if TRACK_IMPORT_USE_LOAD_DATA:
+    DATABASES['default']['OPTIONS']['local_infile'] = 1
+
+# 轨迹导出：每次查询读取的行数、gzip压缩级别
+TRACK_EXPORT_CHUNK_ROWS = int(os.environ.get('TRACK_EXPORT_CHUNK_ROWS', 5000))
+TRACK_EXPORT_GZIP_LEVEL = int(os.environ.get('TRACK_EXPORT_GZIP_LEVEL', 6))
+
+# Parquet导入导出（需安装pyarrow）：压缩算法、导出时每个行组的行数、读取时每批的行数
+TRACK_PARQUET_COMPRESSION = os.environ.get('TRACK_PARQUET_COMPRESSION', 'zstd')
+TRACK_PARQUET_ROW_GROUP_ROWS = int(os.environ.get('TRACK_PARQUET_ROW_GROUP_ROWS', 100000))
+TRACK_PARQUET_BATCH_ROWS = int(os.environ.get('TRACK_PARQUET_BATCH_ROWS', 65536))
+# 轨迹数据迁移从trajectorydate的Parquet快照读取而不是MySQL，为空时读取MySQL
+TRAJECTORY_PARQUET_SNAPSHOT = os.environ.get('TRAJECTORY_PARQUET_SNAPSHOT', '')
@@ -99,6 +99,7 @@ INSTALLED_APPS = [
     'apps.fog_management',
     'apps.sstp',
     'apps.stv',
+    'apps.query',
 ]
 
 MIDDLEWARE += [
@@ -3,7 +3,6 @@ import sys
 import django
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
-from cassandra.concurrent import execute_concurrent_with_args
 from phe import paillier
 import pickle
 import json
@@ -18,6 +17,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gko_project.settings.development')
 django.setup()
 
+from apps.data_processing.bulk_writer import CassandraBulkWriter
+from process_octree_data import OctreeDataDistributor
+
 class DataEncryptionDistributor:
     def __init__(self):
         self.fog_servers = {}  # 将在get_keyword_mapping中初始化
@@ -80,19 +82,6 @@ class DataEncryptionDistributor:
             
             session.set_keyspace(keyspace)
             
-            # 创建OctreeNode表（修改后的结构）
-            session.execute("""
-                CREATE TABLE IF NOT EXISTS OctreeNode (
-                    node_id blob,
-                    parent_id blob,
-                    level int,
-                    is_leaf blob,
-                    MC list<blob>,
-                    GC list<blob>,
-                    PRIMARY KEY (node_id)
-                )
-            """)
-            
             # 创建TrajectoryDate表
             session.execute("""
                 CREATE TABLE IF NOT EXISTS TrajectoryDate (
@@ -141,87 +130,18 @@ class DataEncryptionDistributor:
         return keyword_to_fog
 
     def process_octree_nodes(self):
-        """处理OctreeNode表数据"""
-        print("\n处理OctreeNode数据...")
+        """
+        处理OctreeNode表数据
         
-        # 从MySQL读取数据
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT node_id, parent_id, level, is_leaf, MC, GC FROM octreenode")
-            columns = [col[0] for col in cursor.description]
-            raw_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        # 并行加密处理
-        encrypted_data = []
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = []
-            for i in range(0, len(raw_data), self.batch_size):
-                batch = raw_data[i:i + self.batch_size]
-                futures.append(executor.submit(self.encrypt_octree_batch, batch))
-            
-            for future in tqdm(as_completed(futures), total=len(futures), desc="加密数据"):
-                encrypted_data.extend(future.result())
-        
-        # 分发到所有雾节点
-        for fog_id, fog_info in self.fog_servers.items():
-            session = None
-            try:
-                session = self.connect_cassandra(fog_info)
-                insert_stmt = session.prepare("""
-                    INSERT INTO OctreeNode 
-                    (node_id, parent_id, level, is_leaf, MC, GC)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """)
-                
-                statements_and_params = [
-                    (insert_stmt, (
-                        item['node_id'],
-                        item['parent_id'],
-                        item['level'],  # 不加密的level
-                        item['is_leaf'],
-                        item['MC'],
-                        item['GC']
-                    )) for item in encrypted_data
-                ]
-                
-                for i in tqdm(range(0, len(statements_and_params), self.batch_size),
-                            desc=f"写入Fog{fog_id}数据"):
-                    batch = statements_and_params[i:i + self.batch_size]
-                    execute_concurrent_with_args(
-                        session, insert_stmt, batch,
-                        concurrency=self.max_workers
-                    )
-                
-                print(f"✓ Fog{fog_id} OctreeNode数据写入完成")
-            except Exception as e:
-                print(f"Fog{fog_id}写入失败: {str(e)}")
-            finally:
-                if session:
-                    session.shutdown()
-
-    def encrypt_octree_batch(self, items):
-        """批量加密八叉树节点数据"""
-        encrypted_items = []
-        for item in items:
-            try:
-                # 处理MC和GC字符串
-                mc_str = str(item['MC']) if item['MC'] is not None else ''
-                gc_str = str(item['GC']) if item['GC'] is not None else ''
-                
-                mc_values = [int(x.strip()) for x in mc_str.split(',') if x.strip().isdigit()]
-                gc_values = [int(x.strip()) for x in gc_str.split(',') if x.strip().isdigit()]
-                
-                encrypted_item = {
-                    'node_id': pickle.dumps(self.encrypt_field(item['node_id'])),
-                    'parent_id': pickle.dumps(self.encrypt_field(item['parent_id'])),
-                    'level': item['level'],  # level不加密
-                    'is_leaf': pickle.dumps(self.encrypt_field(item['is_leaf'])),
-                    'MC': [pickle.dumps(self.encrypt_field(x)) for x in mc_values],
-                    'GC': [pickle.dumps(self.encrypt_field(x)) for x in gc_values]
-                }
-                encrypted_items.append(encrypted_item)
-            except Exception as e:
-                print(f"加密失败: {str(e)} | 数据: {item}")
-        return encrypted_items
+        与八叉树迁移任务相同：写入新版本表（create_staging_tables / process_chunk），
+        全部写完后由finalize_fog切换ActiveOctree指针，切换前查询继续读取原版本。
+        """
+        print("\n处理OctreeNode数据...")
+        distributor = OctreeDataDistributor()
+        try:
+            distributor.process_octree_nodes()
+        finally:
+            distributor.close()
 
     def process_trajectory_dates(self):
         """处理TrajectoryDate表数据"""
@@ -280,23 +200,17 @@ class DataEncryptionDistributor:
                 for future in as_completed(futures):
                     encrypted_items.extend(future.result())
             
-            # 批量写入数据
-            statements_and_params = [
-                (insert_stmt, (
+            # 按 (V_K, NODE_ID) 分区合并为UNLOGGED批次写入
+            writer = CassandraBulkWriter(session, insert_stmt, partition_key_indexes=(0, 1),
+                                         name=f"Fog{fog_id} TrajectoryDate")
+            for item in tqdm(encrypted_items, desc=f"写入Fog{fog_id}数据"):
+                writer.add((
                     item['V_K'],
                     item['NODE_ID'],
                     item['TRAJ_ID'],
                     item['T_DATE']
-                )) for item in encrypted_items
-            ]
-            
-            for i in tqdm(range(0, len(statements_and_params), self.batch_size),
-                        desc=f"写入Fog{fog_id}数据"):
-                batch = statements_and_params[i:i + self.batch_size]
-                execute_concurrent_with_args(
-                    session, insert_stmt, batch,
-                    concurrency=self.max_workers
-                )
+                ))
+            writer.close()
             
             print(f"✓ Fog{fog_id} TrajectoryDate数据写入完成")
         except Exception as e:
@@ -1,9 +1,8 @@
 import os
 import sys
+import time
 import django
 from cassandra.cluster import Cluster
-from cassandra.concurrent import execute_concurrent_with_args
-from tqdm import tqdm
 import traceback
 from django.db import connection
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -19,12 +18,31 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gko_project.settings.development')
 django.setup()
 
+from apps.sstp.models import LEAF_ORDER_BUCKET_SIZE
+from apps.sstp.octree_version import (
+    octree_table_names, read_active_version, activate_version, write_octree_keywords
+)
+from apps.data_processing.bulk_writer import CassandraBulkWriter
+from apps.data_processing.trajectory_source import get_trajectory_source
+from django.conf import settings
+
+def trajectory_node_id(value):
+    """TrajectoryDate中的node_id转换为八叉树节点ID（"x,y"格式拼接为整数，与轨迹迁移一致），无效时返回None"""
+    text = str(value).strip()
+    parts = text.split(',')
+    if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+        return int(parts[0] + parts[1])
+    return int(text) if text.isdigit() else None
+
 class OctreeDataDistributor:
     def __init__(self):
         self.fog_servers = {}  # 将在初始化时填充
         self.cassandra_sessions = {}
         self.batch_size = 1000  # 批处理大小
         self.max_workers = 4    # 并行处理的工作线程数
+        self._octree_nodes = None    # 完整八叉树，由load_octree_nodes缓存
+        self._fog_data_nodes = None  # {fog_id: 含有该雾节点数据的节点ID集合}
+        self._octree_params = {}     # {fog_id: (节点行参数, 叶子序号行参数)}，由load_octree_params缓存
 
     def connect_cassandra(self, fog_server_info):
         """连接到指定Cassandra集群"""
@@ -43,27 +61,22 @@ class OctreeDataDistributor:
             
             session.set_keyspace('gko_space')
             
-            # 删除旧的索引和表
-            session.execute("DROP INDEX IF EXISTS idx_parent_id")
-            session.execute("DROP INDEX IF EXISTS idx_level")
-            session.execute("DROP TABLE IF EXISTS OctreeNode")
-            
-            # 创建OctreeNode表
+            # 创建八叉树版本指针表，查询方据此读取当前生效的八叉树表
             session.execute("""
-                CREATE TABLE IF NOT EXISTS OctreeNode (
-                    node_id int,
-                    parent_id int,
-                    level int,
-                    is_leaf int,
-                    MC list<int>,
-                    GC list<int>,
-                    PRIMARY KEY (node_id)
+                CREATE TABLE IF NOT EXISTS ActiveOctree (
+                    name text PRIMARY KEY,
+                    version bigint
                 )
             """)
             
-            # 创建索引
-            session.execute("CREATE INDEX IF NOT EXISTS idx_parent_id ON OctreeNode (parent_id)")
-            session.execute("CREATE INDEX IF NOT EXISTS idx_level ON OctreeNode (level)")
+            # 创建八叉树版本的关键词记录表，轨迹迁移据此确认八叉树覆盖雾节点当前的关键词
+            session.execute("""
+                CREATE TABLE IF NOT EXISTS OctreeKeywords (
+                    version bigint PRIMARY KEY,
+                    full_tree boolean,
+                    keywords set<int>
+                )
+            """)
             
             self.cassandra_sessions[fog_server_info['id']] = session
             print(f"✓ Fog{fog_server_info['id']} Cassandra连接成功")
@@ -72,12 +85,66 @@ class OctreeDataDistributor:
             print(f"连接Fog{fog_server_info['id']}失败: {str(e)}")
             raise
 
+    def create_staging_tables(self, session, version):
+        """创建指定版本的八叉树节点表和叶子序号表，旧表在新版本生效前保持可读"""
+        node_table, leaf_order_table = octree_table_names(version)
+        
+        # 创建OctreeNode表
+        session.execute(f"""
+            CREATE TABLE IF NOT EXISTS {node_table} (
+                node_id int,
+                parent_id int,
+                level int,
+                is_leaf int,
+                MC list<int>,
+                GC list<int>,
+                first_leaf int,
+                last_leaf int,
+                PRIMARY KEY (node_id)
+            )
+        """)
+        
+        # 创建叶子先序序号表，按序号范围批量定位子树的叶子
+        session.execute(f"""
+            CREATE TABLE IF NOT EXISTS {leaf_order_table} (
+                bucket int,
+                leaf_rank int,
+                node_id int,
+                PRIMARY KEY (bucket, leaf_rank)
+            ) WITH CLUSTERING ORDER BY (leaf_rank ASC)
+        """)
+        
+        # 创建索引（索引名在keyspace内唯一，带上版本号）
+        session.execute(f"CREATE INDEX IF NOT EXISTS idx_parent_id_v{version} ON {node_table} (parent_id)")
+        session.execute(f"CREATE INDEX IF NOT EXISTS idx_level_v{version} ON {node_table} (level)")
+
+    def drop_octree_version(self, session, version):
+        """删除指定版本的八叉树表，索引随表一起删除"""
+        for table in octree_table_names(version):
+            session.execute(f"DROP TABLE IF EXISTS {table}")
+
+    def drop_stale_versions(self, session, keep):
+        """删除不在keep中的八叉树版本；未分版本的旧表视为版本None"""
+        rows = session.execute(
+            "SELECT table_name FROM system_schema.tables WHERE keyspace_name = 'gko_space'"
+        )
+        versions = set()
+        for row in rows:
+            name = row.table_name.lower()
+            if name in ('octreenode', 'octreeleaforder'):
+                versions.add(None)
+            elif name.startswith('octreenode_v') and name[len('octreenode_v'):].isdigit():
+                versions.add(int(name[len('octreenode_v'):]))
+        for version in versions - set(keep):
+            self.drop_octree_version(session, version)
+            print(f"已删除过期的八叉树版本: {version if version is not None else '未分版本的旧表'}")
+
     def get_fog_servers(self):
         """获取所有雾服务器信息"""
         print("\n加载雾服务器信息...")
         
         with connection.cursor() as cursor:
-            cursor.execute("SELECT id, service_endpoint FROM fog_servers")
+            cursor.execute("SELECT id, service_endpoint, keywords FROM fog_servers")
             for row in cursor.fetchall():
                 fog_id = row[0]
                 endpoint = row[1]
@@ -88,12 +155,14 @@ class OctreeDataDistributor:
                 self.fog_servers[fog_id] = {
                     'id': fog_id,
                     'host': host,
-                    'port': port
+                    'port': port,
+                    'keywords': {int(k.strip()) for k in (row[2] or '').split(',') if k.strip().isdigit()}
                 }
 
-    def process_octree_nodes(self):
-        """处理OctreeNode表数据"""
-        print("\n处理OctreeNode数据...")
+    def load_octree_nodes(self):
+        """从MySQL读取完整八叉树，只读取一次；返回按node_id排序的节点字典列表"""
+        if self._octree_nodes is not None:
+            return self._octree_nodes
         
         # 从MySQL读取数据
         with connection.cursor() as cursor:
@@ -132,48 +201,353 @@ class OctreeDataDistributor:
             except ValueError as e:
                 print(f"数据转换错误: {str(e)} | 数据: {item}")
                 continue
+        processed_data.sort(key=lambda item: item['node_id'])
+        self._octree_nodes = processed_data
+        return processed_data
+
+    def load_fog_data_nodes(self):
+        """
+        读取各雾节点的轨迹数据所在的八叉树节点
         
-        # 分发到所有雾节点
-        for fog_id, fog_info in self.fog_servers.items():
-            session = None
-            try:
-                session = self.connect_cassandra(fog_info)
-                insert_stmt = session.prepare("""
-                    INSERT INTO OctreeNode 
-                    (node_id, parent_id, level, is_leaf, MC, GC)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """)
-                
-                # 准备批量写入的数据
-                statements_and_params = []
-                for item in processed_data:
-                    params = (
-                        item['node_id'],
-                        item['parent_id'],
-                        item['level'],
-                        item['is_leaf'],
-                        item['MC'],
-                        item['GC']
-                    )
-                    statements_and_params.append((insert_stmt, params))
-                
-                # 批量写入数据
-                for i in tqdm(range(0, len(statements_and_params), self.batch_size),
-                            desc=f"写入Fog{fog_id}数据"):
-                    batch = statements_and_params[i:i + self.batch_size]
-                    execute_concurrent_with_args(
-                        session, insert_stmt,
-                        [(params) for _, params in batch],
-                        concurrency=self.max_workers
-                    )
-                
-                print(f"✓ Fog{fog_id} OctreeNode数据写入完成")
-            except Exception as e:
-                print(f"Fog{fog_id}写入失败: {str(e)}")
-                traceback.print_exc()
-            finally:
-                if session:
-                    session.shutdown()
+        返回:
+            {fog_id: 含有该雾节点关键词轨迹数据的节点ID集合}
+        """
+        if self._fog_data_nodes is not None:
+            return self._fog_data_nodes
+        if not self.fog_servers:
+            self.get_fog_servers()
+        keyword_to_fog = {
+            keyword: fog_id
+            for fog_id, fog_info in self.fog_servers.items()
+            for keyword in fog_info['keywords']
+        }
+        
+        data_nodes = {fog_id: set() for fog_id in self.fog_servers}
+        # 与轨迹迁移读取同一数据来源（MySQL或Parquet快照），子树与迁移的轨迹数据一致
+        for keyword, node_id in get_trajectory_source().keyword_nodes():
+            if keyword is None or not str(keyword).strip().isdigit():
+                continue
+            fog_id = keyword_to_fog.get(int(keyword))
+            node_id = trajectory_node_id(node_id)
+            if fog_id is not None and node_id is not None:
+                data_nodes[fog_id].add(node_id)
+        self._fog_data_nodes = data_nodes
+        return data_nodes
+
+    def fog_subtree(self, nodes, data_node_ids):
+        """
+        计算覆盖雾节点数据的最小子树
+        
+        保留含有数据的节点及其全部祖先，根节点始终保留（查询从根节点开始遍历）。
+        非叶子节点的MC/GC收紧为保留子节点范围的并集（与原范围取交集），
+        查询在更高层即可剪掉只含其他雾节点数据的区域；叶子节点保留自身网格范围。
+        
+        参数:
+            nodes: load_octree_nodes返回的完整八叉树
+            data_node_ids: 含有该雾节点轨迹数据的节点ID集合
+        
+        返回:
+            子树节点字典的副本列表，按node_id排序
+        """
+        by_id = {item['node_id']: item for item in nodes}
+        
+        def is_root(item):
+            parent_id = item['parent_id']
+            return parent_id is None or parent_id == item['node_id'] or parent_id not in by_id
+        
+        keep = {item['node_id'] for item in nodes if is_root(item)}
+        for node_id in data_node_ids:
+            while node_id in by_id and node_id not in keep:
+                keep.add(node_id)
+                node_id = by_id[node_id]['parent_id']
+        
+        subtree = [dict(by_id[node_id]) for node_id in sorted(keep)]
+        children = {}
+        order = []  # 先序，逆序遍历时子节点先于父节点
+        for item in subtree:
+            if not is_root(item):
+                children.setdefault(item['parent_id'], []).append(item)
+        stack = [item for item in subtree if is_root(item)]
+        while stack:
+            item = stack.pop()
+            order.append(item)
+            stack.extend(children.get(item['node_id'], []))
+        
+        for item in reversed(order):
+            child_list = children.get(item['node_id'])
+            if not child_list or item['is_leaf'] == 1:
+                continue
+            # 任一子节点缺少范围时无法确定并集，保留原范围
+            if item['MC'] and all(c['MC'] and len(c['MC']) >= 2 for c in child_list):
+                item['MC'] = [
+                    max(item['MC'][0], min(c['MC'][0] for c in child_list)),
+                    min(item['MC'][1], max(c['MC'][1] for c in child_list))
+                ]
+            if item['GC'] and len(item['GC']) >= 4 and all(c['GC'] and len(c['GC']) >= 4 for c in child_list):
+                item['GC'] = [
+                    max(item['GC'][0], min(c['GC'][0] for c in child_list)),
+                    max(item['GC'][1], min(c['GC'][1] for c in child_list)),
+                    min(item['GC'][2], max(c['GC'][2] for c in child_list)),
+                    min(item['GC'][3], max(c['GC'][3] for c in child_list))
+                ] + item['GC'][4:]
+        return subtree
+
+    def load_octree_params(self, fog_id):
+        """
+        准备雾节点的八叉树写入参数，每个雾节点只准备一次，各分块共用
+        
+        OCTREE_SPARSE_DISTRIBUTION开启时只分发覆盖该雾节点数据的子树，
+        版本覆盖的关键词记录在OctreeKeywords中，关键词重新分配后轨迹迁移会拒绝执行，需先重新迁移八叉树。
+        
+        返回:
+            (节点行参数列表, 叶子序号行参数列表)，节点按node_id排序，保证分块范围在重复读取时一致
+        """
+        if fog_id in self._octree_params:
+            return self._octree_params[fog_id]
+        
+        nodes = self.load_octree_nodes()
+        if getattr(settings, 'OCTREE_SPARSE_DISTRIBUTION', True):
+            processed_data = self.fog_subtree(nodes, self.load_fog_data_nodes().get(fog_id, set()))
+            print(f"Fog{fog_id} 子树包含 {len(processed_data)}/{len(nodes)} 个节点")
+        else:
+            processed_data = [dict(item) for item in nodes]
+        
+        # 计算每个节点的先序叶子区间
+        leaf_order = self.assign_leaf_intervals(processed_data)
+        print(f"Fog{fog_id} 先序叶子区间计算完成，共 {len(leaf_order)} 个叶子节点")
+        
+        node_params = [
+            (
+                item['node_id'],
+                item['parent_id'],
+                item['level'],
+                item['is_leaf'],
+                item['MC'],
+                item['GC'],
+                item.get('first_leaf'),
+                item.get('last_leaf')
+            )
+            for item in processed_data
+        ]
+        leaf_order_params = [
+            (rank // LEAF_ORDER_BUCKET_SIZE, rank, node_id)
+            for rank, node_id in enumerate(leaf_order)
+        ]
+        self._octree_params[fog_id] = (node_params, leaf_order_params)
+        return self._octree_params[fog_id]
+
+    def get_session(self, fog_id):
+        """获取雾节点的Cassandra会话，同一分发器上的各阶段复用连接"""
+        if not self.fog_servers:
+            self.get_fog_servers()
+        session = self.cassandra_sessions.get(fog_id)
+        if session is None or session.is_shutdown:
+            session = self.connect_cassandra(self.fog_servers[fog_id])
+        return session
+
+    def plan_migration(self):
+        """
+        规划分块迁移
+        
+        每个雾节点依次为准备（创建版本表）、节点表和叶子序号表的若干分块、收尾（切换版本指针）。
+        分块按参数列表下标划分，重复写入同一主键是幂等的。
+        
+        返回:
+            检查点列表 [{'fog_id', 'phase', 'chunk_key', 'params'}]
+        """
+        if not self.fog_servers:
+            self.get_fog_servers()
+        chunk_rows = getattr(settings, 'MIGRATION_OCTREE_CHUNK_ROWS', 50000)
+        
+        plan = []
+        for fog_id in self.fog_servers:
+            node_params, leaf_order_params = self.load_octree_params(fog_id)
+            plan.append({'fog_id': fog_id, 'phase': 'prepare', 'chunk_key': 'prepare', 'params': {}})
+            for table, total in (('nodes', len(node_params)), ('leaf_order', len(leaf_order_params))):
+                for start in range(0, total, chunk_rows):
+                    end = min(start + chunk_rows, total)
+                    plan.append({
+                        'fog_id': fog_id,
+                        'phase': 'chunk',
+                        'chunk_key': f'{table}:{start}-{end - 1}',
+                        'params': {'table': table, 'start': start, 'end': end, 'total': total}
+                    })
+            plan.append({'fog_id': fog_id, 'phase': 'finalize', 'chunk_key': 'finalize', 'params': {}})
+        return plan
+
+    def prepare_fog(self, fog_id, version):
+        """准备阶段：创建该版本的八叉树表，记录该版本覆盖的关键词"""
+        session = self.get_session(fog_id)
+        self.create_staging_tables(session, version)
+        keywords = None
+        if getattr(settings, 'OCTREE_SPARSE_DISTRIBUTION', True):
+            keywords = self.fog_servers[fog_id]['keywords']
+        write_octree_keywords(session, version, keywords)
+        return {}
+
+    def process_chunk(self, fog_id, params, state, version):
+        """
+        写入一个分块，返回写入行数
+        
+        分块范围是规划时的参数列表下标，MySQL中的八叉树在迁移期间发生变化时拒绝写入。
+        """
+        node_params, leaf_order_params = self.load_octree_params(fog_id)
+        rows = node_params if params['table'] == 'nodes' else leaf_order_params
+        if len(rows) != params['total']:
+            raise RuntimeError(f"八叉树源数据在迁移期间发生变化（规划时 {params['total']} 行，当前 {len(rows)} 行）")
+        
+        session = self.get_session(fog_id)
+        node_table, leaf_order_table = octree_table_names(version)
+        if params['table'] == 'nodes':
+            insert_stmt = session.prepare(f"""
+                INSERT INTO {node_table}
+                (node_id, parent_id, level, is_leaf, MC, GC, first_leaf, last_leaf)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """)
+            name = f"Fog{fog_id} OctreeNode[{params['start']}:{params['end']}]"
+        else:
+            # 写入叶子先序序号映射，同一bucket的序号合并为一个批次
+            insert_stmt = session.prepare(f"""
+                INSERT INTO {leaf_order_table} (bucket, leaf_rank, node_id)
+                VALUES (?, ?, ?)
+            """)
+            name = f"Fog{fog_id} OctreeLeafOrder[{params['start']}:{params['end']}]"
+        
+        writer = CassandraBulkWriter(session, insert_stmt, partition_key_indexes=(0,), name=name)
+        writer.add_all(rows[params['start']:params['end']])
+        return writer.close()['rows']
+
+    def finalize_fog(self, fog_id, state, version):
+        """
+        收尾阶段：切换版本指针
+        
+        切换前查询继续读取原版本。切换后保留上一个版本，供切换时仍在执行的查询读完，
+        更早的版本被删除；指针已指向该版本（重复执行收尾）时不再切换。
+        """
+        session = self.get_session(fog_id)
+        previous = read_active_version(session)
+        if previous == version:
+            return
+        activate_version(session, version)
+        self.drop_stale_versions(session, keep=(version, previous))
+
+    def process_octree_nodes(self):
+        """处理OctreeNode表数据"""
+        print("\n处理OctreeNode数据...")
+        
+        plan = self.plan_migration()
+        
+        # 所有雾节点并发写入新版本，总耗时接近最慢的雾节点而不是各雾节点之和
+        version = int(time.time() * 1000)
+        start_time = time.monotonic()
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(len(self.fog_servers), 1)) as executor:
+            futures = {
+                executor.submit(
+                    self._distribute_to_fog, fog_id, version, [c for c in plan if c['fog_id'] == fog_id]
+                ): fog_id
+                for fog_id in self.fog_servers
+            }
+            for future in as_completed(futures):
+                fog_id = futures[future]
+                try:
+                    elapsed = future.result()
+                    print(f"✓ Fog{fog_id} 八叉树版本 {version} 已生效，耗时 {elapsed:.1f} 秒")
+                except Exception as e:
+                    failed.append(fog_id)
+                    print(f"Fog{fog_id}写入失败，继续使用原八叉树: {str(e)}")
+                    traceback.print_exc()
+        
+        print(f"八叉树分发完成，总耗时 {time.monotonic() - start_time:.1f} 秒")
+        if failed:
+            raise RuntimeError(f"雾节点 {sorted(failed)} 八叉树写入失败")
+
+    def _distribute_to_fog(self, fog_id, version, checkpoints):
+        """
+        在当前进程中依次执行单个雾节点的全部迁移阶段
+        
+        写入失败时删除新版本表，原版本不受影响。
+        
+        返回:
+            该雾节点的写入耗时（秒）
+        """
+        start_time = time.monotonic()
+        state = {}
+        for checkpoint in checkpoints:
+            if checkpoint['phase'] == 'prepare':
+                state = self.prepare_fog(fog_id, version)
+            elif checkpoint['phase'] == 'chunk':
+                try:
+                    self.process_chunk(fog_id, checkpoint['params'], state, version)
+                except Exception:
+                    self.drop_octree_version(self.get_session(fog_id), version)
+                    raise
+            else:
+                self.finalize_fog(fog_id, state, version)
+        return time.monotonic() - start_time
+
+    def close(self):
+        """关闭所有雾节点连接"""
+        for session in self.cassandra_sessions.values():
+            if not session.is_shutdown:
+                session.shutdown()
+        self.cassandra_sessions = {}
+
+    def assign_leaf_intervals(self, nodes):
+        """按先序遍历为每个节点分配叶子区间 [first_leaf, last_leaf]
+        
+        叶子按先序遍历顺序编号，任一子树的全部叶子恰好占据一段连续序号，
+        查询时可以据此整段读取被完全覆盖的子树，而无需逐层下探。
+        不含叶子的子树区间为 None。
+        
+        参数:
+            nodes: 处理后的节点字典列表，会原地写入first_leaf和last_leaf
+        
+        返回:
+            按先序序号排列的叶子node_id列表
+        """
+        node_ids = {item['node_id'] for item in nodes}
+        children = {}
+        roots = []
+        for item in nodes:
+            parent_id = item['parent_id']
+            if parent_id is None or parent_id == item['node_id'] or parent_id not in node_ids:
+                roots.append(item)
+            else:
+                children.setdefault(parent_id, []).append(item)
+        
+        # 子节点按node_id排序，保证每次迁移得到的编号一致
+        for child_list in children.values():
+            child_list.sort(key=lambda n: n['node_id'])
+        roots.sort(key=lambda n: n['node_id'])
+        
+        leaf_order = []
+        # 栈元素: (节点, 进入该节点时已编号的叶子数量)，None表示首次访问
+        stack = [(root, None) for root in reversed(roots)]
+        while stack:
+            item, start = stack.pop()
+            child_list = children.get(item['node_id'], [])
+            
+            if start is None:
+                if item['is_leaf'] == 1 or not child_list:
+                    rank = len(leaf_order)
+                    leaf_order.append(item['node_id'])
+                    item['first_leaf'] = rank
+                    item['last_leaf'] = rank
+                    continue
+                # 先压入回溯标记，再逆序压入子节点，使子节点按顺序出栈
+                stack.append((item, len(leaf_order)))
+                for child in reversed(child_list):
+                    stack.append((child, None))
+            else:
+                if len(leaf_order) > start:
+                    item['first_leaf'] = start
+                    item['last_leaf'] = len(leaf_order) - 1
+                else:
+                    item['first_leaf'] = None
+                    item['last_leaf'] = None
+        
+        return leaf_order
 
     def run(self):
         """主运行方法"""
@@ -192,8 +566,7 @@ class OctreeDataDistributor:
             return False, error_msg
         finally:
             # 清理资源
-            for session in self.cassandra_sessions.values():
-                session.shutdown()
+            self.close()
 
     def get_octree_node(self, node_id):
         """获取指定节点的信息"""
@@ -267,43 +640,11 @@ def trigger_octree_migration(request):
         }
     
     返回:
-        迁移任务的状态和结果信息
+        202，迁移任务的ID和状态
     """
-    try:
-        print(f"收到八叉树数据迁移请求: {request.method}")
-        print(f"请求路径: {request.path}")
-        print(f"请求头: {request.headers}")
-        print(f"请求体: {request.data}")
-        
-        # 检查confirm参数，与文档一致
-        confirm = request.data.get('confirm', False)
-        if not confirm:
-            return Response(
-                {"error": "请确认执行迁移操作", "hint": "设置 confirm=true 以确认"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        distributor = OctreeDataDistributor()
-        success, message = distributor.run()
-        
-        response_data = {"status": "success", "message": message} if success else {"status": "error", "message": message}
-        print(f"响应数据: {response_data}")
-        
-        if success:
-            return Response(response_data)
-        else:
-            return Response(
-                response_data,
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-    except Exception as e:
-        error_message = f"处理八叉树数据迁移请求时出错: {str(e)}"
-        print(error_message)
-        traceback.print_exc()
-        return Response(
-            {"status": "error", "message": error_message},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+    # 迁移以可恢复的分块任务在Celery worker中执行
+    from apps.data_management.views import _submit_migration_job
+    return _submit_migration_job(request, 'octree', '八叉树数据迁移')
 
 # 添加一个简单的测试API端点
 @api_view(['GET', 'POST'])
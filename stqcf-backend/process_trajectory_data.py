@@ -3,6 +3,7 @@ import sys
 import django
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
+from cassandra.policies import TokenAwarePolicy, DCAwareRoundRobinPolicy
 from cassandra.concurrent import execute_concurrent_with_args
 from phe import paillier
 import pickle
@@ -25,12 +26,30 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gko_project.settings.development')
 django.setup()
 
+from apps.sstp.presence import NodePresenceBitmap
+from apps.sstp.security import generate_traj_tag, get_traj_tag_secret_key
+from apps.sstp.packing import SlotPacker
+from apps.sstp.leaf_summary import LEAF_SUMMARY_EPOCH_NAME
+from apps.sstp.octree_version import read_active_version, read_octree_keywords
+from apps.data_processing.bulk_writer import CassandraBulkWriter
+from apps.data_processing.trajectory_source import get_trajectory_source
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
 class TrajectoryDataDistributor:
     def __init__(self):
         self.fog_servers = {}  # 将在get_keyword_mapping中初始化
         self.cassandra_sessions = {}
         self.batch_size = 1000  # 批处理大小
         self.max_workers = 4    # 并行处理的工作线程数
+        self.parent_map = {}    # 八叉树节点父子关系，用于构建存在位图
+        self.keyword_mapping = {}  # 关键词 -> 雾服务器信息
+        # 轨迹数据来源：MySQL的trajectorydate表或其Parquet快照
+        self.source = get_trajectory_source()
+        # 打包编码时纬度、经度、时间额外合并为一个密文（packed_point列）
+        self.packer = SlotPacker() if getattr(settings, 'TRAJECTORY_PACKED_ENCODING', False) else None
+        if self.packer is not None:
+            print("注意: 已开启打包编码，逐字段密文照常写入，每个轨迹点额外加密并存储一个packed_point密文")
         
         # 初始化加密
         self.public_key, self.private_key = self.load_or_generate_keys()
@@ -118,7 +137,8 @@ class TrajectoryDataDistributor:
                     control_connection_timeout=30,
                     idle_heartbeat_interval=30,  # 心跳间隔
                     compression=True,           # 启用压缩
-                    load_balancing_policy=None  # 禁用负载均衡
+                    # 按分区令牌把批次直接发往副本节点
+                    load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy())
                 )
                 
                 # 尝试建立连接
@@ -141,14 +161,60 @@ class TrajectoryDataDistributor:
                         keyword INT,
                         node_id INT,
                         traj_id BLOB,
+                        traj_tag BLOB,
                         t_date BLOB,
+                        date_code INT,
                         latitude BLOB,
                         longitude BLOB,
                         time BLOB,
+                        packed_point BLOB,
                         PRIMARY KEY ((keyword, node_id), traj_id)
                     )
                 """)
                 
+                # 旧表补充轨迹ID确定性标签列、日期字典编码列和打包轨迹点列
+                for column in ("traj_tag BLOB", "date_code INT", "packed_point BLOB"):
+                    try:
+                        session.execute(f"ALTER TABLE TrajectoryDate ADD {column}")
+                    except Exception:
+                        pass  # 列已存在
+                
+                # 创建叶子摘要表，每个 (叶子, 轨迹, 日期) 一行，SSTP从中读取候选轨迹
+                session.execute("""
+                    CREATE TABLE IF NOT EXISTS LeafTrajectorySummary (
+                        keyword INT,
+                        node_id INT,
+                        traj_tag BLOB,
+                        date_code INT,
+                        traj_id BLOB,
+                        PRIMARY KEY ((keyword, node_id), traj_tag, date_code)
+                    )
+                """)
+                
+                # 创建加密日期字典表，TrajectoryDate行通过date_code引用
+                session.execute("""
+                    CREATE TABLE IF NOT EXISTS DateDictionary (
+                        date_code INT PRIMARY KEY,
+                        t_date BLOB
+                    )
+                """)
+                
+                # 创建关键词节点存在位图表
+                session.execute("""
+                    CREATE TABLE IF NOT EXISTS KeywordNodePresence (
+                        keyword INT PRIMARY KEY,
+                        node_bitmap BLOB
+                    )
+                """)
+                
+                # 创建摄取版本号表，雾服务器据此使叶子分区缓存失效
+                session.execute("""
+                    CREATE TABLE IF NOT EXISTS IngestionEpoch (
+                        name TEXT PRIMARY KEY,
+                        epoch BIGINT
+                    )
+                """)
+                
                 # 验证连接是否真正建立
                 session.execute("SELECT now() FROM system.local")
                 
@@ -202,114 +268,319 @@ class TrajectoryDataDistributor:
         try:
             print("清空TrajectoryDate表...")
             session.execute("TRUNCATE TrajectoryDate")
+            session.execute("TRUNCATE LeafTrajectorySummary")
+            session.execute("TRUNCATE KeywordNodePresence")
+            session.execute("TRUNCATE DateDictionary")
+            self.bump_ingestion_epoch(session)
             print("✓ TrajectoryDate表已清空")
         except Exception as e:
             print(f"清空表失败: {str(e)}")
             traceback.print_exc()
+            raise
 
-    def process_trajectory_dates(self):
-        """处理TrajectoryDate表数据"""
-        print("\n处理TrajectoryDate数据...")
+    def bump_ingestion_epoch(self, session):
+        """更新摄取版本号，使雾服务器上的叶子分区缓存失效；返回新的版本号"""
+        epoch = int(time.time() * 1000)
+        session.execute(
+            "INSERT INTO IngestionEpoch (name, epoch) VALUES ('trajectory', %s)",
+            (epoch,)
+        )
+        return epoch
+
+    def load_parent_map(self):
+        """从MySQL读取八叉树父子关系，用于把叶子的存在标记传播到祖先节点"""
+        parent_map = {}
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT node_id, parent_id FROM octreenode")
+                for node_id, parent_id in cursor.fetchall():
+                    if parent_id is None:
+                        continue
+                    parent_map[int(node_id)] = int(parent_id)
+        except Exception as e:
+            print(f"加载八叉树父子关系失败: {str(e)}")
+            traceback.print_exc()
+        return parent_map
+
+    def write_keyword_presence(self, session, fog_id, encrypted_items, keywords):
+        """
+        为雾节点上的每个关键词写入节点存在位图
         
-        # 获取关键词映射
-        keyword_mapping = self.get_keyword_mapping()
+        参数:
+        session: 雾节点Cassandra会话
+        fog_id: 雾节点ID
+        encrypted_items: 已写入TrajectoryDate的数据（keyword和node_id为明文）
+        keywords: 分配给该雾节点的全部关键词，没有数据的关键词写入空位图
+        """
+        keyword_nodes = {keyword: set() for keyword in keywords}
+        for item in encrypted_items:
+            keyword_nodes.setdefault(item['keyword'], set()).add(item['node_id'])
         
-        # 清空所有雾节点的表
-        for fog_id, fog_info in self.fog_servers.items():
-            try:
-                session = self.connect_cassandra(fog_info)
-                self.clear_trajectory_table(session)
-                session.shutdown()
-            except Exception as e:
-                print(f"清空Fog{fog_id}表失败: {str(e)}")
-                traceback.print_exc()
-                
-        # 从MySQL读取数据
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT keyword, node_id, traj_id, t_date,
-                       latitude, longitude, time
-                FROM trajectorydate
-            """)
-            columns = [col[0] for col in cursor.description]
-            raw_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        insert_stmt = session.prepare(
+            "INSERT INTO KeywordNodePresence (keyword, node_bitmap) VALUES (?, ?)"
+        )
+        params = []
+        for keyword, node_ids in keyword_nodes.items():
+            bitmap = NodePresenceBitmap.from_node_ids(node_ids, self.parent_map)
+            params.append((keyword, bitmap.to_bytes()))
+        
+        execute_concurrent_with_args(session, insert_stmt, params, concurrency=self.max_workers)
+        print(f"✓ Fog{fog_id} 写入{len(params)}个关键词存在位图")
+
+    def get_session(self, fog_id):
+        """获取雾节点的Cassandra会话，同一分发器上的各阶段复用连接"""
+        if not self.fog_servers:
+            self.keyword_mapping = self.get_keyword_mapping()
+        session = self.cassandra_sessions.get(fog_id)
+        if session is None or session.is_shutdown:
+            session = self.connect_cassandra(self.fog_servers[fog_id])
+        return session
+
+    def fog_keywords(self, fog_id):
+        """分配给雾节点的全部关键词"""
+        if not self.keyword_mapping:
+            self.keyword_mapping = self.get_keyword_mapping()
+        return [k for k, f in self.keyword_mapping.items() if f['id'] == fog_id]
+
+    def check_octree_keywords(self, fog_id):
+        """
+        确认雾节点当前生效的八叉树覆盖分配给它的全部关键词
         
-        # 按关键词分组
-        grouped_data = {}
-        for item in raw_data:
-            if item['keyword'] is None:
+        稀疏分发的八叉树只含构建时该雾节点关键词的数据节点，关键词重新分配后
+        新关键词的叶子不在八叉树中，查询无法到达这些数据，必须先重新迁移八叉树。
+        """
+        session = self.get_session(fog_id)
+        covered = read_octree_keywords(session, read_active_version(session))
+        if covered is None:
+            return
+        missing = set(self.fog_keywords(fog_id)) - covered
+        if missing:
+            raise RuntimeError(
+                f"Fog{fog_id} 当前八叉树不包含关键词 {sorted(missing)} 的节点，请先重新迁移八叉树"
+            )
+
+    def plan_migration(self):
+        """
+        规划分块迁移
+        
+        每个雾节点依次为准备（清空表、写入日期字典）、若干数据分块、收尾（写入存在位图、更新摄取版本号）。
+        分块按关键词划分，每个分块包含若干完整的Cassandra分区 (keyword, node_id)，
+        约MIGRATION_CHUNK_ROWS行；分块写入前先删除自己的分区，重复执行不会产生重复行。
+        
+        返回:
+            检查点列表 [{'fog_id', 'phase', 'chunk_key', 'params'}]
+        """
+        # 缺少标签密钥时每一行都会加密失败，在清空任何雾节点数据之前让任务失败
+        get_traj_tag_secret_key()
+        self.keyword_mapping = self.get_keyword_mapping()
+        for fog_id in self.fog_servers:
+            self.check_octree_keywords(fog_id)
+        chunk_rows = getattr(settings, 'MIGRATION_CHUNK_ROWS', 2000)
+        
+        partition_counts = self.source.partition_counts()
+        
+        # {fog_id: {keyword: {node_id: [行数, [MySQL中的keyword值], [MySQL中的node_id值]]}}}
+        partitions = {}
+        for raw_keyword, raw_node_id, count in partition_counts:
+            if raw_keyword is None:
                 continue
+            keyword = int(raw_keyword)
+            fog_info = self.keyword_mapping.get(keyword)
+            if fog_info is None:
+                continue
+            try:
+                node_id = self.process_node_id(str(raw_node_id))
+            except ValueError as e:
+                print(f"跳过无效的node_id: {str(e)}")
+                continue
+            entry = partitions.setdefault(fog_info['id'], {}).setdefault(keyword, {}).setdefault(node_id, [0, set(), set()])
+            entry[0] += count
+            entry[1].add(raw_keyword)
+            entry[2].add(raw_node_id)
+        
+        plan = []
+        for fog_id in self.fog_servers:
+            plan.append({'fog_id': fog_id, 'phase': 'prepare', 'chunk_key': 'prepare', 'params': {}})
+            for keyword, nodes in sorted(partitions.get(fog_id, {}).items()):
+                chunks = [[]]
+                size = 0
+                for node_id, (count, raw_keywords, raw_node_ids) in sorted(nodes.items()):
+                    if chunks[-1] and size + count > chunk_rows:
+                        chunks.append([])
+                        size = 0
+                    chunks[-1].append([node_id, sorted(raw_keywords, key=str), sorted(raw_node_ids, key=str)])
+                    size += count
+                for part, chunk in enumerate(chunks):
+                    plan.append({
+                        'fog_id': fog_id,
+                        'phase': 'chunk',
+                        'chunk_key': f'keyword:{keyword}:part:{part}',
+                        'params': {'keyword': keyword, 'partitions': chunk}
+                    })
+            plan.append({'fog_id': fog_id, 'phase': 'finalize', 'chunk_key': 'finalize', 'params': {}})
+        return plan
+
+    def prepare_fog(self, fog_id, version=None):
+        """
+        准备阶段：清空雾节点上的轨迹表，写入日期字典
+        
+        返回:
+            {'date_codes': {日期: date_code}}，供各分块使用
+        """
+        get_traj_tag_secret_key()
+        # 恢复执行时八叉树可能已被重新迁移或关键词已重新分配，清空前再次确认
+        self.check_octree_keywords(fog_id)
+        keywords = set(self.fog_keywords(fog_id))
+        session = self.get_session(fog_id)
+        self.clear_trajectory_table(session)
+        
+        dates = [t_date for keyword, t_date in self.source.keyword_dates()
+                 if keyword is not None and int(keyword) in keywords]
+        
+        # 每个不同的日期只加密一次，写入日期字典
+        return {'date_codes': self.write_date_dictionary(session, fog_id, dates)}
+
+    def process_chunk(self, fog_id, params, state, version=None):
+        """
+        加密并写入一个分块，返回写入行数
+        
+        traj_id等字段是随机化的Paillier密文，重复加密得到不同的聚簇键，
+        因此先删除分块覆盖的分区再写入，分块可以安全地重复执行。
+        """
+        raw_keywords = sorted({k for _, keywords, _ in params['partitions'] for k in keywords}, key=str)
+        raw_node_ids = [n for _, _, node_ids in params['partitions'] for n in node_ids]
+        items = self.source.partition_rows(raw_keywords, raw_node_ids)
+        
+        # 并行加密数据
+        encrypted_items = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = []
+            for i in range(0, len(items), self.batch_size):
+                batch = items[i:i + self.batch_size]
+                futures.append(executor.submit(self.encrypt_trajectory_batch, batch, state['date_codes']))
             
-            keyword_int = int(item['keyword'])
-            if keyword_int in keyword_mapping:
-                fog_info = keyword_mapping[keyword_int]
-                fog_id = fog_info['id']
-                if fog_id not in grouped_data:
-                    grouped_data[fog_id] = {'info': fog_info, 'items': []}
-                grouped_data[fog_id]['items'].append(item)
+            for future in as_completed(futures):
+                encrypted_items.extend(future.result())
+        
+        session = self.get_session(fog_id)
+        partition_keys = [(params['keyword'], node_id) for node_id, _, _ in params['partitions']]
+        for table in ('TrajectoryDate', 'LeafTrajectorySummary'):
+            delete_stmt = session.prepare(f"DELETE FROM {table} WHERE keyword = ? AND node_id = ?")
+            execute_concurrent_with_args(
+                session, delete_stmt, partition_keys,
+                concurrency=self.max_workers, raise_on_first_error=True
+            )
+        
+        insert_stmt = session.prepare("""
+            INSERT INTO TrajectoryDate 
+            (keyword, node_id, traj_id, traj_tag, date_code, latitude, longitude, time, packed_point)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """)
+        # 按 (keyword, node_id) 分区合并为UNLOGGED批次写入
+        writer = CassandraBulkWriter(session, insert_stmt, partition_key_indexes=(0, 1),
+                                     name=f"Fog{fog_id} TrajectoryDate keyword={params['keyword']}")
+        for item in encrypted_items:
+            writer.add((
+                item['keyword'],
+                item['node_id'],
+                item['traj_id'],
+                item['traj_tag'],
+                item['date_code'],
+                item['latitude'],
+                item['longitude'],
+                item['time'],
+                item['packed_point']
+            ))
+        rows_written = writer.close()['rows']
+        
+        self.write_leaf_summary(session, fog_id, params['keyword'], encrypted_items)
+        return rows_written
+
+    def write_leaf_summary(self, session, fog_id, keyword, encrypted_items):
+        """
+        写入叶子摘要表
+        
+        同一叶子中同一轨迹同一天的多个轨迹点只保留一行（任取一个traj_id密文），
+        客户端按traj_tag识别轨迹，结果与逐点读取一致。
+        """
+        summary = {}
+        for item in encrypted_items:
+            if item.get('traj_tag') is None or item.get('date_code') is None:
+                continue
+            summary.setdefault((item['keyword'], item['node_id'], item['traj_tag'], item['date_code']), item['traj_id'])
+        
+        insert_stmt = session.prepare("""
+            INSERT INTO LeafTrajectorySummary (keyword, node_id, traj_tag, date_code, traj_id)
+            VALUES (?, ?, ?, ?, ?)
+        """)
+        writer = CassandraBulkWriter(session, insert_stmt, partition_key_indexes=(0, 1),
+                                     name=f"Fog{fog_id} LeafTrajectorySummary keyword={keyword}")
+        writer.add_all(key + (traj_id,) for key, traj_id in summary.items())
+        writer.close()
+
+    def finalize_fog(self, fog_id, state, version=None):
+        """收尾阶段：写入关键词节点存在位图，再次更新摄取版本号，丢弃写入期间缓存的分区"""
+        keywords = set(self.fog_keywords(fog_id))
+        if not self.parent_map:
+            self.parent_map = self.load_parent_map()
+        
+        items = []
+        for keyword, node_id in self.source.keyword_nodes():
+            if keyword is None or int(keyword) not in keywords:
+                continue
+            try:
+                items.append({'keyword': int(keyword), 'node_id': self.process_node_id(str(node_id))})
+            except ValueError:
+                continue
+        
+        session = self.get_session(fog_id)
+        self.write_keyword_presence(session, fog_id, items, sorted(keywords))
+        epoch = self.bump_ingestion_epoch(session)
+        # 摘要表与TrajectoryDate同步写完，标记为当前版本后SSTP开始读取摘要表
+        session.execute(
+            "INSERT INTO IngestionEpoch (name, epoch) VALUES (%s, %s)",
+            (LEAF_SUMMARY_EPOCH_NAME, epoch)
+        )
+        print(f"✓ Fog{fog_id} TrajectoryDate数据写入完成")
+
+    def process_trajectory_dates(self):
+        """处理TrajectoryDate表数据"""
+        print("\n处理TrajectoryDate数据...")
+        
+        plan = self.plan_migration()
+        self.parent_map = self.load_parent_map()
         
         # 并行处理每个雾节点的数据
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             futures = []
-            for fog_id, data in grouped_data.items():
-                futures.append(executor.submit(self._process_fog_trajectory_data, fog_id, data))
+            for fog_id in self.fog_servers:
+                checkpoints = [c for c in plan if c['fog_id'] == fog_id]
+                futures.append(executor.submit(self._process_fog_trajectory_data, fog_id, checkpoints))
             
             for future in tqdm(as_completed(futures), total=len(futures), desc="处理雾节点数据"):
                 future.result()
 
-    def _process_fog_trajectory_data(self, fog_id, data):
-        """处理单个雾节点的轨迹数据"""
-        session = None
+    def _process_fog_trajectory_data(self, fog_id, checkpoints):
+        """在当前进程中依次执行单个雾节点的全部迁移阶段"""
         try:
-            session = self.connect_cassandra(data['info'])
-            insert_stmt = session.prepare("""
-                INSERT INTO TrajectoryDate 
-                (keyword, node_id, traj_id, t_date, latitude, longitude, time)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """)
-            
-            # 并行加密数据
-            encrypted_items = []
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = []
-                for i in range(0, len(data['items']), self.batch_size):
-                    batch = data['items'][i:i + self.batch_size]
-                    futures.append(executor.submit(self.encrypt_trajectory_batch, batch))
-                
-                for future in as_completed(futures):
-                    encrypted_items.extend(future.result())
-            
-            # 准备批量写入的数据
-            statements_and_params = []
-            for item in encrypted_items:
-                params = (
-                    item['keyword'],
-                    item['node_id'],
-                    item['traj_id'],
-                    item['t_date'],
-                    item['latitude'],
-                    item['longitude'],
-                    item['time']
-                )
-                statements_and_params.append((insert_stmt, params))
-            
-            # 批量写入数据
-            for i in tqdm(range(0, len(statements_and_params), self.batch_size),
-                        desc=f"写入Fog{fog_id}数据"):
-                batch = statements_and_params[i:i + self.batch_size]
-                execute_concurrent_with_args(
-                    session, insert_stmt,
-                    [(params) for _, params in batch],
-                    concurrency=self.max_workers
-                )
-            
-            print(f"✓ Fog{fog_id} TrajectoryDate数据写入完成")
+            state = {}
+            for checkpoint in checkpoints:
+                if checkpoint['phase'] == 'prepare':
+                    state = self.prepare_fog(fog_id)
+                elif checkpoint['phase'] == 'chunk':
+                    self.process_chunk(fog_id, checkpoint['params'], state)
+                else:
+                    self.finalize_fog(fog_id, state)
         except Exception as e:
             print(f"Fog{fog_id}写入失败: {str(e)}")
             traceback.print_exc()
-        finally:
-            if session:
+
+    def close(self):
+        """关闭所有雾节点连接"""
+        for session in self.cassandra_sessions.values():
+            if not session.is_shutdown:
                 session.shutdown()
+        self.cassandra_sessions = {}
 
     def process_node_id(self, node_id_str):
         """处理node_id，将"x,y"格式转换为整数
@@ -332,8 +603,30 @@ class TrajectoryDataDistributor:
         except Exception as e:
             raise ValueError(f"处理node_id失败: {str(e)}, 原始值: {node_id_str}")
 
-    def encrypt_trajectory_batch(self, items):
-        """批量加密轨迹数据"""
+    def write_date_dictionary(self, session, fog_id, t_dates):
+        """
+        为雾节点生成加密日期字典
+        
+        日期基数很低（按天），每个不同的日期只加密一次并写入DateDictionary表，
+        返回 {日期: date_code}，数据行只保存整数编码。
+        """
+        dates = {}
+        for t_date in t_dates:
+            dates.setdefault(str(t_date), t_date)
+        
+        date_codes = {}
+        params = []
+        for code, key in enumerate(sorted(dates)):
+            date_codes[key] = code
+            params.append((code, pickle.dumps(self.encrypt_field(dates[key]))))
+        
+        insert_stmt = session.prepare("INSERT INTO DateDictionary (date_code, t_date) VALUES (?, ?)")
+        execute_concurrent_with_args(session, insert_stmt, params, concurrency=self.max_workers)
+        print(f"✓ Fog{fog_id} 写入{len(params)}个日期字典项")
+        return date_codes
+
+    def encrypt_trajectory_batch(self, items, date_codes=None):
+        """批量加密轨迹数据，提供date_codes时日期以字典编码保存"""
         encrypted_items = []
         for item in items:
             try:
@@ -344,22 +637,37 @@ class TrajectoryDataDistributor:
                 
                 # 其他字段需要加密并序列化为BLOB
                 traj_id_enc = self.encrypt_field(item['traj_id'])
-                t_date_enc = self.encrypt_field(item['t_date'])  # 使用与traj_id相同的加密方法
-                latitude_enc = self.encrypt_float_field(item['latitude'])
-                longitude_enc = self.encrypt_float_field(item['longitude'])
-                time_enc = self.encrypt_field(item['time'])
+                if date_codes is None:
+                    t_date_enc = self.encrypt_field(item['t_date'])  # 使用与traj_id相同的加密方法
                 
                 # 移除调试日志，因为现在处理方式已统一
                 encrypted_item = {
                     'keyword': keyword,
                     'node_id': node_id,
                     'traj_id': pickle.dumps(traj_id_enc),
-                    't_date': pickle.dumps(t_date_enc),
-                    'latitude': pickle.dumps(latitude_enc),
-                    'longitude': pickle.dumps(longitude_enc),
-                    'time': pickle.dumps(time_enc)
+                    'traj_tag': generate_traj_tag(item['traj_id']),
+                    # 遍历算法和逐字段比较的SSTP路径只读取这三列，打包编码时也照常写入
+                    'latitude': pickle.dumps(self.encrypt_float_field(item['latitude'])),
+                    'longitude': pickle.dumps(self.encrypt_float_field(item['longitude'])),
+                    'time': pickle.dumps(self.encrypt_field(item['time'])),
+                    'packed_point': None
                 }
+                if self.packer is not None:
+                    # 三个字段另外打包为一个明文，支持打包比较的查询路径每个点只需一次比较
+                    packed_enc = self.packer.encrypt(self.public_key, [
+                        int(float(item['latitude']) * 1000000),
+                        int(float(item['longitude']) * 1000000),
+                        int(str(item['time']).strip())
+                    ])
+                    encrypted_item['packed_point'] = pickle.dumps(packed_enc)
+                if date_codes is None:
+                    encrypted_item['t_date'] = pickle.dumps(t_date_enc)
+                else:
+                    encrypted_item['date_code'] = date_codes[str(item['t_date'])]
                 encrypted_items.append(encrypted_item)
+            except ImproperlyConfigured:
+                # 配置错误对每一行都成立，不能当作单行数据错误跳过
+                raise
             except Exception as e:
                 print(f"处理数据项时出错: {str(e)}")
                 traceback.print_exc()
@@ -429,8 +737,7 @@ class TrajectoryDataDistributor:
             return False, error_msg
         finally:
             # 清理资源
-            for session in self.cassandra_sessions.values():
-                session.shutdown()
+            self.close()
 
 # API接口
 @api_view(['GET'])
@@ -465,26 +772,11 @@ def trigger_trajectory_migration(request):
         }
     
     返回:
-        迁移任务的状态和结果信息
+        202，迁移任务的ID和状态
     """
-    confirm = request.data.get('confirm', False)
-    
-    if not confirm:
-        return Response(
-            {"error": "请确认执行迁移操作", "hint": "设置 confirm=true 以确认"},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    distributor = TrajectoryDataDistributor()
-    success, message = distributor.run()
-    
-    if success:
-        return Response({"status": "success", "message": message})
-    else:
-        return Response(
-            {"status": "error", "message": message},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+    # 迁移以可恢复的分块任务在Celery worker中执行
+    from apps.data_management.views import _submit_migration_job
+    return _submit_migration_job(request, 'trajectory', '轨迹数据迁移')
 
 if __name__ == '__main__':
     print("=== 轨迹数据迁移工具 ===")
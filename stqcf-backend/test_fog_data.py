@@ -47,6 +47,9 @@ def create_test_data():
         
         # 批量创建fog_servers
         FogServer.objects.bulk_create(fog_servers)
+        # bulk_create不调用save()，需要单独同步关键词索引fog_keyword
+        for fog_server in FogServer.objects.all():
+            fog_server.sync_keyword_index()
         print("fog_servers数据创建完成！")
         
         # 创建octreenode数据